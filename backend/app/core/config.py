@@ -1,4 +1,5 @@
 from pathlib import Path
+from typing import List
 from pydantic_settings import BaseSettings
 
 
@@ -15,10 +16,131 @@ class Settings(BaseSettings):
 
     # RAG Configuration
     GEMINI_API_KEY: str = ""
+    # Additional keys; requests are spread over all of them
+    GEMINI_API_KEYS: List[str] = []
+    # File with one key per line, re-read when it changes
+    GEMINI_API_KEYS_FILE: str = ""
+    GEMINI_KEY_COOLDOWN_SECONDS: int = 60
+    GEMINI_KEY_MAX_COOLDOWN_SECONDS: int = 15 * 60
     FAISS_INDEX_PATH: str = "./faiss_indexes"
     CHUNK_SIZE: int = 1000
     MAX_CONTEXT_LENGTH: int = 3000
     SIMILARITY_THRESHOLD: float = 0.7
+    # Memory-map read-only FAISS indexes so worker processes share the page cache
+    FAISS_MMAP: bool = False
+    # Full embedding size, and the truncated Matryoshka size used for the
+    # coarse search stage (0 searches with full vectors)
+    EMBEDDING_MODEL: str = "models/text-embedding-004"
+    EMBEDDING_DIMENSION: int = 768
+    FAISS_SEARCH_DIMENSION: int = 0
+    # Vector storage: "none" (float32), "fp16", "sq8" or "pq"
+    FAISS_QUANTIZATION: str = "none"
+    FAISS_PQ_SUBQUANTIZERS: int = 96
+    # Re-score quantized or truncated candidates exactly from a float16 side store
+    FAISS_RERANK_EXACT: bool = False
+    FAISS_RERANK_FACTOR: int = 4
+
+    # Batch question answering
+    RAG_BATCH_MAX_QUESTIONS: int = 50
+    RAG_BATCH_CONCURRENCY: int = 4
+
+    # Users whose whole corpus fits this many tokens skip retrieval and send
+    # all of it as context (0 disables)
+    RAG_LONG_CONTEXT_MAX_TOKENS: int = 8000
+
+    # Extractive answers: return the best matching sentence without an LLM
+    # call when retrieval is very confident, or when the LLM is unavailable
+    RAG_EXTRACTIVE_ANSWERS: bool = True
+    RAG_EXTRACTIVE_SIMILARITY_THRESHOLD: float = 0.85
+    RAG_EXTRACTIVE_MIN_COVERAGE: float = 0.75
+    RAG_EXTRACTIVE_FALLBACK_MIN_COVERAGE: float = 0.5
+
+    # Micro-batching of concurrent chat queries (window 0 disables it)
+    RAG_MICROBATCH_WINDOW_MS: int = 5
+    RAG_MICROBATCH_MAX_SIZE: int = 64
+    RAG_MICROBATCH_WORKERS: int = 4
+
+    # Precomputed answers for common questions, refreshed after ingestion
+    RAG_PRECOMPUTE_ANSWERS: bool = False
+    RAG_CANONICAL_QUESTIONS: List[str] = [
+        "What is my name?",
+        "Who are my children?",
+        "Who is my wife?",
+        "Where do I live?",
+        "What medication do I take?",
+        "Who is my doctor?",
+        "What did I do for work?",
+        "When is my birthday?",
+    ]
+    RAG_PRECOMPUTED_MATCH_THRESHOLD: float = 0.9
+
+    # Index rebuilds from stored chunks
+    INDEX_REBUILD_BATCH_SIZE: int = 100
+    INDEX_REBUILD_WORKERS: int = 4
+
+    # Background retries for chunks whose embedding failed
+    EMBEDDING_RETRY_WORKER: bool = True
+    EMBEDDING_RETRY_INTERVAL_SECONDS: int = 30
+    EMBEDDING_RETRY_BASE_SECONDS: int = 60
+    EMBEDDING_RETRY_MAX_DELAY_SECONDS: int = 6 * 60 * 60
+    EMBEDDING_RETRY_MAX_ATTEMPTS: int = 10
+
+    # Shared demo knowledge base, built once and cloned for each user
+    DEMO_CORPUS_PREBUILD: bool = True
+
+    # Face detection and encoding worker processes (0 encodes in a thread)
+    FACE_ENCODING_WORKERS: int = 2
+    FACE_ENCODING_MAX_PENDING: int = 32
+    FACE_ENCODING_QUEUE_TIMEOUT_SECONDS: float = 30
+
+    # Faces are detected on a copy downsampled to this many pixels on its
+    # longest side ("hog" on CPU, "cnn" is more accurate but needs a GPU),
+    # then encoded from a crop with the face scaled down to FACE_ENCODING_FACE_SIZE
+    FACE_DETECTION_MAX_DIMENSION: int = 1024
+    FACE_DETECTION_MODEL: str = "hog"
+    FACE_DETECTION_UPSAMPLE: int = 1
+    FACE_ENCODING_FACE_SIZE: int = 200
+    FACE_ENCODING_JITTERS: int = 1
+
+    # Largest accepted upload of a single photo or voice note, in bytes
+    MAX_PHOTO_UPLOAD_BYTES: int = 25 * 1024 * 1024
+    MAX_AUDIO_UPLOAD_BYTES: int = 50 * 1024 * 1024
+
+    # Memory photo display variants, stored as WebP beside the original:
+    # longest side in pixels, and encoding quality
+    PHOTO_THUMBNAIL_SIZE: int = 320
+    PHOTO_MEDIUM_SIZE: int = 1280
+    PHOTO_VARIANT_QUALITY: int = 80
+
+    # Bulk photo imports: photos per import, and photos encoded and
+    # committed together
+    PHOTO_IMPORT_MAX_FILES: int = 2000
+    PHOTO_IMPORT_BATCH_SIZE: int = 32
+    # Total photo bytes per import, and the largest compression ratio
+    # accepted for a photo inside a zip archive
+    PHOTO_IMPORT_MAX_BYTES: int = 2 * 1024 * 1024 * 1024
+    PHOTO_IMPORT_MAX_COMPRESSION_RATIO: int = 100
+
+    # FAISS index over face encodings for very large photo libraries;
+    # otherwise encodings are scanned from an in-memory matrix
+    FACE_INDEX_ENABLED: bool = False
+    # Face index changes are saved to disk once this many faces changed, or
+    # this many seconds after the first unsaved change
+    FACE_INDEX_SAVE_MAX_PENDING: int = 256
+    FACE_INDEX_SAVE_INTERVAL_SECONDS: float = 30
+
+    # New faces join the person whose centroid is within this distance,
+    # otherwise they start a new person
+    PERSON_CLUSTER_THRESHOLD: float = 0.5
+
+    # Photo searches are reused for this long when a new query photo's
+    # perceptual hash differs from an earlier one's by at most this many
+    # of its 64 bits (0 seconds turns the cache off)
+    SEARCH_CACHE_TTL_SECONDS: int = 60
+    SEARCH_CACHE_MAX_HASH_DISTANCE: int = 5
+
+    # Usernames allowed to call admin endpoints
+    ADMIN_USERNAMES: List[str] = []
 
     class Config:
         env_file = ".env"
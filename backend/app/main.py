@@ -11,6 +11,8 @@ load_dotenv()
 from .db import database
 from .models import models
 from .routers import auth, rag, memories, reminders, locations, medications, emergency, voice_notes, search, family
+from .services import demo_service, embedding_retry_service, face_encoding_pool, photo_import_service
+from .services.face_index_service import face_index
 
 models.Base.metadata.create_all(bind=database.engine)
 
@@ -46,6 +48,31 @@ app.include_router(search.router)
 app.include_router(family.router)
 
 
+@app.on_event("startup")
+def start_background_workers():
+    """
+    Start the retry queue for chunks whose embeddings failed during ingestion,
+    build the shared demo knowledge base if it is missing, start the face
+    encoding processes, and fail photo imports a previous run left unfinished.
+    """
+    db = database.SessionLocal()
+    try:
+        photo_import_service.fail_interrupted_jobs(memories.UPLOAD_ROOT, db)
+    finally:
+        db.close()
+    embedding_retry_service.start_retry_worker(
+        rag.rag_service.vector_service, on_indexed=rag.rag_service.corpus_changed
+    )
+    demo_service.start_demo_corpus_build(rag.rag_service.vector_service)
+    face_encoding_pool.start()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    face_encoding_pool.shutdown()
+    face_index.flush()
+
+
 @app.get("/")
 def read_root():
     """
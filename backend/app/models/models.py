@@ -12,7 +12,7 @@ from sqlalchemy import (
     LargeBinary,
     func,
 )
-from sqlalchemy.orm import relationship
+from sqlalchemy.orm import deferred, relationship
 
 from app.db.database import Base
 
@@ -28,6 +28,7 @@ class User(Base):
 
     documents = relationship("Document", back_populates="user", cascade="all, delete-orphan")
     messages = relationship("ChatMessage", back_populates="user", cascade="all, delete-orphan")
+    precomputed_answers = relationship("PrecomputedAnswer", back_populates="user", cascade="all, delete-orphan")
     memory_photos = relationship("MemoryPhoto", back_populates="user", cascade="all, delete-orphan")
     reminders = relationship("Reminder", back_populates="user", cascade="all, delete-orphan")
     memory_places = relationship("MemoryPlace", back_populates="user", cascade="all, delete-orphan")
@@ -85,13 +86,39 @@ class Document(Base):
     __tablename__ = "documents"
 
     id = Column(Integer, primary_key=True, index=True)
-    user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     filename = Column(String(255), nullable=False)
-    content = Column(Text)
-    document_metadata = Column(JSON)
+    # Legacy full-text and per-chunk metadata blobs; chunks now live in document_chunks
+    content = deferred(Column(Text))
+    document_metadata = deferred(Column(JSON))
+    chunk_count = Column(Integer, nullable=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
 
     user = relationship("User", back_populates="documents")
+    chunks = relationship(
+        "DocumentChunkRecord",
+        back_populates="document",
+        cascade="all, delete-orphan",
+        order_by="DocumentChunkRecord.ordinal",
+    )
+
+
+class DocumentChunkRecord(Base):
+    __tablename__ = "document_chunks"
+
+    id = Column(Integer, primary_key=True, index=True)
+    document_id = Column(Integer, ForeignKey("documents.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    ordinal = Column(Integer, nullable=False)
+    content = deferred(Column(Text, nullable=False))
+    chunk_metadata = deferred(Column(JSON, nullable=True))
+    embedding_status = Column(String(20), default="pending", nullable=False, index=True)  # pending, indexed, failed
+    index_id = Column(Integer, nullable=True)  # Row in the user's FAISS index
+    embedding_attempts = Column(Integer, default=0, nullable=False)
+    next_embedding_attempt_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    document = relationship("Document", back_populates="chunks")
 
 
 class ChatMessage(Base):
@@ -107,6 +134,20 @@ class ChatMessage(Base):
     user = relationship("User", back_populates="messages")
 
 
+class PrecomputedAnswer(Base):
+    __tablename__ = "precomputed_answers"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    question = Column(Text, nullable=False)
+    question_embedding = Column(LargeBinary, nullable=False)  # Normalized float32 query embedding
+    response = Column(Text, nullable=False)
+    confidence_score = Column(Float)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    user = relationship("User", back_populates="precomputed_answers")
+
+
 class MemoryPhoto(Base):
     __tablename__ = "memory_photos"
 
@@ -114,10 +155,63 @@ class MemoryPhoto(Base):
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
     image_path = Column(String(500), nullable=False)
     description = Column(Text, nullable=True)
-    face_encoding = Column(LargeBinary, nullable=True)
+    content_hash = Column(String(64), nullable=True, index=True)  # SHA-256 of the uploaded file
+    file_size = Column(Integer, nullable=True)  # In bytes
+    # Legacy float64 encoding of the first face; faces now live in face_encodings
+    face_encoding = deferred(Column(LargeBinary, nullable=True))
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
     user = relationship("User", back_populates="memory_photos")
+    faces = relationship("FaceEncoding", back_populates="photo", cascade="all, delete-orphan")
+
+
+class FaceEncoding(Base):
+    __tablename__ = "face_encodings"
+
+    id = Column(Integer, primary_key=True, index=True)
+    photo_id = Column(Integer, ForeignKey("memory_photos.id"), nullable=False, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    person_id = Column(Integer, ForeignKey("persons.id"), nullable=True, index=True)
+    # Face box in pixels of the upright photo (null for faces backfilled from the legacy column)
+    box_top = Column(Integer, nullable=True)
+    box_right = Column(Integer, nullable=True)
+    box_bottom = Column(Integer, nullable=True)
+    box_left = Column(Integer, nullable=True)
+    encoding = Column(LargeBinary, nullable=False)  # 128 float32 values
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    photo = relationship("MemoryPhoto", back_populates="faces")
+    person = relationship("Person", back_populates="faces")
+
+
+class Person(Base):
+    __tablename__ = "persons"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    name = Column(String(100), nullable=True)  # Set by the user; clusters start unnamed
+    centroid = Column(LargeBinary, nullable=False)  # Mean of the person's float32 face encodings
+    face_count = Column(Integer, default=0, nullable=False)
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+
+    faces = relationship("FaceEncoding", back_populates="person")
+
+
+class PhotoImportJob(Base):
+    __tablename__ = "photo_import_jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(Integer, ForeignKey("users.id"), nullable=False, index=True)
+    status = Column(String(20), default="pending", nullable=False)  # pending, running, completed, failed
+    total_files = Column(Integer, default=0, nullable=False)
+    processed_files = Column(Integer, default=0, nullable=False)
+    imported_photos = Column(Integer, default=0, nullable=False)
+    faces_found = Column(Integer, default=0, nullable=False)
+    failed_files = Column(Integer, default=0, nullable=False)
+    duplicate_files = Column(Integer, default=0, nullable=False)  # Already in the library, skipped
+    errors = Column(JSON, nullable=True)  # Names of files that could not be imported, and why
+    created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
+    finished_at = Column(DateTime(timezone=True), nullable=True)
 
 
 class Reminder(Base):
@@ -212,7 +306,7 @@ class VoiceNote(Base):
     audio_path = Column(String(500), nullable=False)
     description = Column(Text, nullable=True)
     memory_id = Column(Integer, ForeignKey("memory_photos.id"), nullable=True, index=True)
-    person_id = Column(String(100), nullable=True, index=True)  # Reference to person name/id
+    person_id = Column(String(100), nullable=True, index=True)  # Person id (as text), or a legacy free-text name
     reminder_id = Column(Integer, ForeignKey("reminders.id"), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
 
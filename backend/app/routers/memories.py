@@ -1,14 +1,15 @@
+import asyncio
 from pathlib import Path
-from typing import List
+from typing import Dict, List
 
-from fastapi import APIRouter, Depends, File, Form, UploadFile, Request
+from fastapi import APIRouter, BackgroundTasks, Depends, File, Form, UploadFile, Request
 from fastapi import status
 from sqlalchemy.orm import Session
 
 from app.db.database import get_db
 from app.schemas import schemas
 from app.services.auth_service import get_current_user
-from app.services import memory_service
+from app.services import image_service, memory_service, person_service, photo_import_service
 
 router = APIRouter(prefix="/memories", tags=["memories"])
 
@@ -19,6 +20,38 @@ def _build_image_url(request: Request, relative_path: str) -> str:
     return str(request.url_for("uploads", path=relative_path))
 
 
+def _build_variant_urls(request: Request, image_path: str, missing: List[str]) -> Dict[str, str]:
+    """
+    URLs of a photo's original and display variants. Variants that do not
+    exist yet fall back to the original, and the photo is added to missing
+    so the caller can generate them in the background.
+    """
+    variants = image_service.existing_variants(image_path, UPLOAD_ROOT)
+    if len(variants) < len(image_service.PHOTO_VARIANTS):
+        missing.append(image_path)
+    return {
+        "image_url": _build_image_url(request, image_path),
+        "thumbnail_url": _build_image_url(request, variants.get("thumbnail", image_path)),
+        "medium_url": _build_image_url(request, variants.get("medium", image_path)),
+    }
+
+
+def _build_person(request: Request, person, cover, missing: List[str]) -> schemas.Person:
+    cover_url = _build_variant_urls(request, cover.image_path, missing)["thumbnail_url"] if cover else None
+    return schemas.Person(
+        id=person.id,
+        name=person.name,
+        face_count=person.face_count,
+        cover_url=cover_url,
+        created_at=person.created_at,
+    )
+
+
+def _generate_missing_variants(background_tasks: BackgroundTasks, missing: List[str]):
+    if missing:
+        background_tasks.add_task(memory_service.generate_missing_variants, missing, UPLOAD_ROOT)
+
+
 @router.post(
     "/photos",
     response_model=schemas.MemoryPhoto,
@@ -31,7 +64,8 @@ async def create_memory_photo(
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    memory = memory_service.create_memory_photo(
+    # Face detection and variants run in the encoding pool, off the event loop
+    memory = await memory_service.create_memory_photo(
         user_id=current_user.id,
         description=description,
         file=file,
@@ -41,51 +75,206 @@ async def create_memory_photo(
     return schemas.MemoryPhoto(
         id=memory.id,
         description=memory.description,
-        image_url=_build_image_url(request, memory.image_path),
         created_at=memory.created_at,
+        **_build_variant_urls(request, memory.image_path, []),
+    )
+
+
+@router.post(
+    "/photos/import",
+    response_model=schemas.PhotoImportJob,
+    status_code=status.HTTP_202_ACCEPTED,
+)
+async def import_memory_photos(
+    background_tasks: BackgroundTasks,
+    files: List[UploadFile] = File(...),
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """
+    Import many photos at once, as image files and/or zip archives of them.
+    The photos are staged and imported in the background; poll the returned
+    job for progress. A request can carry at most 1000 files, so larger
+    libraries should be sent as archives.
+    """
+    # Large uploads are already spooled to disk; copy them off the event loop
+    job, staged = await asyncio.to_thread(
+        photo_import_service.create_import_job,
+        user_id=current_user.id,
+        files=files,
+        upload_root=UPLOAD_ROOT,
+        db=db,
     )
+    background_tasks.add_task(photo_import_service.run_import_job, job.id, staged, UPLOAD_ROOT)
+    return job
+
+
+@router.get("/photos/import/{job_id}", response_model=schemas.PhotoImportJob)
+async def get_photo_import_job(
+    job_id: int,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    return photo_import_service.get_import_job(job_id=job_id, user_id=current_user.id, db=db)
 
 
 @router.get("/photos", response_model=List[schemas.MemoryPhoto])
 async def list_memory_photos(
     request: Request,
+    background_tasks: BackgroundTasks,
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
     memories = memory_service.list_memory_photos(user_id=current_user.id, db=db)
-    return [
+    missing: List[str] = []
+    responses = [
         schemas.MemoryPhoto(
             id=memory.id,
             description=memory.description,
-            image_url=_build_image_url(request, memory.image_path),
             created_at=memory.created_at,
+            **_build_variant_urls(request, memory.image_path, missing),
         )
         for memory in memories
     ]
+    # Photos uploaded before variants existed get them on first listing
+    _generate_missing_variants(background_tasks, missing)
+    return responses
+
+
+@router.delete("/photos/{photo_id}", status_code=status.HTTP_204_NO_CONTENT)
+async def delete_memory_photo(
+    photo_id: int,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    memory_service.delete_memory_photo(
+        photo_id=photo_id,
+        user_id=current_user.id,
+        upload_root=UPLOAD_ROOT,
+        db=db,
+    )
 
 
 @router.post("/photos/search", response_model=schemas.MemoryPhotoSearchResponse)
 async def search_memory_photos(
     request: Request,
+    background_tasks: BackgroundTasks,
     file: UploadFile = File(...),
     current_user=Depends(get_current_user),
     db: Session = Depends(get_db),
 ):
-    matches = memory_service.find_matching_memories(
+    # Repeat searches of the same photo are answered from the search result cache
+    query_faces, face_matches = await memory_service.search_memory_photos(
         user_id=current_user.id,
         file=file,
         db=db,
     )
 
+    faces = []
+    best_matches = {}
+    missing: List[str] = []
+    for ((top, right, bottom, left), _), matches in zip(query_faces, face_matches):
+        responses = []
+        for memory, distance in matches:
+            urls = _build_variant_urls(request, memory.image_path, missing)
+            match = schemas.MemoryPhotoMatch(
+                image_url=urls["image_url"],
+                thumbnail_url=urls["thumbnail_url"],
+                description=memory.description,
+                created_at=memory.created_at,
+                confidence=max(0.0, 1.0 - distance),
+            )
+            responses.append(match)
+            if memory.id not in best_matches or match.confidence > best_matches[memory.id].confidence:
+                best_matches[memory.id] = match
+        faces.append(schemas.MemoryPhotoFaceMatches(
+            box=schemas.FaceBox(top=top, right=right, bottom=bottom, left=left),
+            matches=responses,
+        ))
+
+    _generate_missing_variants(background_tasks, list(dict.fromkeys(missing)))
+    matches = sorted(best_matches.values(), key=lambda match: match.confidence, reverse=True)
+    return schemas.MemoryPhotoSearchResponse(matches=matches, faces=faces)
+
+
+@router.get("/people", response_model=List[schemas.Person])
+async def list_people(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    persons = person_service.list_persons(user_id=current_user.id, db=db)
+    covers = person_service.cover_photos(persons, db)
+    missing: List[str] = []
+    responses = [_build_person(request, person, covers.get(person.id), missing) for person in persons]
+    _generate_missing_variants(background_tasks, list(dict.fromkeys(missing)))
+    return responses
+
+
+@router.patch("/people/{person_id}", response_model=schemas.Person)
+async def rename_person(
+    request: Request,
+    person_id: int,
+    payload: schemas.PersonUpdate,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    person = person_service.get_person(person_id=person_id, user_id=current_user.id, db=db)
+    person = person_service.rename_person(person=person, name=payload.name, db=db)
+    cover = person_service.cover_photos([person], db).get(person.id)
+    return _build_person(request, person, cover, [])
+
+
+@router.get("/people/{person_id}/photos", response_model=List[schemas.MemoryPhoto])
+async def list_person_photos(
+    person_id: int,
+    request: Request,
+    background_tasks: BackgroundTasks,
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    person = person_service.get_person(person_id=person_id, user_id=current_user.id, db=db)
+    missing: List[str] = []
     responses = [
-        schemas.MemoryPhotoMatch(
-            image_url=_build_image_url(request, memory.image_path),
+        schemas.MemoryPhoto(
+            id=memory.id,
             description=memory.description,
             created_at=memory.created_at,
-            confidence=max(0.0, 1.0 - distance),
+            **_build_variant_urls(request, memory.image_path, missing),
         )
-        for memory, distance in matches
+        for memory in person_service.list_person_photos(person=person, db=db)
     ]
+    _generate_missing_variants(background_tasks, missing)
+    return responses
+
+
+@router.post("/people/identify", response_model=schemas.PersonIdentifyResponse)
+async def identify_people(
+    request: Request,
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    current_user=Depends(get_current_user),
+    db: Session = Depends(get_db),
+):
+    """Who is in this photo: the known person, if any, for every face in it."""
+    query_faces = await memory_service.encode_query_faces(file)
+    identified = person_service.identify_faces(
+        user_id=current_user.id,
+        query_encodings=[encoding for _, encoding in query_faces],
+        db=db,
+    )
 
-    return schemas.MemoryPhotoSearchResponse(matches=responses)
+    persons = [match[0] for match in identified if match is not None]
+    covers = person_service.cover_photos(list({person.id: person for person in persons}.values()), db)
+    missing: List[str] = []
+    faces = []
+    for ((top, right, bottom, left), _), match in zip(query_faces, identified):
+        faces.append(schemas.PersonMatch(
+            box=schemas.FaceBox(top=top, right=right, bottom=bottom, left=left),
+            person=_build_person(request, match[0], covers.get(match[0].id), missing) if match else None,
+            confidence=max(0.0, 1.0 - match[1]) if match else None,
+        ))
 
+    _generate_missing_variants(background_tasks, list(dict.fromkeys(missing)))
+    return schemas.PersonIdentifyResponse(faces=faces)
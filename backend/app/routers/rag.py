@@ -1,19 +1,31 @@
+import asyncio
 import os
+import json
 import shutil
 from typing import List
 from pathlib import Path
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, status
+from fastapi import APIRouter, BackgroundTasks, Depends, HTTPException, UploadFile, File, status
+from fastapi.responses import StreamingResponse
 from sqlalchemy.orm import Session
-from app.db.database import get_db
+from app.core.config import settings
+from app.db.database import get_db, SessionLocal
 from app.models.models import User, Document
 from app.schemas.schemas import (
+    BatchChatQuery,
+    BatchChatResult,
     ChatQuery,
     ChatResponse,
     DocumentInfo,
     DocumentUploadResponse,
     ChatHistory,
+    EmbeddingHealth,
+    IndexRebuildRequest,
 )
-from app.services.auth_service import get_current_user
+from app.services import demo_service
+from app.services.auth_service import get_current_user, get_current_admin_user
+from app.services.embedding_retry_service import get_embedding_health
+from app.services.gemini_key_pool import key_pool
+from app.services.index_rebuild_service import is_rebuild_running, list_users_with_chunks, rebuild_user_index
 from app.services.rag_service import RAGService
 
 router = APIRouter(prefix="/rag", tags=["RAG"])
@@ -88,8 +100,10 @@ async def chat_query(
                 detail="Question cannot be empty"
             )
         
-        # Get answer from RAG service
-        result = rag_service.answer_question(
+        # Get answer from RAG service; run it off the event loop so that
+        # concurrent queries can be micro-batched together
+        result = await asyncio.to_thread(
+            rag_service.answer_question,
             query.question,
             current_user.id,
             db
@@ -99,7 +113,8 @@ async def chat_query(
             question=result["question"],
             response=result["response"],
             confidence_score=result["confidence_score"],
-            sources_used=result["sources_used"]
+            sources_used=result["sources_used"],
+            answer_source=result["answer_source"]
         )
         
     except HTTPException:
@@ -111,6 +126,50 @@ async def chat_query(
         )
 
 
+@router.post("/chat/batch")
+async def chat_batch_query(
+    query: BatchChatQuery,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Answer a list of questions in one request.
+    Results are streamed back as newline-delimited JSON objects in the order
+    they finish; each carries the position of its question in the request.
+    """
+    questions = [question.strip() for question in query.questions]
+    if not questions or not all(questions):
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Questions cannot be empty"
+        )
+    if len(questions) > settings.RAG_BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"At most {settings.RAG_BATCH_MAX_QUESTIONS} questions can be sent per batch"
+        )
+    
+    user_id = current_user.id
+    
+    async def stream_results():
+        # The response outlives the request-scoped session, so use our own
+        db = SessionLocal()
+        try:
+            async for result in rag_service.answer_questions_stream(questions, user_id, db):
+                item = BatchChatResult(
+                    index=result["index"],
+                    question=result["question"],
+                    response=result["response"],
+                    confidence_score=result["confidence_score"],
+                    sources_used=result["sources_used"],
+                    answer_source=result["answer_source"]
+                )
+                yield json.dumps(item.model_dump(mode="json")) + "\n"
+        finally:
+            db.close()
+    
+    return StreamingResponse(stream_results(), media_type="application/x-ndjson")
+
+
 @router.get("/chat/history", response_model=List[ChatHistory])
 async def get_chat_history(
     limit: int = 50,
@@ -140,24 +199,25 @@ async def list_documents(
     List all documents uploaded by the current user.
     """
     try:
-        documents = db.query(Document).filter(
+        # Only the small columns are selected; content and metadata stay on disk
+        documents = db.query(
+            Document.id,
+            Document.filename,
+            Document.created_at,
+            Document.chunk_count
+        ).filter(
             Document.user_id == current_user.id
         ).order_by(Document.created_at.desc()).all()
         
-        result = []
-        for doc in documents:
-            chunks_count = None
-            if doc.document_metadata and isinstance(doc.document_metadata, dict):
-                chunks_count = doc.document_metadata.get("total_chunks")
-            
-            result.append(DocumentInfo(
+        return [
+            DocumentInfo(
                 id=doc.id,
                 filename=doc.filename,
                 created_at=doc.created_at,
-                chunks_count=chunks_count
-            ))
-        
-        return result
+                chunks_count=doc.chunk_count
+            )
+            for doc in documents
+        ]
         
     except Exception as e:
         raise HTTPException(
@@ -192,6 +252,10 @@ async def delete_document(
         db.delete(document)
         db.commit()
         
+        # Answers derived from the removed document are no longer valid
+        rag_service.invalidate_corpus_context(current_user.id)
+        rag_service.clear_precomputed_answers(current_user.id, db)
+        
         # TODO: In a production system, you might want to rebuild the FAISS index
         # after deleting documents to remove the vectors completely
         
@@ -237,38 +301,12 @@ async def initialize_demo_data(
     db: Session = Depends(get_db)
 ):
     """
-    Initialize the knowledge base with demo documents from rag-docs directory.
+    Initialize the knowledge base with the demo documents from the rag-docs
+    directory, cloned from the prebuilt shared demo corpus.
     """
     try:
-        # Path to the demo documents
-        demo_docs_path = Path(__file__).resolve().parent.parent.parent / "rag-docs"
-        
-        if not demo_docs_path.exists():
-            raise HTTPException(
-                status_code=status.HTTP_404_NOT_FOUND,
-                detail="Demo documents directory not found"
-            )
-        
-        processed_files = []
-        
-        # Process all PDF files in the demo directory
-        for pdf_file in demo_docs_path.glob("*.pdf"):
-            try:
-                result = rag_service.process_and_index_document(
-                    str(pdf_file),
-                    pdf_file.name,
-                    current_user.id,
-                    db
-                )
-                processed_files.append(result)
-                
-            except Exception as e:
-                print(f"Error processing {pdf_file.name}: {e}")
-                processed_files.append({
-                    "success": False,
-                    "filename": pdf_file.name,
-                    "error": str(e)
-                })
+        processed_files = demo_service.clone_demo_corpus(current_user.id, db, rag_service.vector_service)
+        rag_service.corpus_changed(current_user.id)
         
         success_count = sum(1 for f in processed_files if f.get("success", False))
         
@@ -277,10 +315,100 @@ async def initialize_demo_data(
             "processed_files": processed_files
         }
         
-    except HTTPException:
-        raise
+    except FileNotFoundError as e:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail=str(e)
+        )
     except Exception as e:
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail=f"Error initializing demo data: {str(e)}"
         )
+
+
+def _run_index_rebuilds(user_ids: List[int]):
+    """
+    Rebuild indexes one user at a time outside the request, with its own session.
+    """
+    db = SessionLocal()
+    try:
+        for user_id in user_ids:
+            try:
+                rebuild_user_index(user_id, db, vector_service=rag_service.vector_service)
+                rag_service.corpus_changed(user_id)
+            except Exception as e:
+                print(f"Error rebuilding index for user {user_id}: {e}")
+    finally:
+        db.close()
+
+
+@router.post("/index/rebuild", status_code=status.HTTP_202_ACCEPTED)
+async def rebuild_my_index(
+    background_tasks: BackgroundTasks,
+    current_user: User = Depends(get_current_user),
+):
+    """
+    Rebuild the current user's search index from their stored documents.
+    """
+    if is_rebuild_running(current_user.id):
+        raise HTTPException(
+            status_code=status.HTTP_409_CONFLICT,
+            detail="An index rebuild is already running"
+        )
+    
+    background_tasks.add_task(_run_index_rebuilds, [current_user.id])
+    return {"message": "Index rebuild started", "user_ids": [current_user.id]}
+
+
+@router.post("/admin/index/rebuild", status_code=status.HTTP_202_ACCEPTED)
+async def rebuild_indexes(
+    payload: IndexRebuildRequest,
+    background_tasks: BackgroundTasks,
+    admin_user: User = Depends(get_current_admin_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Rebuild one user's index, or every user's index when no user_id is given.
+    """
+    user_ids = [payload.user_id] if payload.user_id is not None else list_users_with_chunks(db)
+    user_ids = [user_id for user_id in user_ids if not is_rebuild_running(user_id)]
+    
+    background_tasks.add_task(_run_index_rebuilds, user_ids)
+    return {"message": f"Index rebuild started for {len(user_ids)} users", "user_ids": user_ids}
+
+
+@router.get("/admin/gemini-keys")
+async def gemini_key_stats(admin_user: User = Depends(get_current_admin_user)):
+    """
+    Show per-key usage of the Gemini key pool.
+    """
+    return {"keys": key_pool.stats()}
+
+
+@router.post("/admin/gemini-keys/reload")
+async def reload_gemini_keys(admin_user: User = Depends(get_current_admin_user)):
+    """
+    Re-read the Gemini API keys file now instead of waiting for the next check.
+    """
+    key_count = key_pool.reload()
+    return {"message": f"Loaded {key_count} Gemini API keys", "keys": key_pool.stats()}
+
+
+@router.get("/index/health", response_model=EmbeddingHealth)
+async def embedding_health(
+    current_user: User = Depends(get_current_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Show how many of the current user's chunks are indexed, waiting for an
+    embedding retry, or failed permanently.
+    """
+    try:
+        return EmbeddingHealth(**get_embedding_health(current_user.id, db, rag_service.vector_service))
+        
+    except Exception as e:
+        raise HTTPException(
+            status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
+            detail=f"Error retrieving embedding health: {str(e)}"
+        )
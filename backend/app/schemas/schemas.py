@@ -39,9 +39,18 @@ class ChatResponse(BaseModel):
     response: str
     confidence_score: float
     sources_used: int
+    answer_source: str = "rag"  # rag, long_context, structured, precomputed, extractive, error
     created_at: Optional[datetime] = None
 
 
+class BatchChatQuery(BaseModel):
+    questions: List[str]
+
+
+class BatchChatResult(ChatResponse):
+    index: int
+
+
 class DocumentInfo(BaseModel):
     id: int
     filename: str
@@ -54,9 +63,22 @@ class DocumentUploadResponse(BaseModel):
     document_id: Optional[int] = None
     filename: str
     chunks_processed: Optional[int] = None
+    chunks_pending: Optional[int] = None
     message: str
 
 
+class IndexRebuildRequest(BaseModel):
+    user_id: Optional[int] = None  # None rebuilds every user
+
+
+class EmbeddingHealth(BaseModel):
+    indexed_chunks: int
+    pending_chunks: int
+    failed_chunks: int
+    index_vectors: int
+    next_retry_at: Optional[datetime] = None
+
+
 class ChatHistory(BaseModel):
     id: int
     question: str
@@ -77,14 +99,35 @@ class MemoryPhotoCreate(MemoryPhotoBase):
 class MemoryPhoto(MemoryPhotoBase):
     id: int
     image_url: str
+    # WebP display sizes; the original's URL until they have been generated
+    thumbnail_url: Optional[str] = None
+    medium_url: Optional[str] = None
     created_at: datetime
 
     class Config:
         from_attributes = True
 
 
+class PhotoImportJob(BaseModel):
+    id: int
+    status: str  # pending, running, completed, failed
+    total_files: int
+    processed_files: int
+    imported_photos: int
+    faces_found: int
+    failed_files: int
+    duplicate_files: int = 0
+    errors: Optional[List[str]] = None
+    created_at: datetime
+    finished_at: Optional[datetime] = None
+
+    class Config:
+        from_attributes = True
+
+
 class MemoryPhotoMatch(BaseModel):
     image_url: str
+    thumbnail_url: Optional[str] = None
     description: Optional[str] = None
     created_at: Optional[datetime] = None
     confidence: float
@@ -267,10 +310,45 @@ class LiveLocationResponse(LiveLocation):
     user_id: int
 
 
-class MemoryPhotoSearchResponse(BaseModel):
+class FaceBox(BaseModel):
+    top: int
+    right: int
+    bottom: int
+    left: int
+
+
+class MemoryPhotoFaceMatches(BaseModel):
+    box: FaceBox  # Face in the search photo, in pixels of the upright image
     matches: List[MemoryPhotoMatch]
 
 
+class MemoryPhotoSearchResponse(BaseModel):
+    matches: List[MemoryPhotoMatch]  # Best match per photo across every face
+    faces: List[MemoryPhotoFaceMatches] = []
+
+
+class Person(BaseModel):
+    id: int
+    name: Optional[str] = None  # Unnamed until the user names the cluster
+    face_count: int
+    cover_url: Optional[str] = None  # Thumbnail of the person's earliest photo
+    created_at: datetime
+
+
+class PersonUpdate(BaseModel):
+    name: Optional[str] = None
+
+
+class PersonMatch(BaseModel):
+    box: FaceBox  # Face in the query photo, in pixels of the upright image
+    person: Optional[Person] = None  # None when nobody in the library matches
+    confidence: Optional[float] = None
+
+
+class PersonIdentifyResponse(BaseModel):
+    faces: List[PersonMatch]
+
+
 # Medication schemas
 class MedicationBase(BaseModel):
     name: str
@@ -85,3 +85,15 @@ async def get_current_active_user(current_user: schemas.User = Depends(get_curre
     """
     # For now, we don't have an `is_active` flag, so we just return the user.
     return current_user
+
+
+async def get_current_admin_user(current_user: models.User = Depends(get_current_user)):
+    """
+    Dependency that only lets users listed in ADMIN_USERNAMES through.
+    """
+    if current_user.username not in settings.ADMIN_USERNAMES:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="Admin privileges required",
+        )
+    return current_user
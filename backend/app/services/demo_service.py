@@ -0,0 +1,258 @@
+import json
+import shutil
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import Document
+from app.services.document_service import DocumentChunk, process_pdf, store_document_chunks
+from app.services.embedding_retry_service import record_embedding_results
+from app.services.gemini_key_pool import key_pool
+from app.services.vector_service import VectorService
+
+
+# Demo PDFs shipped with the backend
+DEMO_DOCS_PATH = Path(__file__).resolve().parent.parent.parent / "rag-docs"
+
+# The shared corpus lives beside the user indexes, stored as a pseudo user
+DEMO_CORPUS_SUBDIR = "demo"
+DEMO_CORPUS_USER_ID = 0
+DEMO_MANIFEST_FILENAME = "manifest.json"
+DEMO_EMBEDDINGS_FILENAME = "embeddings.npy"
+
+_build_lock = threading.Lock()
+_cached_corpus: Optional[Dict[str, Any]] = None
+
+
+def _corpus_dir() -> Path:
+    return Path(settings.FAISS_INDEX_PATH) / DEMO_CORPUS_SUBDIR
+
+
+def _source_fingerprint() -> Dict[str, Any]:
+    """
+    Everything the prebuilt files depend on. The corpus is rebuilt when the
+    demo PDFs or the embedding and index settings change.
+    """
+    return {
+        "files": [
+            {"name": path.name, "size": path.stat().st_size, "mtime": int(path.stat().st_mtime)}
+            for path in sorted(DEMO_DOCS_PATH.glob("*.pdf"))
+        ],
+        "embedding_model": settings.EMBEDDING_MODEL,
+        "search_dimension": settings.FAISS_SEARCH_DIMENSION,
+        "quantization": settings.FAISS_QUANTIZATION,
+        "rerank_exact": settings.FAISS_RERANK_EXACT,
+        "chunk_size": settings.CHUNK_SIZE,
+    }
+
+
+def load_demo_corpus() -> Optional[Dict[str, Any]]:
+    """
+    Load the prebuilt demo corpus: its manifest, chunk metadata and full
+    embeddings. Returns None when it has not been built or is out of date.
+    """
+    global _cached_corpus
+
+    fingerprint = _source_fingerprint()
+    corpus = _cached_corpus
+    if corpus is not None and corpus["manifest"]["fingerprint"] == fingerprint:
+        return corpus
+
+    corpus_dir = _corpus_dir()
+    manifest_path = corpus_dir / DEMO_MANIFEST_FILENAME
+    if not manifest_path.exists():
+        return None
+
+    try:
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("fingerprint") != fingerprint:
+            print("Demo corpus is out of date and will be rebuilt")
+            return None
+
+        store = VectorService(faiss_dir=corpus_dir)
+        corpus = {
+            "manifest": manifest,
+            "store": store,
+            "metadata": store.load_user_metadata(DEMO_CORPUS_USER_ID),
+            "embeddings": np.load(corpus_dir / DEMO_EMBEDDINGS_FILENAME, mmap_mode="r"),
+        }
+        _cached_corpus = corpus
+        return corpus
+
+    except Exception as e:
+        print(f"Error loading demo corpus: {e}")
+        return None
+
+
+def build_demo_corpus(vector_service: Optional[VectorService] = None, force: bool = False) -> Dict[str, Any]:
+    """
+    Parse, chunk and embed the demo PDFs once into a shared index, chunk
+    metadata and embedding store under FAISS_INDEX_PATH/demo. The files are
+    written to a staging directory and moved into place only when every
+    chunk has been embedded, so users never clone a partial corpus.
+    """
+    global _cached_corpus
+
+    with _build_lock:
+        if not force:
+            corpus = load_demo_corpus()
+            if corpus is not None:
+                return corpus
+
+        pdf_paths = sorted(DEMO_DOCS_PATH.glob("*.pdf"))
+        if not pdf_paths:
+            raise FileNotFoundError("Demo documents directory not found or empty")
+
+        documents = []
+        chunks: List[DocumentChunk] = []
+        for pdf_path in pdf_paths:
+            document_chunks = process_pdf(str(pdf_path), pdf_path.name, DEMO_CORPUS_USER_ID)
+            documents.append({"filename": pdf_path.name, "chunk_count": len(document_chunks)})
+            chunks.extend(document_chunks)
+
+        embedder = vector_service or VectorService()
+        embeddings = embedder.get_gemini_embeddings([chunk.content for chunk in chunks])
+        missing = sum(1 for embedding in embeddings if embedding is None or not np.any(embedding))
+        if missing:
+            raise RuntimeError(f"Could not embed {missing} of {len(chunks)} demo chunks")
+
+        corpus_dir = _corpus_dir()
+        staging_dir = corpus_dir.with_name(DEMO_CORPUS_SUBDIR + ".tmp")
+        if staging_dir.exists():
+            shutil.rmtree(staging_dir)
+
+        staging = VectorService(faiss_dir=staging_dir)
+        staging.add_documents_to_index(DEMO_CORPUS_USER_ID, chunks, embeddings=embeddings)
+
+        embeddings_array = np.array(embeddings, dtype=np.float32)
+        embeddings_array /= np.linalg.norm(embeddings_array, axis=1, keepdims=True)
+        np.save(staging_dir / DEMO_EMBEDDINGS_FILENAME, embeddings_array)
+
+        with open(staging_dir / DEMO_MANIFEST_FILENAME, "w") as f:
+            json.dump({"fingerprint": _source_fingerprint(), "documents": documents}, f, indent=2)
+
+        # Users that already cloned the old corpus keep their hard links
+        # to its files, so the old directory can simply be removed
+        previous_dir = corpus_dir.with_name(DEMO_CORPUS_SUBDIR + ".old")
+        if previous_dir.exists():
+            shutil.rmtree(previous_dir)
+        if corpus_dir.exists():
+            corpus_dir.rename(previous_dir)
+        staging_dir.rename(corpus_dir)
+        if previous_dir.exists():
+            shutil.rmtree(previous_dir)
+
+        _cached_corpus = None
+        print(f"Built demo corpus with {len(documents)} documents and {len(chunks)} chunks")
+        return load_demo_corpus()
+
+
+def start_demo_corpus_build(vector_service: VectorService):
+    """
+    Build the demo corpus in a background thread at startup unless it is
+    already current.
+    """
+    if not settings.DEMO_CORPUS_PREBUILD or not key_pool.has_keys():
+        return
+
+    def build():
+        try:
+            build_demo_corpus(vector_service)
+        except Exception as e:
+            print(f"Error building demo corpus: {e}")
+
+    threading.Thread(target=build, name="demo-corpus-build", daemon=True).start()
+
+
+def clone_demo_corpus(user_id: int, db: Session, vector_service: VectorService) -> List[Dict[str, Any]]:
+    """
+    Add the demo documents to a user's knowledge base from the prebuilt
+    corpus, without parsing or embedding anything. A user without an index
+    gets hard links to the shared index and side store; otherwise the
+    stored embeddings are appended to their index. Demo documents the user
+    already has are skipped. Returns one result per demo document, shaped
+    like RAGService.process_and_index_document results.
+    """
+    corpus = load_demo_corpus() or build_demo_corpus(vector_service)
+    documents = corpus["manifest"]["documents"]
+    shared_metadata = corpus["metadata"]
+
+    existing_filenames = {
+        row.filename
+        for row in db.query(Document.filename).filter(
+            Document.user_id == user_id,
+            Document.filename.in_([document["filename"] for document in documents]),
+        )
+    }
+
+    results = []
+    new_chunks: List[DocumentChunk] = []
+    new_rows: List[int] = []
+    start = 0
+    for document in documents:
+        rows = range(start, start + document["chunk_count"])
+        start += document["chunk_count"]
+
+        if document["filename"] in existing_filenames:
+            results.append({
+                "success": True,
+                "filename": document["filename"],
+                "chunks_processed": 0,
+                "chunks_pending": 0,
+                "message": f"{document['filename']} is already in your knowledge base",
+            })
+            continue
+
+        chunks = [
+            DocumentChunk(
+                shared_metadata[row]["content"],
+                {**shared_metadata[row]["metadata"], "user_id": user_id},
+            )
+            for row in rows
+        ]
+        stored = store_document_chunks(chunks, user_id, document["filename"], db)
+        new_chunks.extend(chunks)
+        new_rows.extend(rows)
+        results.append({
+            "success": True,
+            "document_id": stored.id,
+            "filename": document["filename"],
+            "chunks_processed": len(chunks),
+            "chunks_pending": 0,
+            "message": f"Successfully processed {document['filename']} with {len(chunks)} chunks",
+        })
+
+    if not new_chunks:
+        return results
+
+    try:
+        # Nothing else may write the user's index between checking for it
+        # and linking the shared files in
+        with vector_service.user_write_lock(user_id):
+            has_index = vector_service.load_user_index(user_id) is not None
+            if not has_index and len(new_rows) == len(shared_metadata):
+                vector_service.link_user_data(user_id, corpus["store"], DEMO_CORPUS_USER_ID, [
+                    {
+                        "content": chunk.content,
+                        "metadata": chunk.metadata,
+                        "index_id": index_id,
+                        "chunk_id": chunk.chunk_id,
+                    }
+                    for index_id, chunk in enumerate(new_chunks)
+                ])
+                index_ids = list(range(len(new_chunks)))
+            else:
+                embeddings = np.asarray(corpus["embeddings"][new_rows], dtype=np.float32)
+                index_ids = vector_service.add_documents_to_index(user_id, new_chunks, embeddings=list(embeddings))
+    except Exception:
+        record_embedding_results(new_chunks, [None] * len(new_chunks), db)
+        raise
+
+    record_embedding_results(new_chunks, index_ids, db)
+    print(f"Cloned {len(new_chunks)} demo chunks into the knowledge base of user {user_id}")
+    return results
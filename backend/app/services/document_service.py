@@ -3,15 +3,17 @@ import re
 from typing import List, Dict, Any
 from pathlib import Path
 import PyPDF2
-from sqlalchemy.orm import Session
-from app.models.models import Document
+from sqlalchemy.orm import Session, undefer
+from app.models.models import Document, DocumentChunkRecord
 from app.core.config import settings
 
 
 class DocumentChunk:
-    def __init__(self, content: str, metadata: Dict[str, Any] = None):
+    def __init__(self, content: str, metadata: Dict[str, Any] = None, chunk_id: int = None):
         self.content = content
         self.metadata = metadata or {}
+        # Id of the stored DocumentChunkRecord, once the chunk has been saved
+        self.chunk_id = chunk_id
 
 
 def extract_text_from_pdf(file_path: str) -> str:
@@ -92,8 +94,9 @@ def chunk_text(text: str, chunk_size: int = None) -> List[DocumentChunk]:
     if chunk_size is None:
         chunk_size = settings.CHUNK_SIZE
     
-    # Split by sentences first to maintain context
-    sentences = re.split(r'[.!?]+', text)
+    # Split by sentences first to maintain context. The punctuation stays
+    # with each sentence, so the chunks can be split into sentences again
+    sentences = re.split(r'(?<=[.!?])\s+', text)
     chunks = []
     current_chunk = ""
     
@@ -156,27 +159,38 @@ def process_pdf(file_path: str, filename: str, user_id: int) -> List[DocumentChu
 
 def store_document_chunks(chunks: List[DocumentChunk], user_id: int, filename: str, db: Session):
     """
-    Store document chunks in the database.
+    Store a document and one row per chunk in the database.
+    Each chunk's chunk_id is set to its stored row id.
     """
     try:
-        # Combine all chunk content for the main document record
-        full_content = "\n\n".join([chunk.content for chunk in chunks])
-        
         # Create the main document record
         document = Document(
             user_id=user_id,
             filename=filename,
-            content=full_content,
-            document_metadata={
-                "total_chunks": len(chunks),
-                "chunk_metadata": [chunk.metadata for chunk in chunks]
-            }
+            chunk_count=len(chunks),
+            document_metadata={"total_chunks": len(chunks)}
         )
-        
         db.add(document)
+        db.flush()
+        
+        records = [
+            DocumentChunkRecord(
+                document_id=document.id,
+                user_id=user_id,
+                ordinal=ordinal,
+                content=chunk.content,
+                chunk_metadata=chunk.metadata,
+                embedding_status="pending"
+            )
+            for ordinal, chunk in enumerate(chunks)
+        ]
+        db.add_all(records)
         db.commit()
         db.refresh(document)
         
+        for chunk, record in zip(chunks, records):
+            chunk.chunk_id = record.id
+        
         return document
         
     except Exception as e:
@@ -185,6 +199,19 @@ def store_document_chunks(chunks: List[DocumentChunk], user_id: int, filename: s
         raise
 
 
+def get_document_chunks(document_id: int, db: Session) -> List[DocumentChunkRecord]:
+    """
+    Get a document's chunks in order, including their text and metadata.
+    """
+    return (
+        db.query(DocumentChunkRecord)
+        .options(undefer(DocumentChunkRecord.content), undefer(DocumentChunkRecord.chunk_metadata))
+        .filter(DocumentChunkRecord.document_id == document_id)
+        .order_by(DocumentChunkRecord.ordinal)
+        .all()
+    )
+
+
 def get_user_documents(user_id: int, db: Session) -> List[Document]:
     """
     Get all documents for a user.
@@ -0,0 +1,188 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from typing import Any, Callable, Dict, List, Optional
+
+from sqlalchemy import func
+from sqlalchemy.orm import Session, undefer
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import DocumentChunkRecord
+from app.services.document_service import DocumentChunk
+from app.services.vector_service import VectorService
+
+
+def _retry_delay(attempts: int) -> timedelta:
+    """Exponential backoff: base, 2x base, 4x base, ... capped at the maximum."""
+    seconds = settings.EMBEDDING_RETRY_BASE_SECONDS * (2 ** max(attempts - 1, 0))
+    return timedelta(seconds=min(seconds, settings.EMBEDDING_RETRY_MAX_DELAY_SECONDS))
+
+
+def record_embedding_results(chunks: List[DocumentChunk], index_ids: List[Optional[int]], db: Session):
+    """
+    Store the outcome of indexing chunks. Chunks with an index row are marked
+    indexed; the rest stay pending with a backoff before the next attempt, or
+    are marked failed once EMBEDDING_RETRY_MAX_ATTEMPTS is reached.
+    """
+    try:
+        failed_ids = [
+            chunk.chunk_id for chunk, index_id in zip(chunks, index_ids)
+            if index_id is None and chunk.chunk_id is not None
+        ]
+        attempts_by_id = dict(
+            db.query(DocumentChunkRecord.id, DocumentChunkRecord.embedding_attempts)
+            .filter(DocumentChunkRecord.id.in_(failed_ids))
+            .all()
+        ) if failed_ids else {}
+
+        now = datetime.now(timezone.utc)
+        updates = []
+        for chunk, index_id in zip(chunks, index_ids):
+            if chunk.chunk_id is None:
+                continue
+            if index_id is not None:
+                updates.append({
+                    "id": chunk.chunk_id,
+                    "embedding_status": "indexed",
+                    "index_id": index_id,
+                    "next_embedding_attempt_at": None,
+                })
+                continue
+
+            attempts = (attempts_by_id.get(chunk.chunk_id) or 0) + 1
+            exhausted = attempts >= settings.EMBEDDING_RETRY_MAX_ATTEMPTS
+            updates.append({
+                "id": chunk.chunk_id,
+                "embedding_status": "failed" if exhausted else "pending",
+                "index_id": None,
+                "embedding_attempts": attempts,
+                "next_embedding_attempt_at": None if exhausted else now + _retry_delay(attempts),
+            })
+
+        db.bulk_update_mappings(DocumentChunkRecord, updates)
+        db.commit()
+
+    except Exception as e:
+        db.rollback()
+        print(f"Error updating chunk status: {e}")
+        raise
+
+
+def retry_pending_embeddings(
+    db: Session,
+    vector_service: VectorService,
+    limit: int = 500,
+    on_indexed: Optional[Callable[[int], None]] = None,
+) -> int:
+    """
+    Re-embed chunks whose retry time has come and add the successful ones to
+    their users' indexes. on_indexed is called with the id of each user that
+    got new chunks, like ingestion refreshing precomputed answers. Returns
+    the number of chunks that were indexed.
+    """
+    # Imported here to avoid a circular import with the rebuild service
+    from app.services.index_rebuild_service import is_rebuild_running
+
+    now = datetime.now(timezone.utc)
+    records = (
+        db.query(DocumentChunkRecord)
+        .options(undefer(DocumentChunkRecord.content), undefer(DocumentChunkRecord.chunk_metadata))
+        .filter(
+            DocumentChunkRecord.embedding_status == "pending",
+            DocumentChunkRecord.next_embedding_attempt_at.isnot(None),
+            DocumentChunkRecord.next_embedding_attempt_at <= now,
+        )
+        .order_by(DocumentChunkRecord.user_id, DocumentChunkRecord.document_id, DocumentChunkRecord.ordinal)
+        .limit(limit)
+        .all()
+    )
+
+    chunks_by_user: Dict[int, List[DocumentChunk]] = {}
+    for record in records:
+        chunks_by_user.setdefault(record.user_id, []).append(
+            DocumentChunk(record.content, record.chunk_metadata or {}, chunk_id=record.id)
+        )
+
+    indexed = 0
+    for user_id, chunks in chunks_by_user.items():
+        # A running rebuild picks these chunks up itself
+        if is_rebuild_running(user_id):
+            continue
+        try:
+            embeddings = vector_service.get_gemini_embeddings([chunk.content for chunk in chunks])
+            # Hold the user's write lock until the chunk rows record where
+            # their vectors went, so a rebuild cannot swap in between
+            with vector_service.user_write_lock(user_id):
+                if is_rebuild_running(user_id):
+                    continue
+                index_ids = vector_service.add_documents_to_index(user_id, chunks, embeddings=embeddings)
+                record_embedding_results(chunks, index_ids, db)
+            user_indexed = sum(1 for index_id in index_ids if index_id is not None)
+            indexed += user_indexed
+            if user_indexed and on_indexed is not None:
+                on_indexed(user_id)
+        except Exception as e:
+            print(f"Error retrying embeddings for user {user_id}: {e}")
+
+    return indexed
+
+
+def get_embedding_health(user_id: int, db: Session, vector_service: VectorService) -> Dict[str, Any]:
+    """
+    Summarize how many of a user's chunks are indexed, waiting for a retry
+    or permanently failed.
+    """
+    counts = dict(
+        db.query(DocumentChunkRecord.embedding_status, func.count(DocumentChunkRecord.id))
+        .filter(DocumentChunkRecord.user_id == user_id)
+        .group_by(DocumentChunkRecord.embedding_status)
+        .all()
+    )
+    next_retry_at = (
+        db.query(func.min(DocumentChunkRecord.next_embedding_attempt_at))
+        .filter(
+            DocumentChunkRecord.user_id == user_id,
+            DocumentChunkRecord.embedding_status == "pending",
+        )
+        .scalar()
+    )
+    index = vector_service.load_user_index(user_id)
+
+    return {
+        "indexed_chunks": counts.get("indexed", 0),
+        "pending_chunks": counts.get("pending", 0),
+        "failed_chunks": counts.get("failed", 0),
+        "index_vectors": index.ntotal if index is not None else 0,
+        "next_retry_at": next_retry_at,
+    }
+
+
+def start_retry_worker(
+    vector_service: VectorService, on_indexed: Optional[Callable[[int], None]] = None
+) -> Optional[threading.Thread]:
+    """
+    Start a daemon thread that retries pending embeddings every
+    EMBEDDING_RETRY_INTERVAL_SECONDS. Its index writes take the user's
+    write lock like every other writer in this process; enable it on a
+    single process only, since writes are not coordinated between processes.
+    on_indexed is passed on to retry_pending_embeddings.
+    """
+    if not settings.EMBEDDING_RETRY_WORKER:
+        return None
+
+    def run():
+        stop = threading.Event()
+        while not stop.wait(settings.EMBEDDING_RETRY_INTERVAL_SECONDS):
+            db = SessionLocal()
+            try:
+                indexed = retry_pending_embeddings(db, vector_service, on_indexed=on_indexed)
+                if indexed:
+                    print(f"Embedding retry: indexed {indexed} chunks")
+            except Exception as e:
+                print(f"Error in embedding retry worker: {e}")
+            finally:
+                db.close()
+
+    worker = threading.Thread(target=run, name="embedding-retry", daemon=True)
+    worker.start()
+    return worker
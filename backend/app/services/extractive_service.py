@@ -0,0 +1,97 @@
+import math
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+
+# Longest extractive answer, in characters
+MAX_ANSWER_LENGTH = 300
+
+# Sentences end in punctuation or a blank line; single line breaks are
+# where PDF text was wrapped, mid-sentence
+SENTENCE_PATTERN = re.compile(r"(?<=[.!?])\s+|\n\s*\n|\s*--- Page \d+ ---\s*")
+SENTENCE_END_PATTERN = re.compile(r"[.!?](?:\s|$)")
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:'[a-z]+)?")
+PARENTHETICAL_PATTERN = re.compile(r"\s*[\(\[][^\)\]]*[\)\]]")
+
+STOPWORDS = {
+    "a", "about", "am", "an", "and", "any", "are", "as", "at", "be", "been", "can", "could",
+    "did", "do", "does", "for", "from", "had", "has", "have", "how", "i", "in", "is", "it",
+    "me", "my", "of", "on", "or", "please", "tell", "that", "the", "their", "there", "this",
+    "to", "was", "were", "what", "when", "where", "which", "who", "whom", "why", "will",
+    "with", "would", "you", "your",
+}
+
+
+def _terms(text: str) -> List[str]:
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if token.endswith("'s"):
+            token = token[:-2]
+        if token in STOPWORDS or len(token) < 2:
+            continue
+        # Crude suffix folding, so "daughters" matches "daughter" and "worked" matches "work"
+        if len(token) > 5 and token.endswith("ing"):
+            token = token[:-3]
+        elif len(token) > 4 and token.endswith("ed"):
+            token = token[:-2]
+        elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+            token = token[:-1]
+        terms.append(token)
+    return terms
+
+
+def _split_sentences(text: str) -> List[str]:
+    # Chunks indexed before chunking kept punctuation have no sentence
+    # boundaries left; they are only answered by the LLM
+    if not SENTENCE_END_PATTERN.search(text):
+        return []
+    sentences = [re.sub(r"\s+", " ", sentence).strip() for sentence in SENTENCE_PATTERN.split(text)]
+    return [sentence for sentence in sentences if len(sentence) > 3]
+
+
+def _simplify(sentence: str) -> str:
+    sentence = PARENTHETICAL_PATTERN.sub("", sentence)
+    sentence = re.sub(r"\s+", " ", sentence.replace("*", "")).strip()
+    if len(sentence) > MAX_ANSWER_LENGTH:
+        sentence = sentence[:MAX_ANSWER_LENGTH].rsplit(" ", 1)[0] + "..."
+    if sentence and sentence[-1] not in ".!?":
+        sentence += "."
+    return sentence
+
+
+def extract_answer(question: str, context_results: List[Dict[str, Any]]) -> Optional[Tuple[str, float]]:
+    """
+    Pick the sentence of the retrieved chunks that best covers the
+    question's terms, weighted by how rare each term is among the candidate
+    sentences. Returns the simplified sentence and its coverage (0-1), or
+    None when no sentence shares a term with the question.
+    """
+    query_terms = set(_terms(question))
+    if not query_terms or not context_results:
+        return None
+
+    sentences = []
+    for result in context_results:
+        for sentence in _split_sentences(result["content"]):
+            sentences.append((sentence, set(_terms(sentence)), result.get("similarity_score", 0.0)))
+    if not sentences:
+        return None
+
+    idf = {
+        term: math.log(1 + len(sentences) / (1 + sum(1 for _, terms, _ in sentences if term in terms)))
+        for term in query_terms
+    }
+    total_weight = sum(idf.values())
+
+    best = None
+    for position, (sentence, terms, similarity) in enumerate(sentences):
+        coverage = sum(idf[term] for term in query_terms & terms) / total_weight
+        # Ties go to the sentence from the more similar chunk, then the earlier one
+        key = (coverage, similarity, -position)
+        if best is None or key > best[0]:
+            best = (key, sentence)
+
+    (coverage, _, _), sentence = best
+    if coverage <= 0:
+        return None
+    return _simplify(sentence), round(coverage, 2)
@@ -0,0 +1,170 @@
+import threading
+from typing import Dict, Iterable, List, Tuple
+
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.models.models import FaceEncoding
+
+
+# Length of a face_recognition encoding
+FACE_ENCODING_DIMENSION = 128
+
+
+def encoded_faces_version(user_id: int, db: Session) -> Tuple[int, int]:
+    """Count and highest id of a user's stored faces."""
+    count, max_id = (
+        db.query(func.count(FaceEncoding.id), func.max(FaceEncoding.id))
+        .filter(FaceEncoding.user_id == user_id)
+        .one()
+    )
+    return count or 0, max_id or 0
+
+
+def load_user_encodings(user_id: int, db: Session) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """Face ids, photo ids and float32 encoding matrix of a user's stored faces."""
+    rows = (
+        db.query(FaceEncoding.id, FaceEncoding.photo_id, FaceEncoding.encoding)
+        .filter(FaceEncoding.user_id == user_id)
+        .order_by(FaceEncoding.id)
+        .all()
+    )
+    face_ids = np.array([row.id for row in rows], dtype=np.int64)
+    photo_ids = np.array([row.photo_id for row in rows], dtype=np.int64)
+    matrix = np.empty((len(rows), FACE_ENCODING_DIMENSION), dtype=np.float32)
+    for position, row in enumerate(rows):
+        matrix[position] = np.frombuffer(row.encoding, dtype=np.float32)
+    return face_ids, photo_ids, matrix
+
+
+def rank_photo_matches(photo_ids: np.ndarray, distances: np.ndarray, max_results: int) -> List[Tuple[int, float]]:
+    """
+    Turn matching faces into up to max_results (photo id, distance) pairs,
+    closest first, keeping the closest face of photos that matched twice.
+    """
+    # With many candidates, sort only the closest faces, widening the cut
+    # until it holds max_results distinct photos
+    cut = max_results
+    while 0 < cut < len(distances):
+        closest = np.sort(np.argpartition(distances, cut)[:cut])
+        ranked = _rank_positions(photo_ids, distances, closest, max_results)
+        if len(ranked) == max_results:
+            return ranked
+        cut *= 2
+    return _rank_positions(photo_ids, distances, np.arange(len(distances)), max_results)
+
+
+def _rank_positions(
+    photo_ids: np.ndarray, distances: np.ndarray, positions: np.ndarray, max_results: int
+) -> List[Tuple[int, float]]:
+    order = positions[np.argsort(distances[positions], kind="stable")]
+    _, first = np.unique(photo_ids[order], return_index=True)
+    best = order[np.sort(first)][:max_results]
+    return [(int(photo_ids[position]), float(distances[position])) for position in best]
+
+
+class _UserEncodings:
+    __slots__ = ("face_ids", "photo_ids", "matrix", "squared_norms", "version")
+
+    def __init__(self, face_ids: np.ndarray, photo_ids: np.ndarray, matrix: np.ndarray, version: Tuple[int, int]):
+        self.face_ids = face_ids
+        self.photo_ids = photo_ids
+        self.matrix = matrix
+        self.squared_norms = np.einsum("ij,ij->i", matrix, matrix)
+        # (count, max id) of the user's faces when this was built
+        self.version = version
+
+
+class FaceEncodingCache:
+    """
+    Per-user face encodings held in memory as one contiguous float32 matrix
+    plus the matching face and photo ids, so a search for every face of a
+    query photo is a single matrix product. Entries are built on first use
+    and updated incrementally when photos are added or deleted in this
+    process. Changes made by other processes are picked up by comparing the
+    count and highest id of the user's faces before every search.
+    """
+
+    def __init__(self):
+        self._users: Dict[int, _UserEncodings] = {}
+        self._lock = threading.Lock()
+
+
+    def _get(self, user_id: int, db: Session) -> _UserEncodings:
+        version = encoded_faces_version(user_id, db)
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is not None and entry.version == version:
+                return entry
+
+        entry = _UserEncodings(*load_user_encodings(user_id, db), version)
+        with self._lock:
+            self._users[user_id] = entry
+        return entry
+
+
+    def add(self, user_id: int, faces: Iterable[FaceEncoding]):
+        """Append a new photo's faces if the user's matrix is loaded."""
+        faces = list(faces)
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None or not faces:
+                return
+            face_ids = np.append(entry.face_ids, [face.id for face in faces])
+            self._users[user_id] = _UserEncodings(
+                face_ids,
+                np.append(entry.photo_ids, [face.photo_id for face in faces]),
+                np.vstack([entry.matrix] + [np.frombuffer(face.encoding, dtype=np.float32) for face in faces]),
+                (len(face_ids), int(face_ids.max())),
+            )
+
+
+    def remove(self, user_id: int, face_ids: Iterable[int]):
+        """Drop a deleted photo's faces if the user's matrix is loaded."""
+        with self._lock:
+            entry = self._users.get(user_id)
+            if entry is None:
+                return
+            keep = ~np.isin(entry.face_ids, list(face_ids))
+            if keep.all():
+                return
+            remaining = entry.face_ids[keep]
+            self._users[user_id] = _UserEncodings(
+                remaining,
+                entry.photo_ids[keep],
+                entry.matrix[keep],
+                (len(remaining), int(remaining.max()) if len(remaining) else 0),
+            )
+
+
+    def search(
+        self, user_id: int, query_encodings: np.ndarray, db: Session, tolerance: float, max_results: int
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        For each query face, return up to max_results (photo id, distance)
+        pairs within tolerance, closest first. Distances are Euclidean, as in
+        face_recognition.face_distance.
+        """
+        queries = np.asarray(query_encodings, dtype=np.float32).reshape(-1, FACE_ENCODING_DIMENSION)
+        entry = self._get(user_id, db)
+        if not len(entry.face_ids):
+            return [[] for _ in queries]
+
+        # |q - e|^2 = |q|^2 + |e|^2 - 2 q.e, for every query face at once
+        squared = (
+            np.einsum("ij,ij->i", queries, queries)[:, None]
+            + entry.squared_norms[None, :]
+            - 2 * queries @ entry.matrix.T
+        )
+        distances = np.sqrt(np.maximum(squared, 0))
+
+        results = []
+        for row in distances:
+            within = np.flatnonzero(row <= tolerance)
+            results.append(rank_photo_matches(entry.photo_ids[within], row[within], max_results))
+        return results
+
+
+# Shared by every request in this process
+face_encoding_cache = FaceEncodingCache()
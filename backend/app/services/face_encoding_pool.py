@@ -0,0 +1,160 @@
+import asyncio
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException, status
+
+from app.core.config import settings
+
+
+# (top, right, bottom, left) box and float32 encoding bytes of one face
+DetectedFace = Tuple[Tuple[int, int, int, int], bytes]
+
+_executor: Optional[Executor] = None
+_executor_lock = threading.Lock()
+_pending: Optional[asyncio.Semaphore] = None
+
+
+def _warm_up():
+    # Importing the pipeline loads the dlib models, so every worker
+    # process pays that cost once at startup instead of on its first photo
+    import app.services.face_pipeline  # noqa: F401
+
+
+def _detected(faces) -> List[DetectedFace]:
+    return [(location, encoding.astype(np.float32).tobytes()) for location, encoding in faces]
+
+
+def _open_image(path: str):
+    from app.services import image_service
+
+    try:
+        return image_service.open_image(Path(path))
+    except Exception as e:
+        raise ValueError(f"Unable to decode image: {e}")
+
+
+def encode_faces(path: str) -> List[DetectedFace]:
+    """
+    Detect the faces in an image file and return the (top, right, bottom,
+    left) box and float32 encoding bytes of each, in detection order.
+    Raises ValueError if the file cannot be decoded. Runs inside the worker
+    processes, which read the file themselves.
+    """
+    from app.services.face_pipeline import find_faces
+
+    return _detected(find_faces(_open_image(path)))
+
+
+def process_photo(path: str) -> List[DetectedFace]:
+    """
+    Decode a saved photo once, write its display variants beside it and
+    encode its faces. Raises ValueError if the file cannot be decoded. Runs
+    inside the worker processes.
+    """
+    from app.services import image_service
+    from app.services.face_pipeline import find_faces
+
+    image = _open_image(path)
+    try:
+        image_service.save_variants(image, Path(path))
+    except Exception as e:
+        # The gallery falls back to the original until the variants exist
+        print(f"Error generating variants for {path}: {e}")
+
+    return _detected(find_faces(image))
+
+
+def _process_file(path: str) -> Optional[List[DetectedFace]]:
+    try:
+        return process_photo(path)
+    except (OSError, ValueError):
+        return None
+
+
+def _get_executor() -> Optional[Executor]:
+    global _executor
+    if settings.FACE_ENCODING_WORKERS <= 0:
+        return None
+
+    with _executor_lock:
+        if _executor is None:
+            # spawn, not fork: the server process runs threads
+            _executor = ProcessPoolExecutor(
+                max_workers=settings.FACE_ENCODING_WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_warm_up,
+            )
+        return _executor
+
+
+async def _run_limited(function, argument):
+    """
+    Run a function in the worker pool without blocking the event loop. At
+    most FACE_ENCODING_MAX_PENDING images are queued or being processed at
+    once; callers wait up to FACE_ENCODING_QUEUE_TIMEOUT_SECONDS for a slot
+    and then get a 503. With FACE_ENCODING_WORKERS=0 the function runs in a
+    thread instead.
+    """
+    global _pending
+    if _pending is None:
+        _pending = asyncio.Semaphore(max(settings.FACE_ENCODING_MAX_PENDING, 1))
+
+    try:
+        await asyncio.wait_for(_pending.acquire(), timeout=settings.FACE_ENCODING_QUEUE_TIMEOUT_SECONDS)
+    except asyncio.TimeoutError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail="Too many photos are being processed, please try again shortly",
+        )
+
+    try:
+        executor = _get_executor()
+        if executor is None:
+            return await asyncio.to_thread(function, argument)
+        return await asyncio.get_running_loop().run_in_executor(executor, function, argument)
+    finally:
+        _pending.release()
+
+
+async def encode_faces_async(path: str) -> List[DetectedFace]:
+    """Encode the faces of an image file in the worker pool, as encode_faces."""
+    return await _run_limited(encode_faces, path)
+
+
+async def process_photo_async(path: str) -> List[DetectedFace]:
+    """Write the variants of a saved photo and encode its faces in the worker pool, as process_photo."""
+    return await _run_limited(process_photo, path)
+
+
+def process_files(paths: List[str]) -> List[Optional[List[DetectedFace]]]:
+    """
+    Run process_photo over saved image files across the worker pool, for
+    bulk imports. The workers read the files themselves, so image bytes
+    never pass through this process. None marks a file that could not be
+    read or decoded. Blocks until the whole batch is done.
+    """
+    executor = _get_executor()
+    if executor is None:
+        return [_process_file(path) for path in paths]
+    return list(executor.map(_process_file, paths))
+
+
+def start():
+    """Start the worker processes so their models are loaded before the first upload."""
+    executor = _get_executor()
+    if executor is not None:
+        for _ in range(settings.FACE_ENCODING_WORKERS):
+            executor.submit(_warm_up)
+
+
+def shutdown():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown(wait=False, cancel_futures=True)
+            _executor = None
@@ -0,0 +1,206 @@
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import FaceEncoding
+from app.services.face_encoding_cache import (
+    FACE_ENCODING_DIMENSION,
+    encoded_faces_version,
+    load_user_encodings,
+    rank_photo_matches,
+)
+
+
+# Face indexes are stored beside the text indexes
+FACE_INDEX_SUBDIR = "faces"
+
+
+class FaceIndex:
+    """
+    Per-user FAISS L2 indexes over the 128-d face encodings, keyed by face
+    id, for libraries too large to scan. Indexes are persisted under
+    FAISS_INDEX_PATH/faces, kept in memory once loaded, and updated on photo
+    create and delete. Like FaceEncodingCache, the index is rebuilt from the
+    database whenever the count or highest id of the user's faces no longer
+    matches it.
+
+    Updates are written to disk in batches: after FACE_INDEX_SAVE_MAX_PENDING
+    changed faces, or FACE_INDEX_SAVE_INTERVAL_SECONDS after the first
+    unsaved change, and at shutdown. A file that missed changes is rebuilt
+    from the database when it is next loaded, so nothing is lost on a crash.
+    """
+
+    def __init__(self):
+        self._indexes: Dict[int, faiss.IndexIDMap2] = {}
+        # Faces changed since each user's index was last saved
+        self._unsaved: Dict[int, int] = {}
+        self._user_locks: Dict[int, threading.Lock] = {}
+        self._save_timer: Optional[threading.Timer] = None
+        self._lock = threading.Lock()
+
+
+    def _get_index_path(self, user_id: int) -> Path:
+        face_dir = Path(settings.FAISS_INDEX_PATH) / FACE_INDEX_SUBDIR
+        face_dir.mkdir(parents=True, exist_ok=True)
+        return face_dir / f"user_{user_id}.index"
+
+
+    def _user_lock(self, user_id: int) -> threading.Lock:
+        # Held while a user's index is searched, changed or written to disk
+        with self._lock:
+            return self._user_locks.setdefault(user_id, threading.Lock())
+
+
+    def _index_version(self, index: faiss.IndexIDMap2) -> Tuple[int, int]:
+        if index.ntotal == 0:
+            return 0, 0
+        return index.ntotal, int(faiss.vector_to_array(index.id_map).max())
+
+
+    def _save(self, user_id: int, index: faiss.IndexIDMap2):
+        index_path = self._get_index_path(user_id)
+        tmp_path = index_path.with_name(index_path.name + ".tmp")
+        faiss.write_index(index, str(tmp_path))
+        os.replace(tmp_path, index_path)
+
+
+    def _build(self, user_id: int, db: Session) -> faiss.IndexIDMap2:
+        face_ids, _, matrix = load_user_encodings(user_id, db)
+        index = faiss.IndexIDMap2(faiss.IndexFlatL2(FACE_ENCODING_DIMENSION))
+        if len(face_ids):
+            index.add_with_ids(matrix, face_ids)
+        self._save(user_id, index)
+        print(f"Built face index for user {user_id} with {index.ntotal} faces")
+        return index
+
+
+    def get(self, user_id: int, db: Session) -> faiss.IndexIDMap2:
+        version = encoded_faces_version(user_id, db)
+        with self._lock:
+            index = self._indexes.get(user_id)
+        if index is not None:
+            with self._user_lock(user_id):
+                if self._index_version(index) == version:
+                    return index
+
+        # Another process may have saved a newer index
+        index = None
+        index_path = self._get_index_path(user_id)
+        if index_path.exists():
+            try:
+                index = faiss.read_index(str(index_path))
+            except Exception as e:
+                print(f"Error loading face index for user {user_id}: {e}")
+
+        if index is None or self._index_version(index) != version:
+            index = self._build(user_id, db)
+
+        with self._lock:
+            self._indexes[user_id] = index
+            self._unsaved.pop(user_id, None)
+        return index
+
+
+    def _changed(self, user_id: int, count: int):
+        """Record unsaved changes and save now or schedule a save."""
+        with self._lock:
+            self._unsaved[user_id] = self._unsaved.get(user_id, 0) + count
+            save_now = self._unsaved[user_id] >= settings.FACE_INDEX_SAVE_MAX_PENDING
+            if not save_now and self._save_timer is None:
+                self._save_timer = threading.Timer(settings.FACE_INDEX_SAVE_INTERVAL_SECONDS, self.flush)
+                self._save_timer.daemon = True
+                self._save_timer.start()
+        if save_now:
+            self._save_user(user_id)
+
+
+    def _save_user(self, user_id: int):
+        with self._lock:
+            index = self._indexes.get(user_id)
+            if self._unsaved.pop(user_id, None) is None or index is None:
+                return
+        try:
+            with self._user_lock(user_id):
+                self._save(user_id, index)
+        except Exception as e:
+            print(f"Error saving face index for user {user_id}: {e}")
+
+
+    def flush(self):
+        """Write every index with unsaved changes to disk."""
+        with self._lock:
+            self._save_timer = None
+            user_ids = list(self._unsaved)
+        for user_id in user_ids:
+            self._save_user(user_id)
+
+
+    def add(self, user_id: int, faces: Iterable[FaceEncoding]):
+        """Add a new photo's faces if the user's index is loaded."""
+        faces = list(faces)
+        with self._lock:
+            index = self._indexes.get(user_id)
+        if index is None or not faces:
+            return
+        vectors = np.vstack([np.frombuffer(face.encoding, dtype=np.float32) for face in faces])
+        with self._user_lock(user_id):
+            index.add_with_ids(vectors, np.array([face.id for face in faces], dtype=np.int64))
+        self._changed(user_id, len(faces))
+
+
+    def remove(self, user_id: int, face_ids: Iterable[int]):
+        """Remove a deleted photo's faces if the user's index is loaded."""
+        with self._lock:
+            index = self._indexes.get(user_id)
+        if index is None:
+            return
+        with self._user_lock(user_id):
+            removed = index.remove_ids(np.array(list(face_ids), dtype=np.int64))
+        if removed:
+            self._changed(user_id, removed)
+
+
+    def search(
+        self, user_id: int, query_encodings: np.ndarray, db: Session, tolerance: float, max_results: int
+    ) -> List[List[Tuple[int, float]]]:
+        """
+        For each query face, return up to max_results (photo id, distance)
+        pairs within tolerance, closest first, using one radius search for
+        every query face. FAISS reports squared L2 distances, so the radius
+        is tolerance squared.
+        """
+        queries = np.asarray(query_encodings, dtype=np.float32).reshape(-1, FACE_ENCODING_DIMENSION)
+        index = self.get(user_id, db)
+        if index.ntotal == 0:
+            return [[] for _ in queries]
+
+        # Searched under the user's lock, as an add or remove may be resizing the index
+        with self._user_lock(user_id):
+            limits, distances, face_ids = index.range_search(queries, tolerance * tolerance)
+        distances = np.sqrt(np.maximum(distances, 0))
+
+        # The index only knows faces; look up their photos in one query
+        photo_by_face = dict(
+            db.query(FaceEncoding.id, FaceEncoding.photo_id)
+            .filter(FaceEncoding.id.in_(np.unique(face_ids).tolist()))
+            .all()
+        ) if len(face_ids) else {}
+
+        results = []
+        for position in range(len(queries)):
+            hits = slice(limits[position], limits[position + 1])
+            photo_ids = np.array([photo_by_face.get(int(face_id), -1) for face_id in face_ids[hits]], dtype=np.int64)
+            # Faces deleted by another process since the index was loaded are skipped
+            known = photo_ids >= 0
+            results.append(rank_photo_matches(photo_ids[known], distances[hits][known], max_results))
+        return results
+
+
+# Shared by every request in this process
+face_index = FaceIndex()
@@ -0,0 +1,103 @@
+from typing import List, Tuple
+
+import face_recognition  # type: ignore[import-untyped]
+import numpy as np
+from PIL import Image
+
+from app.core.config import settings
+from app.services.image_service import load_image
+
+
+# (top, right, bottom, left) in pixels, as used by face_recognition
+FaceLocation = Tuple[int, int, int, int]
+
+# Context kept around a detected face when cropping it for encoding, as a
+# fraction of the face size; the landmark model needs the whole jawline
+FACE_CROP_MARGIN = 0.5
+
+
+def detect_faces(image: Image.Image) -> List[FaceLocation]:
+    """
+    Find the faces of an image on a copy downsampled to
+    FACE_DETECTION_MAX_DIMENSION, using FACE_DETECTION_MODEL and
+    FACE_DETECTION_UPSAMPLE. Locations are returned in the coordinates of
+    the full image.
+    """
+    width, height = image.size
+    max_dimension = settings.FACE_DETECTION_MAX_DIMENSION
+    scale = 1.0
+    small = image
+    if max_dimension > 0 and max(width, height) > max_dimension:
+        scale = max(width, height) / max_dimension
+        small = image.resize(
+            (max(round(width / scale), 1), max(round(height / scale), 1)),
+            Image.BILINEAR,
+            reducing_gap=2.0,
+        )
+
+    locations = face_recognition.face_locations(
+        np.asarray(small),
+        number_of_times_to_upsample=settings.FACE_DETECTION_UPSAMPLE,
+        model=settings.FACE_DETECTION_MODEL,
+    )
+    return [
+        (
+            max(int(top * scale), 0),
+            min(int(round(right * scale)), width),
+            min(int(round(bottom * scale)), height),
+            max(int(left * scale), 0),
+        )
+        for top, right, bottom, left in locations
+    ]
+
+
+def encode_face(image: Image.Image, location: FaceLocation) -> np.ndarray:
+    """
+    Encode one detected face from a crop around it. Faces larger than
+    FACE_ENCODING_FACE_SIZE are scaled down to it first: the encoder works
+    on a 150px face chip, so extra resolution only costs time.
+    """
+    top, right, bottom, left = location
+    face_size = max(bottom - top, right - left, 1)
+    margin = int(face_size * FACE_CROP_MARGIN)
+    box = (
+        max(left - margin, 0),
+        max(top - margin, 0),
+        min(right + margin, image.width),
+        min(bottom + margin, image.height),
+    )
+    crop = image.crop(box)
+    crop_location = (top - box[1], right - box[0], bottom - box[1], left - box[0])
+
+    target_size = settings.FACE_ENCODING_FACE_SIZE
+    if target_size > 0 and face_size > target_size:
+        ratio = target_size / face_size
+        crop = crop.resize(
+            (max(round(crop.width * ratio), 1), max(round(crop.height * ratio), 1)),
+            Image.BILINEAR,
+        )
+        crop_location = tuple(int(round(value * ratio)) for value in crop_location)
+
+    return face_recognition.face_encodings(
+        np.asarray(crop),
+        known_face_locations=[crop_location],
+        num_jitters=settings.FACE_ENCODING_JITTERS,
+    )[0]
+
+
+def find_faces(image: Image.Image) -> List[Tuple[FaceLocation, np.ndarray]]:
+    """Location and encoding of every face in a decoded image, in detection order."""
+    return [(location, encode_face(image, location)) for location in detect_faces(image)]
+
+
+def process_image(image_bytes: bytes) -> List[Tuple[FaceLocation, np.ndarray]]:
+    """
+    Decode an image and return the location and encoding of every face in
+    it, in detection order. Raises ValueError if the image cannot be decoded.
+    """
+    try:
+        image = load_image(image_bytes)
+    except Exception as e:
+        raise ValueError(f"Unable to decode image: {e}")
+
+    return find_faces(image)
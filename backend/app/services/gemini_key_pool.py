@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+from collections import deque
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple, Union
+
+from google.ai import generativelanguage as glm
+from google.api_core import exceptions as google_exceptions
+
+from app.core.config import settings
+
+
+# Window over which recent requests and tokens count towards a key's load
+LOAD_WINDOW_SECONDS = 60
+
+# How often the keys file is checked for changes
+KEYS_FILE_CHECK_SECONDS = 5
+
+
+def _preview(api_key: str) -> str:
+    return api_key[:10] + "..." if len(api_key) > 10 else "***"
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """Whether an API error means the key ran out of quota."""
+    if isinstance(error, google_exceptions.ResourceExhausted):
+        return True
+    message = str(error)
+    return "429" in message or "quota" in message.lower()
+
+
+class GeminiKeyState:
+    """Usage accounting and a dedicated API client for one key."""
+
+    def __init__(self, api_key: str):
+        self.api_key = api_key
+        self.preview = _preview(api_key)
+        self.in_flight = 0
+        self.total_requests = 0
+        self.total_tokens = 0
+        self.errors = 0
+        self.rate_limited = 0
+        self.consecutive_rate_limits = 0
+        self.cooldown_until = 0.0
+        # (timestamp, tokens) of requests within LOAD_WINDOW_SECONDS
+        self.recent: Deque[Tuple[float, int]] = deque()
+        self._client = None
+
+
+    @property
+    def client(self) -> glm.GenerativeServiceClient:
+        if self._client is None:
+            self._client = glm.GenerativeServiceClient(client_options={"api_key": self.api_key})
+        return self._client
+
+
+    def prune(self, now: float):
+        while self.recent and self.recent[0][0] < now - LOAD_WINDOW_SECONDS:
+            self.recent.popleft()
+
+
+    def load(self) -> Tuple[int, int, int]:
+        return self.in_flight, len(self.recent), sum(tokens for _, tokens in self.recent)
+
+
+class GeminiKeyPool:
+    """
+    Spreads Gemini requests over all configured API keys. Each request goes
+    to the least loaded key (fewest requests in flight, then fewest requests
+    and tokens in the last minute). A key that returns 429 cools down for
+    GEMINI_KEY_COOLDOWN_SECONDS, doubling on repeated quota errors, and the
+    request is retried on another key.
+
+    Keys come from GEMINI_API_KEY, GEMINI_API_KEYS and GEMINI_API_KEYS_FILE
+    (one key per line). The file is re-read when it changes, so keys can be
+    added or removed without a restart.
+    """
+
+    def __init__(self):
+        self._keys: Dict[str, GeminiKeyState] = {}
+        self._lock = threading.Lock()
+        self._keys_file_mtime: Optional[int] = None
+        self._next_file_check = 0.0
+        self.reload()
+
+
+    def _configured_keys(self) -> List[str]:
+        keys = [settings.GEMINI_API_KEY, *settings.GEMINI_API_KEYS]
+
+        keys_file = settings.GEMINI_API_KEYS_FILE
+        if keys_file and os.path.exists(keys_file):
+            with open(keys_file) as f:
+                keys.extend(line.split("#", 1)[0] for line in f)
+
+        return list(dict.fromkeys(key.strip() for key in keys if key and key.strip()))
+
+
+    def reload(self) -> int:
+        """
+        Re-read the configured keys. Accounting of keys that are still
+        configured is kept. Returns the number of keys.
+        """
+        try:
+            keys = self._configured_keys()
+        except Exception as e:
+            print(f"Error reading Gemini API keys: {e}")
+            return len(self._keys)
+
+        keys_file = settings.GEMINI_API_KEYS_FILE
+        with self._lock:
+            self._keys = {key: self._keys.get(key) or GeminiKeyState(key) for key in keys}
+            self._keys_file_mtime = (
+                os.stat(keys_file).st_mtime_ns if keys_file and os.path.exists(keys_file) else None
+            )
+
+        if keys:
+            print(f"Gemini key pool loaded {len(keys)} keys: {', '.join(_preview(key) for key in keys)}")
+        else:
+            print("Warning: no Gemini API key configured (GEMINI_API_KEY / GEMINI_API_KEYS)")
+        return len(keys)
+
+
+    def _reload_if_changed(self):
+        keys_file = settings.GEMINI_API_KEYS_FILE
+        now = time.monotonic()
+        if not keys_file or now < self._next_file_check:
+            return
+        self._next_file_check = now + KEYS_FILE_CHECK_SECONDS
+
+        mtime = os.stat(keys_file).st_mtime_ns if os.path.exists(keys_file) else None
+        if mtime != self._keys_file_mtime:
+            self.reload()
+
+
+    def has_keys(self) -> bool:
+        return bool(self._keys)
+
+
+    def _acquire(self, excluded: set) -> GeminiKeyState:
+        self._reload_if_changed()
+
+        with self._lock:
+            if not self._keys:
+                raise RuntimeError("No Gemini API key configured")
+
+            now = time.monotonic()
+            available = [
+                state for state in self._keys.values()
+                if state.cooldown_until <= now and state.api_key not in excluded
+            ]
+            if not available:
+                raise RuntimeError("All Gemini API keys are cooling down after quota errors (429)")
+
+            for state in available:
+                state.prune(now)
+            state = min(available, key=GeminiKeyState.load)
+            state.in_flight += 1
+            return state
+
+
+    def _release(self, state: GeminiKeyState, tokens: int = 0, error: Optional[Exception] = None):
+        with self._lock:
+            now = time.monotonic()
+            state.in_flight -= 1
+            state.total_requests += 1
+            state.total_tokens += tokens
+            state.recent.append((now, tokens))
+
+            if error is None:
+                state.consecutive_rate_limits = 0
+            elif is_rate_limit_error(error):
+                state.rate_limited += 1
+                state.consecutive_rate_limits += 1
+                cooldown = min(
+                    settings.GEMINI_KEY_COOLDOWN_SECONDS * 2 ** (state.consecutive_rate_limits - 1),
+                    settings.GEMINI_KEY_MAX_COOLDOWN_SECONDS,
+                )
+                state.cooldown_until = now + cooldown
+                print(f"Gemini key {state.preview} hit its quota, cooling down for {cooldown}s")
+            else:
+                state.errors += 1
+
+
+    def run(self, request: Callable[[glm.GenerativeServiceClient], Any], tokens: Union[int, Callable[[Any], int]] = 0) -> Any:
+        """
+        Run request(client) with the client of the least loaded key. On a
+        quota error the key cools down and the request is retried on the
+        next key. tokens is the request's token count, or a function that
+        reads it from the response.
+        """
+        tried: set = set()
+        while True:
+            state = self._acquire(tried)
+            tried.add(state.api_key)
+            try:
+                result = request(state.client)
+            except Exception as e:
+                self._release(state, error=e)
+                if is_rate_limit_error(e) and len(tried) < len(self._keys):
+                    continue
+                raise
+
+            try:
+                used_tokens = tokens(result) if callable(tokens) else tokens
+            except Exception:
+                used_tokens = 0
+            self._release(state, tokens=used_tokens)
+            return result
+
+
+    def stats(self) -> List[Dict[str, Any]]:
+        """Per-key usage, without exposing the keys themselves."""
+        with self._lock:
+            now = time.monotonic()
+            stats = []
+            for state in self._keys.values():
+                state.prune(now)
+                in_flight, recent_requests, recent_tokens = state.load()
+                stats.append({
+                    "key": state.preview,
+                    "in_flight": in_flight,
+                    "requests_last_minute": recent_requests,
+                    "tokens_last_minute": recent_tokens,
+                    "total_requests": state.total_requests,
+                    "total_tokens": state.total_tokens,
+                    "rate_limited": state.rate_limited,
+                    "errors": state.errors,
+                    "cooldown_seconds": max(round(state.cooldown_until - now), 0),
+                })
+            return stats
+
+
+# Shared by every service that calls Gemini
+key_pool = GeminiKeyPool()
@@ -0,0 +1,101 @@
+import io
+import os
+from pathlib import Path, PurePosixPath
+from typing import Dict
+
+from PIL import Image, ImageOps
+
+from app.core.config import settings
+
+
+# Display sizes stored beside each original photo
+PHOTO_VARIANTS = ("thumbnail", "medium")
+VARIANT_SUFFIX = ".webp"
+
+# Width of the perceptual hash grid; the hash has this many bits squared
+PERCEPTUAL_HASH_SIZE = 8
+
+
+def _upright_rgb(image: Image.Image) -> Image.Image:
+    # Phone cameras store the rotation in EXIF instead of rotating the pixels
+    image = ImageOps.exif_transpose(image)
+    return image.convert("RGB")
+
+
+def load_image(image_bytes: bytes) -> Image.Image:
+    """Decode an image once, upright and in RGB."""
+    return _upright_rgb(Image.open(io.BytesIO(image_bytes)))
+
+
+def open_image(path: Path) -> Image.Image:
+    """Decode an image file once, upright and in RGB."""
+    with Image.open(path) as image:
+        return _upright_rgb(image)
+
+
+def perceptual_hash(path: Path) -> int:
+    """
+    Difference hash of an image file: it is shrunk to a grayscale grid one
+    pixel wider than PERCEPTUAL_HASH_SIZE and each bit records whether a
+    pixel is brighter than its left neighbour. Photos of the same scene
+    differ in only a few bits. JPEGs are decoded at reduced scale, so this
+    takes a few milliseconds even for camera-sized files.
+    """
+    grid = (PERCEPTUAL_HASH_SIZE + 1, PERCEPTUAL_HASH_SIZE)
+    with Image.open(path) as image:
+        image.draft("L", (grid[0] * 8, grid[1] * 8))
+        small = ImageOps.exif_transpose(image).convert("L").resize(grid, Image.Resampling.BOX)
+
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(grid[1]):
+        for column in range(PERCEPTUAL_HASH_SIZE):
+            left = pixels[row * grid[0] + column]
+            value = (value << 1) | (pixels[row * grid[0] + column + 1] > left)
+    return value
+
+
+def variant_path(image_path: str, variant: str) -> str:
+    """Relative path of a photo's variant, e.g. memory_photos/<id>.thumbnail.webp."""
+    return str(PurePosixPath(image_path).with_suffix(f".{variant}{VARIANT_SUFFIX}"))
+
+
+def existing_variants(image_path: str, upload_root: Path) -> Dict[str, str]:
+    """Relative paths of the variants that have been generated for a photo."""
+    paths = {variant: variant_path(image_path, variant) for variant in PHOTO_VARIANTS}
+    return {variant: path for variant, path in paths.items() if (upload_root / path).exists()}
+
+
+def save_variants(image: Image.Image, original_path: Path):
+    """
+    Write the medium and thumbnail variants of a decoded photo beside the
+    original as WebP, each fitted within PHOTO_MEDIUM_SIZE and
+    PHOTO_THUMBNAIL_SIZE. Files are written under a temporary name and
+    moved into place, so a half-written variant is never served.
+    """
+    sizes = {"medium": settings.PHOTO_MEDIUM_SIZE, "thumbnail": settings.PHOTO_THUMBNAIL_SIZE}
+    variant = image
+    # Largest first, so the thumbnail is scaled from the medium image
+    for name, size in sorted(sizes.items(), key=lambda item: -item[1]):
+        variant = variant.copy()
+        variant.thumbnail((size, size), Image.BICUBIC)
+
+        destination = original_path.with_suffix(f".{name}{VARIANT_SUFFIX}")
+        tmp_path = destination.with_name(destination.name + ".tmp")
+        variant.save(tmp_path, format="WEBP", quality=settings.PHOTO_VARIANT_QUALITY)
+        os.replace(tmp_path, destination)
+
+
+def generate_variants(original_path: Path) -> bool:
+    """Create the variants of a stored photo. Returns False if it cannot be decoded."""
+    try:
+        save_variants(open_image(original_path), original_path)
+        return True
+    except Exception as e:
+        print(f"Error generating variants for {original_path}: {e}")
+        return False
+
+
+def delete_variants(original_path: Path):
+    for variant in PHOTO_VARIANTS:
+        original_path.with_suffix(f".{variant}{VARIANT_SUFFIX}").unlink(missing_ok=True)
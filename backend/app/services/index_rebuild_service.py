@@ -0,0 +1,212 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional, Set
+
+from sqlalchemy.orm import Session, undefer
+
+from app.core.config import settings
+from app.models.models import Document, DocumentChunkRecord, PrecomputedAnswer
+from app.services.document_service import DocumentChunk
+from app.services.embedding_retry_service import record_embedding_results
+from app.services.vector_service import VectorService
+
+
+# Rebuilt indexes are staged here, beside the live ones, until they are complete
+REBUILD_STAGING_SUBDIR = "rebuild"
+
+# Users with a rebuild running in this process
+_rebuilds_in_progress: Set[int] = set()
+_rebuilds_lock = threading.Lock()
+
+
+def _load_pending_chunks(user_id: int, done_chunk_ids: Set[int], db: Session) -> List[DocumentChunk]:
+    records = (
+        db.query(DocumentChunkRecord)
+        .options(undefer(DocumentChunkRecord.content), undefer(DocumentChunkRecord.chunk_metadata))
+        .filter(DocumentChunkRecord.user_id == user_id)
+        .order_by(DocumentChunkRecord.document_id, DocumentChunkRecord.ordinal)
+        .all()
+    )
+    return [
+        DocumentChunk(record.content, record.chunk_metadata or {}, chunk_id=record.id)
+        for record in records
+        if record.id not in done_chunk_ids
+    ]
+
+
+def is_rebuild_running(user_id: int) -> bool:
+    with _rebuilds_lock:
+        return user_id in _rebuilds_in_progress
+
+
+def list_users_with_chunks(db: Session) -> List[int]:
+    """Ids of all users that have stored document chunks."""
+    rows = db.query(DocumentChunkRecord.user_id).distinct().order_by(DocumentChunkRecord.user_id).all()
+    return [row.user_id for row in rows]
+
+
+def rebuild_user_index(
+    user_id: int,
+    db: Session,
+    *,
+    vector_service: Optional[VectorService] = None,
+    batch_size: Optional[int] = None,
+    workers: Optional[int] = None,
+    restart: bool = False,
+) -> Dict[str, Any]:
+    """
+    Rebuild a user's FAISS index from the chunks stored in the database.
+
+    The new index is built in a staging directory beside the live one and
+    saved after every batch, so an interrupted rebuild resumes where it
+    stopped (pass restart=True to discard the staged progress). Batches are
+    embedded by a pool of worker threads. Once every chunk is indexed the
+    staged files are swapped in as a new version of the user's data and the
+    chunk rows are updated, both under the user's write lock.
+    """
+    with _rebuilds_lock:
+        if user_id in _rebuilds_in_progress:
+            raise RuntimeError(f"A rebuild is already running for user {user_id}")
+        _rebuilds_in_progress.add(user_id)
+
+    try:
+        return _rebuild_user_index(user_id, db, vector_service, batch_size, workers, restart)
+    finally:
+        with _rebuilds_lock:
+            _rebuilds_in_progress.discard(user_id)
+
+
+def _rebuild_user_index(
+    user_id: int,
+    db: Session,
+    vector_service: Optional[VectorService],
+    batch_size: Optional[int],
+    workers: Optional[int],
+    restart: bool,
+) -> Dict[str, Any]:
+    live = vector_service or VectorService()
+    staging = VectorService(faiss_dir=live.faiss_dir / REBUILD_STAGING_SUBDIR)
+    batch_size = batch_size or settings.INDEX_REBUILD_BATCH_SIZE
+    workers = workers or settings.INDEX_REBUILD_WORKERS
+
+    if restart:
+        staging.delete_user_data(user_id)
+
+    staged_metadata = staging.load_user_metadata(user_id)
+    staged_index = staging.load_user_index(user_id)
+    if staged_index is None or staged_index.ntotal != len(staged_metadata):
+        # Interrupted between writing the index and its metadata
+        if staged_index is not None or staged_metadata:
+            print(f"Discarding inconsistent staged rebuild for user {user_id}")
+            staging.delete_user_data(user_id)
+        staged_metadata = []
+
+    done_chunk_ids = {entry.get('chunk_id') for entry in staged_metadata}
+    resumed_from = len(done_chunk_ids)
+    if resumed_from:
+        print(f"Resuming rebuild for user {user_id} after {resumed_from} chunks")
+
+    # Loop until no chunks are left, which also picks up documents that
+    # were uploaded while the rebuild was running. Chunks that fail to embed
+    # are not retried here; they go to the embedding retry queue afterwards.
+    failed_chunks: List[DocumentChunk] = []
+    while True:
+        _index_pending_chunks(user_id, db, live, staging, done_chunk_ids, failed_chunks, batch_size, workers)
+
+        # Writers to the live index hold its lock until their chunk rows are
+        # updated, so with the lock held no upload can land in the old index
+        # after this final scan; uploads still waiting for it find their
+        # chunks in the new index
+        with live.user_write_lock(user_id):
+            if _load_pending_chunks(user_id, done_chunk_ids | {chunk.chunk_id for chunk in failed_chunks}, db):
+                continue
+            return _swap_in_rebuild(user_id, db, live, staging, done_chunk_ids, failed_chunks, resumed_from)
+
+
+def _index_pending_chunks(
+    user_id: int,
+    db: Session,
+    live: VectorService,
+    staging: VectorService,
+    done_chunk_ids: Set[int],
+    failed_chunks: List[DocumentChunk],
+    batch_size: int,
+    workers: int,
+):
+    while True:
+        chunks = _load_pending_chunks(user_id, done_chunk_ids | {chunk.chunk_id for chunk in failed_chunks}, db)
+        if not chunks:
+            return
+
+        batches = [chunks[start:start + batch_size] for start in range(0, len(chunks), batch_size)]
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as pool:
+            embedded_batches = pool.map(
+                lambda batch: live.get_gemini_embeddings([chunk.content for chunk in batch]),
+                batches,
+            )
+            for batch, embeddings in zip(batches, embedded_batches):
+                index_ids = staging.add_documents_to_index(user_id, batch, embeddings=embeddings)
+                for chunk, index_id in zip(batch, index_ids):
+                    if index_id is None:
+                        failed_chunks.append(chunk)
+                    else:
+                        done_chunk_ids.add(chunk.chunk_id)
+                print(f"Rebuild for user {user_id}: {len(done_chunk_ids)} chunks indexed")
+
+
+def _swap_in_rebuild(
+    user_id: int,
+    db: Session,
+    live: VectorService,
+    staging: VectorService,
+    done_chunk_ids: Set[int],
+    failed_chunks: List[DocumentChunk],
+    resumed_from: int,
+) -> Dict[str, Any]:
+    legacy_documents = (
+        db.query(Document.id)
+        .filter(Document.user_id == user_id, ~Document.chunks.any())
+        .count()
+    )
+    if legacy_documents:
+        print(f"Warning: {legacy_documents} documents of user {user_id} have no stored chunks and were skipped")
+
+    if not done_chunk_ids:
+        return {
+            "user_id": user_id,
+            "chunks_indexed": 0,
+            "chunks_failed": len(failed_chunks),
+            "resumed_from": 0,
+            "skipped_documents": legacy_documents,
+        }
+
+    live.swap_in_user_data(user_id, staging)
+
+    try:
+        metadata = live.load_user_metadata(user_id)
+        db.bulk_update_mappings(DocumentChunkRecord, [
+            {
+                "id": entry['chunk_id'],
+                "embedding_status": "indexed",
+                "index_id": entry['index_id'],
+                "next_embedding_attempt_at": None,
+            }
+            for entry in metadata
+            if entry.get('chunk_id') is not None
+        ])
+        record_embedding_results(failed_chunks, [None] * len(failed_chunks), db)
+        # Precomputed answers were matched with the old embeddings
+        db.query(PrecomputedAnswer).filter(PrecomputedAnswer.user_id == user_id).delete()
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"Error updating chunk rows after rebuild for user {user_id}: {e}")
+        raise
+
+    return {
+        "user_id": user_id,
+        "chunks_indexed": len(metadata),
+        "chunks_failed": len(failed_chunks),
+        "resumed_from": resumed_from,
+        "skipped_documents": legacy_documents,
+    }
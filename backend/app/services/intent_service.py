@@ -0,0 +1,343 @@
+import re
+from datetime import date, datetime, time
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from app.models.models import Reminder, User
+from app.services import emergency_service, medication_service
+
+
+# Confidence of answers read from the record a fact belongs to, and of
+# answers found in a secondary record (e.g. the doctor named on a medication)
+RECORD_CONFIDENCE = 0.9
+SECONDARY_RECORD_CONFIDENCE = 0.7
+
+MEDICATION_WORDS = r"(?:medications?|medicines?|pills?|meds|tablets?)"
+
+# Each pattern has to match the whole question, once polite framing and
+# trailing punctuation are removed, so questions that merely mention a fact
+# ("what did my doctor say about my medication") are left to RAG. Questions
+# are expected to be lower-cased with collapsed whitespace (see
+# RAGService.preprocess_query).
+INTENT_PATTERNS = [
+    ("next_medication", re.compile(
+        rf"(?:when(?:'?s| is)|what(?:'?s| is)) my next (?:dose|{MEDICATION_WORDS})"
+        rf"|when (?:do|should) i (?:take|have) my (?:next )?(?:dose|{MEDICATION_WORDS})(?: next)?"
+        rf"|what (?:dose|{MEDICATION_WORDS}) (?:do i take|is) next"
+        rf"|when is my {MEDICATION_WORDS} due"
+    )),
+    ("medications", re.compile(
+        rf"(?:what|which) {MEDICATION_WORDS} (?:do|should) i (?:take|be taking)(?: every day| daily| each day)?"
+        rf"|what (?:{MEDICATION_WORDS}) am i (?:on|taking)"
+        rf"|what are my {MEDICATION_WORDS}"
+        rf"|(?:list|show me) my {MEDICATION_WORDS}"
+    )),
+    ("doctor_phone", re.compile(
+        r"what(?:'?s| is) my doctor'?s (?:(?:phone|telephone)(?: number)?|number)"
+        r"|how (?:do|can) i (?:call|reach|contact) my doctor"
+    )),
+    ("doctor", re.compile(
+        r"who(?:'?s| is) my doctor"
+        r"|what(?:'?s| is) my doctor'?s name"
+    )),
+    ("allergies", re.compile(
+        r"what am i allergic to"
+        r"|am i allergic to anything"
+        r"|what are my allergies"
+        r"|do i have (?:any )?allergies"
+    )),
+    ("emergency_contact", re.compile(
+        r"who (?:should|do|can) i call(?: in an emergency| for help| if i need help)?"
+        r"|who(?:'?s| is| are) my emergency contacts?"
+        r"|what(?:'?s| is) my emergency contact(?: number)?"
+    )),
+    ("next_reminder", re.compile(
+        r"(?:what|when)(?:'?s| is) my next (?:reminder|appointment)"
+        r"|what (?:reminders|appointments) do i have(?: today| next)?"
+        r"|what do i have (?:to do )?(?:today|next)"
+        r"|do i have any (?:reminders|appointments)(?: today)?"
+    )),
+    ("address", re.compile(
+        r"what(?:'?s| is) my (?:home )?address"
+        r"|where do i live"
+        r"|where(?:'?s| is) my home"
+    )),
+    ("phone", re.compile(
+        r"what(?:'?s| is) my (?:(?:phone|telephone|mobile|cell)(?: number)?|number)"
+    )),
+    ("birthday", re.compile(
+        r"(?:when|what)(?:'?s| is) my (?:birthday|date of birth)"
+        r"|when was i born"
+    )),
+    ("name", re.compile(
+        r"what(?:'?s| is) my name"
+        r"|who am i"
+    )),
+]
+
+# A question embedded in a request ("can you tell me what my address is"),
+# turned back into its direct form ("what is my address") before matching
+EMBEDDED_QUESTION_PATTERN = re.compile(r"(what|who|where|when) (my .+) (is|are)")
+
+# Polite framing around a question, removed before matching
+LEADING_FILLER_PATTERN = re.compile(
+    r"^(?:(?:please|hey|hi|hello|ok|okay|so)\b[ ,]*"
+    r"|(?:can|could|would) you (?:please )?(?:tell|remind) me[ ,]*"
+    r"|(?:do you know|tell me|remind me)[ ,]*)+"
+)
+TRAILING_FILLER_PATTERN = re.compile(r"(?:[ ,]*\b(?:please|again|now))*[\s?.!]*$")
+
+# Questions about what already happened ("when did i last take my pills")
+# are never answered from schedules
+PAST_TENSE_PATTERN = re.compile(r"\b(?:did|last|yesterday|ago|already|missed|forgot|took|taken|earlier)\b")
+
+# Questions about someone else ("my daughter's address") are left to RAG
+OTHER_PERSON_PATTERN = re.compile(
+    r"\b(daughter|son|wife|husband|mother|mom|father|dad|brother|sister|friend|children|kids|"
+    r"grand\w*|niece|nephew|aunt|uncle|cousin|neighbou?r)s?'?s?\b"
+)
+
+
+def _strip_filler(question: str) -> str:
+    question = TRAILING_FILLER_PATTERN.sub("", question)
+    return LEADING_FILLER_PATTERN.sub("", question).strip(" ,")
+
+
+def classify_intent(question: str) -> Optional[str]:
+    """
+    Map a preprocessed question to a structured-data intent, if the whole
+    question asks for that fact. Anything else returns None.
+    """
+    if OTHER_PERSON_PATTERN.search(question) or PAST_TENSE_PATTERN.search(question):
+        return None
+
+    question = _strip_filler(question)
+    embedded = EMBEDDED_QUESTION_PATTERN.fullmatch(question)
+    if embedded:
+        question = f"{embedded[1]} {embedded[3]} {embedded[2]}"
+    for intent, pattern in INTENT_PATTERNS:
+        if pattern.fullmatch(question):
+            return intent
+    return None
+
+
+def _format_time(value: time) -> str:
+    return value.strftime("%I:%M %p").lstrip("0")
+
+
+def _parse_time(value) -> Optional[time]:
+    if isinstance(value, time):
+        return value
+    if isinstance(value, str):
+        try:
+            parts = [int(part) for part in value.split(":")[:2]]
+            return time(parts[0], parts[1] if len(parts) > 1 else 0)
+        except (ValueError, IndexError):
+            return None
+    return None
+
+
+def _join_names(names: List[str]) -> str:
+    if len(names) <= 1:
+        return "".join(names)
+    return ", ".join(names[:-1]) + " and " + names[-1]
+
+
+def _quick_fact(user_id: int, key: str, db: Session) -> Optional[str]:
+    user = db.query(User).filter(User.id == user_id).first()
+    facts = (user.quick_facts if user else None) or {}
+    return facts.get(key) or None
+
+
+# An answer and how much it can be trusted
+Answer = Tuple[str, float]
+
+
+def _answer_name(user_id: int, db: Session) -> Optional[Answer]:
+    name = _quick_fact(user_id, "name", db)
+    confidence = RECORD_CONFIDENCE
+    if not name:
+        emergency_info = emergency_service.get_emergency_info(user_id, db)
+        name = emergency_info.person_name if emergency_info else None
+        confidence = SECONDARY_RECORD_CONFIDENCE
+    if not name:
+        return None
+    return f"Your name is {name}.", confidence
+
+
+def _answer_address(user_id: int, db: Session) -> Optional[Answer]:
+    address = _quick_fact(user_id, "address", db)
+    confidence = RECORD_CONFIDENCE
+    if not address:
+        emergency_info = emergency_service.get_emergency_info(user_id, db)
+        address = emergency_info.home_address if emergency_info else None
+        confidence = SECONDARY_RECORD_CONFIDENCE
+    if not address:
+        return None
+    return f"You live at {address}. That is your home.", confidence
+
+
+def _answer_phone(user_id: int, db: Session) -> Optional[Answer]:
+    phone = _quick_fact(user_id, "phone", db)
+    if not phone:
+        return None
+    return f"Your phone number is {phone}.", RECORD_CONFIDENCE
+
+
+def _answer_birthday(user_id: int, db: Session) -> Optional[Answer]:
+    birthday = _quick_fact(user_id, "birthday", db)
+    if not birthday:
+        return None
+    try:
+        birthday = datetime.strptime(birthday, "%Y-%m-%d").strftime("%B %d, %Y").replace(" 0", " ")
+    except ValueError:
+        pass
+    return f"Your birthday is {birthday}.", RECORD_CONFIDENCE
+
+
+def _doctor_details(user_id: int, db: Session):
+    """Doctor's name and phone, and the confidence of the record they came from."""
+    emergency_info = emergency_service.get_emergency_info(user_id, db)
+    if emergency_info and emergency_info.doctor_name:
+        return emergency_info.doctor_name, emergency_info.doctor_phone, RECORD_CONFIDENCE
+
+    for medication in medication_service.list_medications(user_id, db):
+        if medication.doctor_name:
+            return medication.doctor_name, None, SECONDARY_RECORD_CONFIDENCE
+    return None, None, None
+
+
+def _answer_doctor(user_id: int, db: Session) -> Optional[Answer]:
+    doctor_name, doctor_phone, confidence = _doctor_details(user_id, db)
+    if not doctor_name:
+        return None
+    answer = f"Your doctor is {doctor_name}."
+    if doctor_phone:
+        answer += f" You can call them at {doctor_phone}."
+    return answer, confidence
+
+
+def _answer_doctor_phone(user_id: int, db: Session) -> Optional[Answer]:
+    doctor_name, doctor_phone, confidence = _doctor_details(user_id, db)
+    if not doctor_phone:
+        return None
+    return f"You can call your doctor, {doctor_name}, at {doctor_phone}.", confidence
+
+
+def _answer_allergies(user_id: int, db: Session) -> Optional[Answer]:
+    emergency_info = emergency_service.get_emergency_info(user_id, db)
+    if not emergency_info or not emergency_info.allergies:
+        return None
+    return (
+        f"You are allergic to {emergency_info.allergies}. Please tell your doctor or nurse about this.",
+        RECORD_CONFIDENCE,
+    )
+
+
+def _answer_emergency_contact(user_id: int, db: Session) -> Optional[Answer]:
+    emergency_info = emergency_service.get_emergency_info(user_id, db)
+    contacts = (emergency_info.emergency_contacts if emergency_info else None) or []
+    if not contacts:
+        return None
+    contact = contacts[0]
+    answer = f"You can call {contact.get('name')}"
+    if contact.get("relationship"):
+        answer += f", your {contact['relationship']},"
+    answer += f" at {contact.get('phone')}."
+    if len(contacts) > 1:
+        others = _join_names([other.get("name") for other in contacts[1:] if other.get("name")])
+        if others:
+            answer += f" You can also call {others}."
+    return answer, RECORD_CONFIDENCE
+
+
+def _answer_medications(user_id: int, db: Session) -> Optional[Answer]:
+    medications = medication_service.list_medications(user_id, db)
+    if not medications:
+        return None
+    lines = ["Here are your medications:"]
+    for medication in medications:
+        line = f"{medication.name}, {medication.dosage}"
+        if medication.purpose:
+            line += f", for {medication.purpose}"
+        lines.append(line)
+    return "\n".join(lines), RECORD_CONFIDENCE
+
+
+def _answer_next_medication(user_id: int, db: Session) -> Optional[Answer]:
+    medications = medication_service.list_medications(user_id, db)
+    now = datetime.now().time()
+
+    doses = []
+    for medication in medications:
+        dose_times = [_parse_time(value) for value in (medication.times or [])] or [medication.time]
+        for dose_time in dose_times:
+            if dose_time is not None:
+                doses.append((dose_time, medication))
+    if not doses:
+        return None
+
+    later_today = [dose for dose in doses if dose[0] >= now]
+    next_time = min(dose[0] for dose in (later_today or doses))
+    when = "today" if later_today else "tomorrow"
+    due = _join_names([
+        f"{medication.name} ({medication.dosage})"
+        for dose_time, medication in doses if dose_time == next_time
+    ])
+    return f"Your next medication is {due}, {when} at {_format_time(next_time)}.", RECORD_CONFIDENCE
+
+
+def _answer_next_reminder(user_id: int, db: Session) -> Optional[Answer]:
+    now = datetime.now()
+    reminders = (
+        db.query(Reminder)
+        .filter(
+            Reminder.user_id == user_id,
+            Reminder.status == "pending",
+            Reminder.date >= now.date(),
+        )
+        .order_by(Reminder.date.asc(), Reminder.time.asc())
+        .all()
+    )
+    for reminder in reminders:
+        if reminder.time is None or datetime.combine(reminder.date, reminder.time) >= now:
+            when = "today" if reminder.date == date.today() else reminder.date.strftime("on %A, %B %d").replace(" 0", " ")
+            answer = f"Your next reminder is {reminder.title}, {when}"
+            if reminder.time is not None:
+                answer += f" at {_format_time(reminder.time)}"
+            return answer + ".", RECORD_CONFIDENCE
+    return None
+
+
+INTENT_HANDLERS = {
+    "name": _answer_name,
+    "address": _answer_address,
+    "phone": _answer_phone,
+    "birthday": _answer_birthday,
+    "doctor": _answer_doctor,
+    "doctor_phone": _answer_doctor_phone,
+    "allergies": _answer_allergies,
+    "emergency_contact": _answer_emergency_contact,
+    "medications": _answer_medications,
+    "next_medication": _answer_next_medication,
+    "next_reminder": _answer_next_reminder,
+}
+
+
+def answer_structured_question(question: str, user_id: int, db: Session) -> Optional[Answer]:
+    """
+    Answer a personal-fact question directly from the user's stored data.
+    Returns the answer and its confidence, or None when the question has no
+    structured intent or the data is missing, so the caller can fall back
+    to RAG.
+    """
+    intent = classify_intent(question)
+    if intent is None:
+        return None
+
+    try:
+        return INTENT_HANDLERS[intent](user_id, db)
+    except Exception as e:
+        print(f"Error answering structured question for user {user_id}: {e}")
+        return None
@@ -1,19 +1,37 @@
-import io
+import asyncio
 import os
+import tempfile
+import threading
 from pathlib import Path
-from typing import List, Tuple
+from typing import List, Set, Tuple
 from uuid import uuid4
 
-import face_recognition  # type: ignore[import-untyped]
 import numpy as np
 from fastapi import HTTPException, UploadFile, status
 from sqlalchemy.orm import Session
 
-from app.models.models import MemoryPhoto
+from app.core.config import settings
+from app.models.models import FaceEncoding, MemoryPhoto, VoiceNote
+from app.services import face_encoding_pool, image_service, person_service, upload_service
+from app.services.face_encoding_pool import DetectedFace
+from app.services.face_encoding_cache import encoded_faces_version, face_encoding_cache
+from app.services.face_index_service import face_index
+from app.services.search_result_cache import search_result_cache
+from app.services.upload_service import SavedUpload
 
 
 MEMORY_UPLOAD_SUBDIR = "memory_photos"
 
+# Photos whose variants are being generated in this process
+_variants_in_progress: Set[str] = set()
+_variants_lock = threading.Lock()
+
+
+def _face_matcher():
+    # Both matchers rebuild from the database if they missed a change, so
+    # only the one in use needs to be kept up to date
+    return face_index if settings.FACE_INDEX_ENABLED else face_encoding_cache
+
 
 def _ensure_directory(root_dir: Path) -> Path:
     upload_dir = root_dir / MEMORY_UPLOAD_SUBDIR
@@ -21,38 +39,82 @@ def _ensure_directory(root_dir: Path) -> Path:
     return upload_dir
 
 
-def _save_file(upload_dir: Path, file: UploadFile) -> str:
-    suffix = Path(file.filename or "").suffix or ".jpg"
-    filename = f"{uuid4().hex}{suffix}"
-    destination = upload_dir / filename
-    with destination.open("wb") as buffer:
-        buffer.write(file.file.read())
-    # Reset file pointer for callers that reuse the object
-    file.file.seek(0)
-    # Return relative path so we can build URLs later
-    return f"{MEMORY_UPLOAD_SUBDIR}/{filename}"
+def new_photo_path(upload_root: Path, suffix: str) -> Tuple[Path, str]:
+    """Unique destination for a new photo, and the relative path stored for it."""
+    filename = f"{uuid4().hex}{suffix or '.jpg'}"
+    # Relative paths let us build URLs later
+    return _ensure_directory(upload_root) / filename, f"{MEMORY_UPLOAD_SUBDIR}/{filename}"
 
 
-def _encode_face(file: UploadFile) -> bytes | None:
-    image_bytes = file.file.read()
-    file.file.seek(0)
+def build_memory_photo(
+    *,
+    user_id: int,
+    image_path: str,
+    description: str | None,
+    faces: List[DetectedFace],
+    saved: SavedUpload | None = None,
+) -> MemoryPhoto:
+    """A new, unsaved memory photo with a FaceEncoding row for each face."""
+    memory = MemoryPhoto(
+        user_id=user_id,
+        image_path=image_path,
+        description=description,
+        content_hash=saved.sha256 if saved else None,
+        file_size=saved.size if saved else None,
+    )
+    for (top, right, bottom, left), encoding in faces:
+        memory.faces.append(FaceEncoding(
+            user_id=user_id,
+            box_top=top,
+            box_right=right,
+            box_bottom=bottom,
+            box_left=left,
+            encoding=encoding,
+        ))
+    return memory
+
+
+def index_photo_faces(user_id: int, memories: List[MemoryPhoto]):
+    """Add the faces of newly committed photos to the face matcher."""
+    search_result_cache.invalidate(user_id)
+    faces = [face for memory in memories for face in memory.faces]
+    if faces:
+        _face_matcher().add(user_id, faces)
+
+
+async def _save_query_file(file: UploadFile, query_dir: Path) -> Path:
+    saved = await asyncio.to_thread(
+        upload_service.save_upload,
+        file,
+        query_dir,
+        default_suffix=".jpg",
+        max_bytes=settings.MAX_PHOTO_UPLOAD_BYTES,
+    )
+    if not saved.size:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Invalid image file",
+        )
+    return saved.path
 
-    if not image_bytes:
-        return None
 
+async def _encode_query_file(path: Path) -> List[DetectedFace]:
     try:
-        image = face_recognition.load_image_file(io.BytesIO(image_bytes))
-    except Exception:
-        return None
+        return await face_encoding_pool.encode_faces_async(str(path))
+    except ValueError:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail="Unable to process image",
+        )
 
-    encodings = face_recognition.face_encodings(image)
-    if not encodings:
-        return None
 
-    return encodings[0].tobytes()
+async def encode_query_faces(file: UploadFile) -> List[DetectedFace]:
+    """Box and encoding of every face in a search photo; empty if it has none."""
+    with tempfile.TemporaryDirectory() as query_dir:
+        return await _encode_query_file(await _save_query_file(file, Path(query_dir)))
 
 
-def create_memory_photo(
+async def create_memory_photo(
     *,
     user_id: int,
     description: str | None,
@@ -60,22 +122,43 @@ def create_memory_photo(
     upload_root: Path,
     db: Session,
 ) -> MemoryPhoto:
-    upload_dir = _ensure_directory(upload_root)
-    relative_path = _save_file(upload_dir, file)
-    encoding = _encode_face(file)
+    saved = await asyncio.to_thread(
+        upload_service.save_upload,
+        file,
+        _ensure_directory(upload_root),
+        default_suffix=".jpg",
+        max_bytes=settings.MAX_PHOTO_UPLOAD_BYTES,
+    )
+    relative_path = f"{MEMORY_UPLOAD_SUBDIR}/{saved.path.name}"
 
-    memory = MemoryPhoto(
-        user_id=user_id,
-        image_path=relative_path,
-        description=description,
-        face_encoding=encoding,
+    # The pool decodes the saved photo once for its variants and faces
+    try:
+        faces = await face_encoding_pool.process_photo_async(str(saved.path))
+    except ValueError:
+        faces = []
+    except Exception:
+        saved.path.unlink(missing_ok=True)
+        image_service.delete_variants(saved.path)
+        raise
+
+    memory = build_memory_photo(
+        user_id=user_id, image_path=relative_path, description=description, faces=faces, saved=saved
     )
-    db.add(memory)
-    db.commit()
-    db.refresh(memory)
+    await asyncio.to_thread(_add_memory_photo, user_id, memory, db)
+
+    index_photo_faces(user_id, [memory])
     return memory
 
 
+def _add_memory_photo(user_id: int, memory: MemoryPhoto, db: Session):
+    # Blocks on the person lock and the commit, so it runs off the event loop
+    with person_service.person_lock(user_id):
+        db.add(memory)
+        person_service.assign_faces(user_id, memory.faces, db)
+        db.commit()
+    db.refresh(memory)
+
+
 def list_memory_photos(*, user_id: int, db: Session) -> List[MemoryPhoto]:
     return (
         db.query(MemoryPhoto)
@@ -85,56 +168,131 @@ def list_memory_photos(*, user_id: int, db: Session) -> List[MemoryPhoto]:
     )
 
 
-def find_matching_memories(
-    *,
-    user_id: int,
-    file: UploadFile,
-    db: Session,
-    tolerance: float = 0.6,
-    max_results: int = 10,
-) -> List[Tuple[MemoryPhoto, float]]:
-    query_bytes = file.file.read()
-    file.file.seek(0)
-
-    if not query_bytes:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Invalid image file",
-        )
+def generate_missing_variants(image_paths: List[str], upload_root: Path):
+    """
+    Create the display variants of photos uploaded before variants existed.
+    Runs as a background task after the first request that lists them.
+    """
+    with _variants_lock:
+        pending = [path for path in image_paths if path not in _variants_in_progress]
+        _variants_in_progress.update(pending)
 
     try:
-        image = face_recognition.load_image_file(io.BytesIO(query_bytes))
-        query_encodings = face_recognition.face_encodings(image)
-    except Exception:
-        raise HTTPException(
-            status_code=status.HTTP_400_BAD_REQUEST,
-            detail="Unable to process image",
-        )
+        for image_path in pending:
+            image_service.generate_variants(upload_root / image_path)
+    finally:
+        with _variants_lock:
+            _variants_in_progress.difference_update(pending)
+
+
+def delete_memory_photo(*, photo_id: int, user_id: int, upload_root: Path, db: Session) -> None:
+    memory = (
+        db.query(MemoryPhoto)
+        .filter(MemoryPhoto.id == photo_id, MemoryPhoto.user_id == user_id)
+        .first()
+    )
+    if memory is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Memory photo not found")
+
+    face_ids = [face.id for face in memory.faces]
+
+    # Voice notes attached to the photo stay, without the link
+    db.query(VoiceNote).filter(VoiceNote.memory_id == photo_id).update({VoiceNote.memory_id: None})
+    with person_service.person_lock(user_id):
+        person_service.remove_faces(memory.faces, db)
+        db.delete(memory)
+        db.commit()
+
+    file_path = upload_root / memory.image_path
+    if file_path.exists():
+        file_path.unlink()
+    image_service.delete_variants(file_path)
 
+    _face_matcher().remove(user_id, face_ids)
+    search_result_cache.invalidate(user_id)
+
+
+def _match_photo_ids(
+    user_id: int, query_encodings: List[bytes], db: Session, tolerance: float, max_results: int
+) -> List[List[Tuple[int, float]]]:
     if not query_encodings:
         return []
+    queries = np.vstack([np.frombuffer(encoding, dtype=np.float32) for encoding in query_encodings])
+    return _face_matcher().search(user_id, queries, db, tolerance=tolerance, max_results=max_results)
 
-    query_encoding = query_encodings[0]
 
-    candidates = (
-        db.query(MemoryPhoto)
-        .filter(
-            MemoryPhoto.user_id == user_id,
-            MemoryPhoto.face_encoding.isnot(None),
-        )
-        .all()
+def _load_matched_photos(
+    face_matches: List[List[Tuple[int, float]]], db: Session
+) -> List[List[Tuple[MemoryPhoto, float]]]:
+    # Only the matched photos are loaded as ORM objects
+    photo_ids = {photo_id for matches in face_matches for photo_id, _ in matches}
+    photos = {
+        photo.id: photo
+        for photo in db.query(MemoryPhoto).filter(MemoryPhoto.id.in_(photo_ids))
+    } if photo_ids else {}
+    return [
+        [(photos[photo_id], distance) for photo_id, distance in matches if photo_id in photos]
+        for matches in face_matches
+    ]
+
+
+def find_matching_memories(
+    *,
+    user_id: int,
+    query_encodings: List[bytes],
+    db: Session,
+    tolerance: float = 0.6,
+    max_results: int = 10,
+) -> List[List[Tuple[MemoryPhoto, float]]]:
+    """
+    Match every face of a search photo against the user's stored faces in
+    one batched search. Returns the matching photos and distances of each
+    query face, closest first.
+    """
+    return _load_matched_photos(
+        _match_photo_ids(user_id, query_encodings, db, tolerance, max_results), db
     )
 
-    matches: List[Tuple[MemoryPhoto, float]] = []
-    for candidate in candidates:
-        if candidate.face_encoding is None:
-            continue
 
-        stored_encoding = np.frombuffer(candidate.face_encoding, dtype=np.float64)
-        distance = face_recognition.face_distance([stored_encoding], query_encoding)[0]
-        if distance <= tolerance:
-            matches.append((candidate, float(distance)))
+async def search_memory_photos(
+    *,
+    user_id: int,
+    file: UploadFile,
+    db: Session,
+    tolerance: float = 0.6,
+    max_results: int = 10,
+) -> Tuple[List[DetectedFace], List[List[Tuple[MemoryPhoto, float]]]]:
+    """
+    Encode the faces of a search photo and match them as
+    find_matching_memories. A photo that looks like one the user searched
+    for moments ago, such as the same framed picture seen by the camera
+    again, reuses that search's faces and matches from the search result
+    cache instead of being encoded again.
+    """
+    options = (tolerance, max_results)
+    with tempfile.TemporaryDirectory() as query_dir:
+        path = await _save_query_file(file, Path(query_dir))
+        try:
+            image_hash = await asyncio.to_thread(image_service.perceptual_hash, path)
+        except Exception:
+            # Undecodable files get their error from the encoder
+            image_hash = None
 
-    matches.sort(key=lambda item: item[1])
-    return matches[:max_results]
+        # Read before encoding, so a result that raced a library change is
+        # recorded under the old version and never served
+        version = encoded_faces_version(user_id, db)
+        cached = (
+            search_result_cache.get(user_id, image_hash, options, version)
+            if image_hash is not None else None
+        )
+        if cached is not None:
+            query_faces, face_matches = cached
+        else:
+            query_faces = await _encode_query_file(path)
+            face_matches = _match_photo_ids(
+                user_id, [encoding for _, encoding in query_faces], db, tolerance, max_results
+            )
+            if image_hash is not None:
+                search_result_cache.put(user_id, image_hash, options, version, (query_faces, face_matches))
 
+    return query_faces, _load_matched_photos(face_matches, db)
@@ -0,0 +1,218 @@
+import threading
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+from fastapi import HTTPException, status
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.models.models import FaceEncoding, MemoryPhoto, Person, VoiceNote
+from app.services.face_encoding_cache import FACE_ENCODING_DIMENSION
+
+
+# Clusters whose faces are compared with a query after the centroid pass
+CANDIDATE_PERSONS = 2
+
+# Per-user locks serialising centroid updates in this process
+_person_locks: Dict[int, threading.Lock] = {}
+_person_locks_guard = threading.Lock()
+
+
+def _vector(encoding: bytes) -> np.ndarray:
+    return np.frombuffer(encoding, dtype=np.float32)
+
+
+def person_lock(user_id: int) -> threading.Lock:
+    """
+    The lock serialising changes to a user's persons in this process. Hold
+    it from assign_faces or remove_faces until the session commits, so two
+    uploads cannot both update a centroid from the same starting value.
+    Person rows are also locked FOR UPDATE, which serialises processes on
+    databases that support it.
+    """
+    with _person_locks_guard:
+        return _person_locks.setdefault(user_id, threading.Lock())
+
+
+def _load_persons(user_id: int, db: Session, for_update: bool = False) -> Tuple[List[Person], np.ndarray]:
+    query = db.query(Person).filter(Person.user_id == user_id).order_by(Person.id)
+    if for_update:
+        # Re-read the rows under the lock rather than trusting the session
+        query = query.with_for_update().populate_existing()
+    persons = query.all()
+    centroids = np.empty((len(persons), FACE_ENCODING_DIMENSION), dtype=np.float32)
+    for position, person in enumerate(persons):
+        centroids[position] = _vector(person.centroid)
+    return persons, centroids
+
+
+def assign_faces(user_id: int, faces: Iterable[FaceEncoding], db: Session):
+    """
+    Put each new face in the person cluster with the nearest centroid
+    within PERSON_CLUSTER_THRESHOLD, updating that centroid as a running
+    mean, or start a new person for it. Only touches the session; the
+    caller commits with the faces while holding person_lock(user_id).
+    """
+    persons, centroids = _load_persons(user_id, db, for_update=True)
+    for face in faces:
+        encoding = _vector(face.encoding)
+        best = None
+        if persons:
+            distances = np.linalg.norm(centroids - encoding, axis=1)
+            best = int(np.argmin(distances))
+            if distances[best] > settings.PERSON_CLUSTER_THRESHOLD:
+                best = None
+
+        if best is None:
+            person = Person(user_id=user_id, centroid=encoding.tobytes(), face_count=1)
+            db.add(person)
+            persons.append(person)
+            centroids = np.vstack([centroids, encoding])
+        else:
+            person = persons[best]
+            centroids[best] += (encoding - centroids[best]) / (person.face_count + 1)
+            person.centroid = centroids[best].tobytes()
+            person.face_count += 1
+        face.person = person
+
+
+def remove_faces(faces: Iterable[FaceEncoding], db: Session):
+    """
+    Take deleted faces out of their clusters' running means. Unnamed persons
+    left without faces or voice notes are deleted. Only touches the session;
+    the caller commits while holding person_lock for the faces' user.
+    """
+    faces = list(faces)
+    person_ids = {face.person_id for face in faces if face.person_id is not None}
+    if person_ids:
+        db.query(Person).filter(Person.id.in_(person_ids)).with_for_update().populate_existing().all()
+
+    for face in faces:
+        person = face.person
+        if person is None:
+            continue
+        face.person = None
+        if person.face_count > 1:
+            centroid = _vector(person.centroid)
+            centroid = (centroid * person.face_count - _vector(face.encoding)) / (person.face_count - 1)
+            person.centroid = centroid.astype(np.float32).tobytes()
+        person.face_count = max(person.face_count - 1, 0)
+
+        if person.face_count == 0 and not person.name:
+            has_voice_notes = db.query(VoiceNote.id).filter(
+                VoiceNote.user_id == person.user_id, VoiceNote.person_id == str(person.id)
+            ).first() is not None
+            if not has_voice_notes:
+                db.delete(person)
+
+
+def cluster_unassigned_faces(user_id: int, db: Session) -> int:
+    """Cluster a user's faces that have no person yet, oldest first. Returns how many were assigned."""
+    with person_lock(user_id):
+        faces = (
+            db.query(FaceEncoding)
+            .filter(FaceEncoding.user_id == user_id, FaceEncoding.person_id.is_(None))
+            .order_by(FaceEncoding.id)
+            .all()
+        )
+        assign_faces(user_id, faces, db)
+        db.commit()
+    return len(faces)
+
+
+def identify_faces(
+    *, user_id: int, query_encodings: List[bytes], db: Session, tolerance: float = 0.6
+) -> List[Optional[Tuple[Person, float]]]:
+    """
+    Find the person shown by each query face. The query is compared with
+    every person's centroid, then with the individual faces of the
+    CANDIDATE_PERSONS nearest clusters, so the cost grows with the number of
+    people rather than photos. Returns the person and the distance to their
+    closest face, or None when no face is within tolerance.
+    """
+    persons, centroids = _load_persons(user_id, db)
+    if not query_encodings or not persons:
+        return [None for _ in query_encodings]
+
+    queries = np.vstack([_vector(encoding) for encoding in query_encodings])
+
+    centroid_distances = np.linalg.norm(centroids[None, :, :] - queries[:, None, :], axis=2)
+    candidates = np.argsort(centroid_distances, axis=1)[:, :CANDIDATE_PERSONS]
+
+    # Faces of every candidate cluster, loaded in one query
+    candidate_ids = {persons[position].id for position in candidates.flatten()}
+    faces_by_person: Dict[int, List[np.ndarray]] = {}
+    for person_id, encoding in (
+        db.query(FaceEncoding.person_id, FaceEncoding.encoding)
+        .filter(FaceEncoding.person_id.in_(candidate_ids))
+    ):
+        faces_by_person.setdefault(person_id, []).append(_vector(encoding))
+
+    results: List[Optional[Tuple[Person, float]]] = []
+    for query, positions in zip(queries, candidates):
+        best = None
+        for position in positions:
+            person = persons[position]
+            encodings = faces_by_person.get(person.id)
+            if not encodings:
+                continue
+            distance = float(np.linalg.norm(np.vstack(encodings) - query, axis=1).min())
+            if distance <= tolerance and (best is None or distance < best[1]):
+                best = (person, distance)
+        results.append(best)
+    return results
+
+
+def get_person(*, person_id: int, user_id: int, db: Session) -> Person:
+    person = db.query(Person).filter(Person.id == person_id, Person.user_id == user_id).first()
+    if person is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Person not found")
+    return person
+
+
+def list_persons(*, user_id: int, db: Session) -> List[Person]:
+    """A user's persons, most photographed first."""
+    return (
+        db.query(Person)
+        .filter(Person.user_id == user_id, Person.face_count > 0)
+        .order_by(Person.face_count.desc(), Person.id)
+        .all()
+    )
+
+
+def cover_photos(persons: List[Person], db: Session) -> Dict[int, MemoryPhoto]:
+    """The earliest photo of each person, keyed by person id."""
+    if not persons:
+        return {}
+    first_photo_ids = dict(
+        db.query(FaceEncoding.person_id, func.min(FaceEncoding.photo_id))
+        .filter(FaceEncoding.person_id.in_([person.id for person in persons]))
+        .group_by(FaceEncoding.person_id)
+        .all()
+    )
+    photos = {
+        photo.id: photo
+        for photo in db.query(MemoryPhoto).filter(MemoryPhoto.id.in_(list(first_photo_ids.values())))
+    }
+    return {
+        person_id: photos[photo_id]
+        for person_id, photo_id in first_photo_ids.items()
+        if photo_id in photos
+    }
+
+
+def list_person_photos(*, person: Person, db: Session) -> List[MemoryPhoto]:
+    return (
+        db.query(MemoryPhoto)
+        .filter(MemoryPhoto.faces.any(FaceEncoding.person_id == person.id))
+        .order_by(MemoryPhoto.created_at.desc())
+        .all()
+    )
+
+
+def rename_person(*, person: Person, name: Optional[str], db: Session) -> Person:
+    person.name = name.strip() if name and name.strip() else None
+    db.commit()
+    db.refresh(person)
+    return person
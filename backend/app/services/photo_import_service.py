@@ -0,0 +1,292 @@
+import os
+import shutil
+import zipfile
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import BinaryIO, List, NamedTuple, Set, Tuple
+
+from fastapi import HTTPException, UploadFile, status
+from sqlalchemy.orm import Session
+
+from app.core.config import settings
+from app.db.database import SessionLocal
+from app.models.models import MemoryPhoto, PhotoImportJob
+from app.services import face_encoding_pool, image_service, memory_service, person_service
+from app.services.upload_service import SavedUpload, stream_to_file
+
+
+# Uploads are staged here, one directory per job, until they are imported
+IMPORT_STAGING_SUBDIR = "imports"
+
+PHOTO_SUFFIXES = {".jpg", ".jpeg", ".png", ".webp"}
+
+# Failed file names kept on the job
+MAX_RECORDED_ERRORS = 50
+
+class StagedFile(NamedTuple):
+    path: str  # In the staging directory
+    name: str  # As uploaded
+    upload: SavedUpload
+
+
+def _staging_dir(upload_root: Path, job_id: int) -> Path:
+    return upload_root / IMPORT_STAGING_SUBDIR / str(job_id)
+
+
+def _is_photo(name: str) -> bool:
+    path = Path(name)
+    # macOS archives carry a resource fork beside every photo
+    if "__MACOSX" in path.parts or path.name.startswith("._"):
+        return False
+    return path.suffix.lower() in PHOTO_SUFFIXES
+
+
+def _import_too_large() -> HTTPException:
+    return HTTPException(
+        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+        detail=f"An import can hold at most {settings.PHOTO_IMPORT_MAX_BYTES // (1024 * 1024)} MB of photos",
+    )
+
+
+def _check_archive(name: str, members: List[zipfile.ZipInfo], files_left: int, bytes_left: int):
+    """
+    Reject an archive from its directory before extracting anything: too
+    many photos or more uncompressed bytes than the job has left, or a member
+    compressed far better than photos can be (a zip bomb). The sizes are
+    only declared, so staging still counts the bytes actually extracted.
+    """
+    if len(members) > files_left:
+        raise HTTPException(
+            status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+            detail=f"At most {settings.PHOTO_IMPORT_MAX_FILES} photos can be imported at once",
+        )
+    if sum(member.file_size for member in members) > bytes_left:
+        raise _import_too_large()
+    for member in members:
+        if member.file_size > settings.PHOTO_IMPORT_MAX_COMPRESSION_RATIO * max(member.compress_size, 1):
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail=f"{name} contains {member.filename}, which is compressed too well to be a photo",
+            )
+
+
+def stage_uploads(files: List[UploadFile], staging_dir: Path) -> List[StagedFile]:
+    """
+    Stream uploaded photos, and the photos inside uploaded zip archives,
+    into a staging directory, hashing them on the way. Other files are
+    skipped. Raises HTTPException when an archive is invalid or
+    suspiciously compressed, a photo is larger than MAX_PHOTO_UPLOAD_BYTES,
+    the photos add up to more than PHOTO_IMPORT_MAX_BYTES or there are
+    more than PHOTO_IMPORT_MAX_FILES of them.
+    """
+    staging_dir.mkdir(parents=True, exist_ok=True)
+    staged: List[StagedFile] = []
+    staged_bytes = 0
+
+    def stage(source: BinaryIO, name: str):
+        nonlocal staged_bytes
+        if len(staged) >= settings.PHOTO_IMPORT_MAX_FILES:
+            raise HTTPException(
+                status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                detail=f"At most {settings.PHOTO_IMPORT_MAX_FILES} photos can be imported at once",
+            )
+        destination = staging_dir / f"{len(staged):05d}{Path(name).suffix.lower()}"
+        upload = stream_to_file(source, destination, settings.MAX_PHOTO_UPLOAD_BYTES, name)
+        staged.append(StagedFile(str(destination), name, upload))
+        staged_bytes += upload.size
+        if staged_bytes > settings.PHOTO_IMPORT_MAX_BYTES:
+            raise _import_too_large()
+
+    for file in files:
+        name = file.filename or ""
+        if Path(name).suffix.lower() == ".zip":
+            try:
+                with zipfile.ZipFile(file.file) as archive:
+                    members = [
+                        member for member in archive.infolist()
+                        if not member.is_dir() and _is_photo(member.filename)
+                    ]
+                    _check_archive(
+                        name,
+                        members,
+                        settings.PHOTO_IMPORT_MAX_FILES - len(staged),
+                        settings.PHOTO_IMPORT_MAX_BYTES - staged_bytes,
+                    )
+                    for member in members:
+                        with archive.open(member) as source:
+                            stage(source, member.filename)
+            except zipfile.BadZipFile:
+                raise HTTPException(
+                    status_code=status.HTTP_400_BAD_REQUEST,
+                    detail=f"{name} is not a valid zip archive",
+                )
+        elif _is_photo(name):
+            stage(file.file, name)
+
+    return staged
+
+
+def create_import_job(
+    *, user_id: int, files: List[UploadFile], upload_root: Path, db: Session
+) -> Tuple[PhotoImportJob, List[StagedFile]]:
+    """
+    Stage the uploaded photos and record a pending import job for them.
+    Returns the job and the staged files to pass to run_import_job.
+    """
+    job = PhotoImportJob(user_id=user_id, status="pending")
+    db.add(job)
+    db.commit()
+    db.refresh(job)
+
+    staging_dir = _staging_dir(upload_root, job.id)
+    try:
+        staged = stage_uploads(files, staging_dir)
+        if not staged:
+            raise HTTPException(
+                status_code=status.HTTP_400_BAD_REQUEST,
+                detail="No photos found in the upload",
+            )
+    except Exception:
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        db.delete(job)
+        db.commit()
+        raise
+
+    job.total_files = len(staged)
+    db.commit()
+    db.refresh(job)
+    return job, staged
+
+
+def run_import_job(job_id: int, staged: List[StagedFile], upload_root: Path):
+    """
+    Import staged photos in batches of PHOTO_IMPORT_BATCH_SIZE. The face
+    encoding pool encodes the faces of each batch and writes their display
+    variants in parallel, then the batch's photos, faces, person clusters and
+    job progress are committed in one transaction. Runs as a background task with its
+    own session.
+    """
+    db = SessionLocal()
+    try:
+        job = db.query(PhotoImportJob).filter(PhotoImportJob.id == job_id).first()
+        if job is None:
+            return
+        job.status = "running"
+        db.commit()
+
+        errors: List[str] = []
+        # Photos already in the library, or earlier in this import, are skipped
+        seen_hashes: Set[str] = set()
+        batch_size = max(settings.PHOTO_IMPORT_BATCH_SIZE, 1)
+        for start in range(0, len(staged), batch_size):
+            batch = staged[start:start + batch_size]
+
+            existing_hashes = {
+                row.content_hash
+                for row in db.query(MemoryPhoto.content_hash).filter(
+                    MemoryPhoto.user_id == job.user_id,
+                    MemoryPhoto.content_hash.in_([staged_file.upload.sha256 for staged_file in batch]),
+                )
+            }
+            new_files = []
+            for staged_file in batch:
+                if staged_file.upload.sha256 in existing_hashes or staged_file.upload.sha256 in seen_hashes:
+                    continue
+                seen_hashes.add(staged_file.upload.sha256)
+                new_files.append(staged_file)
+
+            # Photos are moved into place first, so the workers write their
+            # variants beside the final file
+            destinations = []
+            for staged_file in new_files:
+                destination, relative_path = memory_service.new_photo_path(upload_root, Path(staged_file.path).suffix)
+                os.replace(staged_file.path, destination)
+                destinations.append((destination, relative_path))
+
+            memories = []
+            try:
+                results = face_encoding_pool.process_files([str(destination) for destination, _ in destinations])
+                for staged_file, (destination, relative_path), faces in zip(new_files, destinations, results):
+                    if faces is None:
+                        errors.append(f"{staged_file.name}: not a readable image")
+                        destination.unlink(missing_ok=True)
+                        continue
+                    memories.append(memory_service.build_memory_photo(
+                        user_id=job.user_id,
+                        image_path=relative_path,
+                        description=None,
+                        faces=faces,
+                        saved=staged_file.upload,
+                    ))
+
+                with person_service.person_lock(job.user_id):
+                    db.add_all(memories)
+                    person_service.assign_faces(
+                        job.user_id, [face for memory in memories for face in memory.faces], db
+                    )
+                    job.processed_files += len(batch)
+                    job.imported_photos += len(memories)
+                    job.duplicate_files += len(batch) - len(new_files)
+                    job.faces_found += sum(len(memory.faces) for memory in memories)
+                    job.failed_files = len(errors)
+                    job.errors = errors[:MAX_RECORDED_ERRORS] or None
+                    db.commit()
+            except Exception:
+                # Nothing of this batch was recorded, so its files go too
+                for destination, _ in destinations:
+                    destination.unlink(missing_ok=True)
+                    image_service.delete_variants(destination)
+                raise
+
+            memory_service.index_photo_faces(job.user_id, memories)
+            print(f"Import job {job_id}: {job.processed_files}/{job.total_files} photos processed")
+
+        job.status = "completed"
+        job.finished_at = datetime.now(timezone.utc)
+        db.commit()
+
+    except Exception as e:
+        db.rollback()
+        print(f"Error running photo import job {job_id}: {e}")
+        job = db.query(PhotoImportJob).filter(PhotoImportJob.id == job_id).first()
+        if job is not None:
+            job.status = "failed"
+            job.errors = ((job.errors or []) + [f"Import stopped: {e}"])[-MAX_RECORDED_ERRORS:]
+            job.finished_at = datetime.now(timezone.utc)
+            db.commit()
+
+    finally:
+        shutil.rmtree(_staging_dir(upload_root, job_id), ignore_errors=True)
+        db.close()
+
+
+def fail_interrupted_jobs(upload_root: Path, db: Session) -> int:
+    """
+    Mark import jobs left pending or running by a previous server process
+    as failed and remove their staging directories. Their staged files
+    were only known to that process, so the jobs can never finish. Call at
+    startup, before any import can start; like the embedding retry worker,
+    this assumes imports run in a single server process. Returns the
+    number of jobs failed.
+    """
+    jobs = db.query(PhotoImportJob).filter(PhotoImportJob.status.in_(["pending", "running"])).all()
+    for job in jobs:
+        job.status = "failed"
+        job.errors = ((job.errors or []) + ["Import stopped: the server restarted"])[-MAX_RECORDED_ERRORS:]
+        job.finished_at = datetime.now(timezone.utc)
+        shutil.rmtree(_staging_dir(upload_root, job.id), ignore_errors=True)
+    db.commit()
+    if jobs:
+        print(f"Marked {len(jobs)} interrupted photo import jobs as failed")
+    return len(jobs)
+
+
+def get_import_job(*, job_id: int, user_id: int, db: Session) -> PhotoImportJob:
+    job = (
+        db.query(PhotoImportJob)
+        .filter(PhotoImportJob.id == job_id, PhotoImportJob.user_id == user_id)
+        .first()
+    )
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Import job not found")
+    return job
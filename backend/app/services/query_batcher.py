@@ -0,0 +1,128 @@
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from app.core.config import settings
+from app.services.vector_service import VectorService
+
+
+class _PendingQuery:
+    __slots__ = ("query", "user_id", "k", "future")
+
+    def __init__(self, query: str, user_id: Optional[int], k: int):
+        self.query = query
+        self.user_id = user_id
+        self.k = k
+        self.future: Future = Future()
+
+
+class QueryBatcher:
+    """
+    Collects queries from concurrent requests for up to
+    RAG_MICROBATCH_WINDOW_MS and serves them together: one batched
+    embedding request for the whole batch and one multi-row FAISS search
+    per user index. Callers block until their own results are ready.
+    """
+
+    def __init__(self, vector_service: VectorService):
+        self.vector_service = vector_service
+        self._pending: List[_PendingQuery] = []
+        self._condition = threading.Condition()
+        self._dispatcher: Optional[threading.Thread] = None
+        self._executor: Optional[ThreadPoolExecutor] = None
+
+
+    def _enabled(self) -> bool:
+        return settings.RAG_MICROBATCH_WINDOW_MS > 0
+
+
+    def _submit(self, query: str, user_id: Optional[int], k: int) -> Any:
+        pending = _PendingQuery(query.strip(), user_id, k)
+        with self._condition:
+            if self._dispatcher is None:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=max(settings.RAG_MICROBATCH_WORKERS, 1),
+                    thread_name_prefix="query-batch",
+                )
+                self._dispatcher = threading.Thread(target=self._dispatch, name="query-batcher", daemon=True)
+                self._dispatcher.start()
+            self._pending.append(pending)
+            self._condition.notify()
+        return pending.future.result()
+
+
+    def get_query_embedding(self, query: str) -> List[float]:
+        """
+        Embed a search query together with other queries arriving at the
+        same time.
+        """
+        if not self._enabled():
+            return self.vector_service.get_query_embedding(query)
+        return self._submit(query, None, 0)
+
+
+    def search(self, query: str, user_id: int, k: int = 3) -> List[Dict[str, Any]]:
+        """
+        Search a user's documents, batched with other concurrent searches.
+        """
+        if not self._enabled():
+            return self.vector_service.search_similar_documents(query, user_id, k=k)
+        return self._submit(query, user_id, k)
+
+
+    def _dispatch(self):
+        window = settings.RAG_MICROBATCH_WINDOW_MS / 1000
+        max_size = max(settings.RAG_MICROBATCH_MAX_SIZE, 1)
+
+        while True:
+            with self._condition:
+                while not self._pending:
+                    self._condition.wait()
+
+                # Give concurrent requests a moment to join the batch
+                deadline = time.monotonic() + window
+                while len(self._pending) < max_size:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                batch = self._pending[:max_size]
+                del self._pending[:max_size]
+
+            self._executor.submit(self._run_batch, batch)
+
+
+    def _run_batch(self, batch: List[_PendingQuery]):
+        try:
+            queries = list(dict.fromkeys(pending.query for pending in batch))
+            embeddings = dict(zip(queries, self.vector_service.get_query_embeddings(queries)))
+
+            searches: Dict[int, List[_PendingQuery]] = defaultdict(list)
+            for pending in batch:
+                if pending.user_id is None:
+                    pending.future.set_result(embeddings[pending.query])
+                else:
+                    searches[pending.user_id].append(pending)
+
+            for user_id, user_batch in searches.items():
+                try:
+                    results = self.vector_service.search_by_embeddings(
+                        [embeddings[pending.query] for pending in user_batch],
+                        user_id,
+                        [pending.k for pending in user_batch],
+                    )
+                    for pending, result in zip(user_batch, results):
+                        pending.future.set_result(result)
+                except Exception as e:
+                    print(f"Error searching documents for user {user_id}: {e}")
+                    for pending in user_batch:
+                        pending.future.set_result([])
+
+        except Exception as e:
+            print(f"Error processing query batch of {len(batch)}: {e}")
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
@@ -1,25 +1,54 @@
+import asyncio
 import re
-from typing import List, Dict, Any, Optional
-import google.generativeai as genai
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+import numpy as np
+from google.ai import generativelanguage as glm
 from sqlalchemy.orm import Session
 from app.core.config import settings
+from app.db.database import SessionLocal
 from app.services.vector_service import VectorService
-from app.models.models import ChatMessage, Document
+from app.models.models import ChatMessage, Document, DocumentChunkRecord, PrecomputedAnswer
 from app.services.document_service import process_pdf, store_document_chunks
+from app.services.embedding_retry_service import record_embedding_results
+from app.services.extractive_service import extract_answer
+from app.services.gemini_key_pool import key_pool
+from app.services.intent_service import answer_structured_question
+from app.services.query_batcher import QueryBatcher
+from app.services.single_flight import SingleFlight
+
+
+# Number of users whose full-corpus context (or its absence) is cached
+CORPUS_CONTEXT_CACHE_SIZE = 256
+
+# Confidence of answers given from the whole corpus: nothing was ranked,
+# so there is no retrieval score to base it on
+LONG_CONTEXT_CONFIDENCE = 0.5
+
+# Last line of a long-context answer, listing the documents it used
+CITED_SOURCES_PATTERN = re.compile(r"\n*\s*sources?\s*:(?P<sources>[^\n]*)\s*$", re.IGNORECASE)
 
 
 class RAGService:
     def __init__(self):
         self.vector_service = VectorService()
+        self.query_batcher = QueryBatcher(self.vector_service)
         
-        # Configure Google Gemini
-        if settings.GEMINI_API_KEY:
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            # Log which key is being used (first 10 chars for security)
-            key_preview = settings.GEMINI_API_KEY[:10] + "..." if len(settings.GEMINI_API_KEY) > 10 else "***"
-            print(f"Gemini API configured with key: {key_preview}")
-        else:
-            print("Warning: GEMINI_API_KEY not set in configuration")
+        # Identical questions asked while an answer is being generated share it
+        self._rag_flights = SingleFlight()
+        
+        # Full-corpus context of small corpora, keyed by user and corpus
+        # version; a user's generation is bumped when their documents change
+        self._corpus_context_cache: OrderedDict = OrderedDict()
+        self._corpus_generations: Dict[int, int] = {}
+        self._corpus_context_lock = threading.Lock()
+        
+        # Background refresh of precomputed answers, one user at a time
+        self._precompute_executor = ThreadPoolExecutor(max_workers=1)
+        self._precompute_pending: set = set()
+        self._precompute_lock = threading.Lock()
 
 
     def preprocess_query(self, query: str) -> str:
@@ -44,8 +73,9 @@ class RAGService:
             # Preprocess the query
             processed_query = self.preprocess_query(query)
             
-            # Search for similar documents (reduced to 2 chunks for faster responses)
-            results = self.vector_service.search_similar_documents(
+            # Search for similar documents (reduced to 2 chunks for faster responses),
+            # batched with searches from concurrent requests
+            results = self.query_batcher.search(
                 processed_query, 
                 user_id, 
                 k=max_chunks
@@ -58,6 +88,25 @@ class RAGService:
             return []
 
 
+    def retrieve_relevant_context_batch(self, queries: List[str], user_id: int, max_chunks: int = 2) -> List[List[Dict[str, Any]]]:
+        """
+        Retrieve relevant document chunks for several queries with a single
+        embedding request and FAISS search.
+        """
+        try:
+            processed_queries = [self.preprocess_query(query) for query in queries]
+            
+            return self.vector_service.search_similar_documents_batch(
+                processed_queries,
+                user_id,
+                k=max_chunks
+            )
+            
+        except Exception as e:
+            print(f"Error retrieving context: {e}")
+            return [[] for _ in queries]
+
+
     def format_context_for_prompt(self, context_results: List[Dict[str, Any]]) -> str:
         """
         Format the retrieved context into a coherent string for the prompt.
@@ -76,10 +125,12 @@ class RAGService:
         return formatted_context
 
 
-    def create_dementia_friendly_prompt(self, query: str, context: str) -> str:
+    def create_dementia_friendly_prompt(self, query: str, context: str, cite_sources: bool = False) -> str:
         """
         Create a prompt optimized for dementia care responses.
         Optimized for speed: shorter, more concise prompt.
+        With cite_sources, the model is asked to end with a "Sources:" line
+        naming the [documents] it used (see _split_cited_sources).
         """
         prompt = f"""You are a caring memory assistant. Answer clearly and warmly using the information provided.
 
@@ -90,9 +141,27 @@ QUESTION: {query}
 
 Provide a clear, warm response in simple language. Use natural paragraph breaks. Be reassuring."""
         
+        if cite_sources:
+            prompt += (
+                '\n\nEnd with one last line "Sources: " followed by the names in square brackets '
+                'of the documents you used, or "Sources: none".'
+            )
+        
         return prompt
 
 
+    def _split_cited_sources(self, response: str, filenames: List[str]) -> Tuple[str, List[str]]:
+        """
+        Remove the "Sources:" line from a long-context answer. Returns the
+        answer and the known document names it cites.
+        """
+        match = CITED_SOURCES_PATTERN.search(response)
+        if match is None:
+            return response, []
+        cited = [filename for filename in filenames if filename.lower() in match.group("sources").lower()]
+        return response[:match.start()].strip(), cited
+
+
     def format_response_text(self, response: str) -> str:
         """
         Clean and format the response text for better readability.
@@ -155,21 +224,32 @@ Provide a clear, warm response in simple language. Use natural paragraph breaks.
 
         return "\n".join([t for t in texts if t]).strip()
 
-    def call_gemini_chat(self, prompt: str) -> str:
+    def call_gemini_chat(self, prompt: str, raise_errors: bool = False) -> str:
         """
         Make a request to Google Gemini for chat completion.
+        API errors are turned into an apology message, or re-raised when
+        raise_errors is set so the caller can fall back to something else.
         """
         try:
             # Use Gemini Flash for fast responses
-            model = genai.GenerativeModel('models/gemini-2.5-flash')
-            
-            response = model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.3,  # Slightly higher for faster responses
-                    max_output_tokens=1024,  # Reduced from 2048 for faster generation
-                    top_p=0.8  # Slightly higher for faster responses
-                )
+            model_name = 'models/gemini-2.5-flash'
+            
+            generation_config = glm.GenerationConfig(
+                temperature=0.3,  # Slightly higher for faster responses
+                max_output_tokens=1024,  # Reduced from 2048 for faster generation
+                top_p=0.8  # Slightly higher for faster responses
+            )
+            request = glm.GenerateContentRequest(
+                model=model_name,
+                contents=[glm.Content(role="user", parts=[glm.Part(text=prompt)])],
+                generation_config=generation_config,
+            )
+            
+            # Sent with the key pool's client for the chosen key; the
+            # response has the same candidates as GenerativeModel's
+            response = key_pool.run(
+                lambda client: client.generate_content(request=request),
+                tokens=lambda response: response.usage_metadata.total_token_count
             )
             
             # Format the response for better readability
@@ -201,6 +281,9 @@ Provide a clear, warm response in simple language. Use natural paragraph breaks.
                     "Gemini returned no textual content. "
                     f"finish_reasons={finish_reasons}, prompt_feedback={getattr(response, 'prompt_feedback', None)}"
                 )
+                if raise_errors:
+                    # An empty answer is a failure the caller can fall back from
+                    raise ValueError("Gemini returned no textual content")
                 return (
                     "I'm sorry, I couldn't generate a helpful answer right now. "
                     "Please try asking again in a moment."
@@ -215,66 +298,521 @@ Provide a clear, warm response in simple language. Use natural paragraph breaks.
             
             # Check if it's a quota error
             if "429" in error_msg or "quota" in error_msg.lower() or "Quota exceeded" in error_msg:
-                print(f"⚠️  QUOTA ERROR: The current API key has exceeded its quota limits.")
-                print(f"   Current key preview: {settings.GEMINI_API_KEY[:10] + '...' if settings.GEMINI_API_KEY else 'NOT SET'}")
-                print(f"   Please check your Gemini API quota or use a different API key.")
-                print(f"   Make sure to restart the backend server after updating the .env file.")
+                print(f"⚠️  QUOTA ERROR: Every configured API key has exceeded its quota limits.")
+                print(f"   Please check your Gemini API quota or add keys to GEMINI_API_KEYS_FILE (no restart needed).")
+                if raise_errors:
+                    raise
                 return "I'm currently experiencing high demand. Please try again in a few moments, or contact support if this persists."
             
+            if raise_errors:
+                raise
             return "I'm sorry, I'm having trouble accessing my knowledge right now. Please try again in a moment."
 
 
+    def generate_answer(
+        self,
+        question: str,
+        context_results: List[Dict[str, Any]],
+        formatted_context: Optional[str] = None,
+        raise_errors: bool = False,
+    ) -> Dict[str, Any]:
+        """
+        Generate an answer from already retrieved context. Does not touch the
+        database, so it is safe to run from worker threads.
+        When retrieval is very confident and one sentence of the context
+        covers the question, that sentence is returned without an LLM call;
+        the same extractive answer is used if the LLM call fails.
+        Pass formatted_context to send a prepared full-corpus context instead
+        of formatting context_results, and raise_errors to get the LLM error
+        instead of an apology when there is no extractive fallback.
+        """
+        # Calculate confidence score based on context quality; whole-corpus
+        # context was not ranked, so it gets a neutral score
+        if formatted_context is None:
+            confidence_score = self._calculate_confidence_score(context_results)
+        else:
+            confidence_score = LONG_CONTEXT_CONFIDENCE
+        
+        extractive = None
+        if settings.RAG_EXTRACTIVE_ANSWERS:
+            extractive = extract_answer(question, context_results)
+        
+        if extractive is not None and formatted_context is None:
+            top_similarity = max(result['similarity_score'] for result in context_results)
+            if (
+                top_similarity >= settings.RAG_EXTRACTIVE_SIMILARITY_THRESHOLD
+                and extractive[1] >= settings.RAG_EXTRACTIVE_MIN_COVERAGE
+            ):
+                return self._extractive_result(question, extractive[0], confidence_score, context_results)
+        
+        # Format context for the prompt
+        long_context = formatted_context is not None
+        if not long_context:
+            formatted_context = self.format_context_for_prompt(context_results)
+        
+        # Create the prompt
+        prompt = self.create_dementia_friendly_prompt(question, formatted_context, cite_sources=long_context)
+        
+        # Get response from Gemini
+        can_fall_back = extractive is not None and extractive[1] >= settings.RAG_EXTRACTIVE_FALLBACK_MIN_COVERAGE
+        try:
+            response = self.call_gemini_chat(prompt, raise_errors=can_fall_back or raise_errors)
+        except Exception:
+            if not can_fall_back:
+                raise
+            # The LLM is unavailable, but the notes still hold the answer
+            sources_used = 1 if long_context else len(context_results)
+            return self._extractive_result(question, extractive[0], confidence_score, context_results, sources_used)
+        
+        answer_source = "rag"
+        if long_context:
+            # Only the documents the answer cites count as its sources
+            answer_source = "long_context"
+            filenames = list(OrderedDict.fromkeys(
+                (result.get('metadata') or {}).get('filename', 'Notes') for result in context_results
+            ))
+            response, cited = self._split_cited_sources(response, filenames)
+            context_results = [
+                result for result in context_results
+                if (result.get('metadata') or {}).get('filename', 'Notes') in cited
+            ]
+            sources_used = len(cited)
+        else:
+            sources_used = len(context_results)
+        
+        return {
+            "question": question,
+            "response": response,
+            "confidence_score": confidence_score,
+            "sources_used": sources_used,
+            "context_results": context_results,
+            "answer_source": answer_source
+        }
+
+
+    def _extractive_result(
+        self,
+        question: str,
+        sentence: str,
+        confidence_score: float,
+        context_results: List[Dict[str, Any]],
+        sources_used: Optional[int] = None,
+    ) -> Dict[str, Any]:
+        return {
+            "question": question,
+            "response": f"From your notes: {sentence}",
+            "confidence_score": confidence_score,
+            "sources_used": len(context_results) if sources_used is None else sources_used,
+            "context_results": context_results,
+            "answer_source": "extractive"
+        }
+
+
+    def save_chat_message(self, result: Dict[str, Any], user_id: int, db: Session):
+        """
+        Store an answered question in the chat history.
+        """
+        try:
+            chat_message = ChatMessage(
+                user_id=user_id,
+                question=result["question"],
+                response=result["response"],
+                confidence_score=result["confidence_score"]
+            )
+            db.add(chat_message)
+            db.commit()
+        except Exception as db_error:
+            # Don't fail the request if DB write fails
+            db.rollback()
+            print(f"Warning: Failed to save chat message to database: {db_error}")
+
+
     def answer_question(self, question: str, user_id: int, db: Session) -> Dict[str, Any]:
         """
         Main function to answer a user's question using RAG.
         """
         try:
-            # Retrieve relevant context
-            context_results = self.retrieve_relevant_context(question, user_id)
+            # Personal facts are answered straight from structured data, and
+            # common questions may already have an answer from ingestion time
+            result = self.answer_from_structured_data(question, user_id, db)
+            if result is None:
+                result = self.match_precomputed_answer(question, user_id, db)
+            if result is not None:
+                self.save_chat_message(result, user_id, db)
+                return result
             
-            # Format context for the prompt
-            formatted_context = self.format_context_for_prompt(context_results)
+            # Duplicates of a question already in flight wait for its answer.
+            # The corpus version keeps answers from before a document change
+            # from being handed to questions asked after it.
+            flight_key = (
+                user_id,
+                self.preprocess_query(question),
+                self.vector_service.get_corpus_version(user_id),
+            )
+            shared_result = self._rag_flights.do(
+                flight_key, lambda: self._answer_with_rag(question, user_id, db)
+            )
+            result = {**shared_result, "question": question}
             
-            # Create the prompt
-            prompt = self.create_dementia_friendly_prompt(question, formatted_context)
+            # Every caller gets its own chat history entry
+            self.save_chat_message(result, user_id, db)
             
-            # Get response from Gemini
-            response = self.call_gemini_chat(prompt)
+            return result
             
-            # Calculate confidence score based on context quality
-            confidence_score = self._calculate_confidence_score(context_results)
+        except Exception as e:
+            print(f"Error answering question: {e}")
+            return self._error_result(question)
+
+
+    def _answer_with_rag(self, question: str, user_id: int, db: Session) -> Dict[str, Any]:
+        # Small corpora are sent whole, without retrieval
+        corpus_context = self.get_small_corpus_context(user_id, db)
+        if corpus_context is not None:
+            context_results, formatted_context = corpus_context
+            return self.generate_answer(question, context_results, formatted_context)
+        
+        # Retrieve relevant context
+        context_results = self.retrieve_relevant_context(question, user_id)
+        
+        return self.generate_answer(question, context_results)
+
+
+    def get_small_corpus_context(self, user_id: int, db: Session) -> Optional[tuple]:
+        """
+        For a user whose indexed corpus fits RAG_LONG_CONTEXT_MAX_TOKENS,
+        return (context_results, formatted_context) covering all of it;
+        None otherwise. The result is cached until the user's documents
+        change (see invalidate_corpus_context) or their index is republished,
+        so the corpus is only read and compacted after it changes, and the
+        prompt prefix stays byte-identical between questions, which lets
+        Gemini's implicit context caching reuse it.
+        """
+        if settings.RAG_LONG_CONTEXT_MAX_TOKENS <= 0:
+            return None
+        
+        corpus_version = self.vector_service.get_corpus_version(user_id)
+        with self._corpus_context_lock:
+            version = (corpus_version, self._corpus_generations.get(user_id, 0))
+            cached = self._corpus_context_cache.get(user_id)
+            if cached is not None and cached[0] == version:
+                self._corpus_context_cache.move_to_end(user_id)
+                return cached[1]
+        
+        corpus_context = self._build_corpus_context(user_id, db)
+        
+        with self._corpus_context_lock:
+            self._corpus_context_cache[user_id] = (version, corpus_context)
+            self._corpus_context_cache.move_to_end(user_id)
+            while len(self._corpus_context_cache) > CORPUS_CONTEXT_CACHE_SIZE:
+                self._corpus_context_cache.popitem(last=False)
+        return corpus_context
+
+
+    def invalidate_corpus_context(self, user_id: int):
+        """
+        Drop a user's cached corpus context after their documents change.
+        Contexts still being built from the old documents are not cached.
+        """
+        with self._corpus_context_lock:
+            self._corpus_generations[user_id] = self._corpus_generations.get(user_id, 0) + 1
+            self._corpus_context_cache.pop(user_id, None)
+
+
+    def corpus_changed(self, user_id: int):
+        """
+        Call after chunks are added to a user's index: drops the cached
+        corpus context and refreshes the precomputed answers.
+        """
+        self.invalidate_corpus_context(user_id)
+        self.schedule_precomputed_answers(user_id)
+
+
+    def _build_corpus_context(self, user_id: int, db: Session) -> Optional[tuple]:
+        try:
+            metadata = self.vector_service.load_user_metadata(user_id)
+            if not metadata:
+                return None
+            
+            # Chunks of deleted documents stay in the index until it is rebuilt
+            live_chunk_ids = {
+                row.id for row in db.query(DocumentChunkRecord.id).filter(DocumentChunkRecord.user_id == user_id)
+            }
+            live_filenames = {
+                row.filename for row in db.query(Document.filename).filter(Document.user_id == user_id)
+            }
+            metadata = [
+                entry for entry in metadata
+                if entry.get('chunk_id') in live_chunk_ids
+                or (entry.get('chunk_id') is None and (entry.get('metadata') or {}).get('filename') in live_filenames)
+            ]
+            if not metadata:
+                return None
+            
+            # Compact the corpus: normalized whitespace, no markdown, no
+            # repeated chunks, one section per document
+            sections: Dict[str, List[str]] = OrderedDict()
+            seen = set()
+            context_results = []
+            for entry in metadata:
+                content = re.sub(r'\s+', ' ', entry['content'].replace('*', '')).strip()
+                if not content or content in seen:
+                    continue
+                seen.add(content)
+                filename = (entry.get('metadata') or {}).get('filename', 'Notes')
+                sections.setdefault(filename, []).append(content)
+                # Not ranked against the question, so no similarity score
+                context_results.append({
+                    'content': content,
+                    'metadata': entry.get('metadata'),
+                    'rank': len(context_results) + 1
+                })
             
-            # Store the conversation in the database (non-blocking for faster response)
+            formatted_context = "PERSONAL INFORMATION FROM YOUR DOCUMENTS:\n\n" + "\n\n".join(
+                f"[{filename}]: {' '.join(contents)}" for filename, contents in sections.items()
+            )
+            
+            # Roughly 4 characters per token
+            if len(formatted_context) / 4 > settings.RAG_LONG_CONTEXT_MAX_TOKENS:
+                return None
+            return context_results, formatted_context
+            
+        except Exception as e:
+            print(f"Error building corpus context for user {user_id}: {e}")
+            return None
+
+
+    async def answer_questions_stream(
+        self, questions: List[str], user_id: int, db: Session
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """
+        Answer a batch of questions for one user. As for single questions,
+        structured answers are tried first, then precomputed answers, and
+        those are yielded straight away; for the rest, retrieval runs as a
+        single batched embedding request and FAISS search, and answers are
+        generated with at most RAG_BATCH_CONCURRENCY concurrent LLM calls and
+        yielded as soon as each one finishes, tagged with their position in
+        the batch.
+        """
+        pending = []
+        for position, question in enumerate(questions):
+            result = self.answer_from_structured_data(question, user_id, db)
+            if result is None:
+                result = self.match_precomputed_answer(question, user_id, db)
+            if result is None:
+                pending.append(position)
+                continue
+            self.save_chat_message(result, user_id, db)
+            yield {"index": position, **result}
+        
+        if not pending:
+            return
+        
+        corpus_context = await asyncio.to_thread(self.get_small_corpus_context, user_id, db)
+        formatted_context = None
+        if corpus_context is not None:
+            # Small corpus: every question gets all of it, no retrieval needed
+            context_results, formatted_context = corpus_context
+            pending_context_results = [context_results for _ in pending]
+        else:
             try:
-                chat_message = ChatMessage(
-                    user_id=user_id,
-                    question=question,
-                    response=response,
-                    confidence_score=confidence_score
+                pending_context_results = await asyncio.to_thread(
+                    self.retrieve_relevant_context_batch, [questions[position] for position in pending], user_id
                 )
-                db.add(chat_message)
-                db.commit()
-            except Exception as db_error:
-                # Don't fail the request if DB write fails
-                print(f"Warning: Failed to save chat message to database: {db_error}")
+            except Exception as e:
+                print(f"Error retrieving batch context: {e}")
+                pending_context_results = [[] for _ in pending]
+        
+        semaphore = asyncio.Semaphore(max(settings.RAG_BATCH_CONCURRENCY, 1))
+        
+        async def answer(position: int, question: str, context_results: List[Dict[str, Any]]):
+            async with semaphore:
+                try:
+                    result = await asyncio.to_thread(
+                        self.generate_answer, question, context_results, formatted_context
+                    )
+                    return position, result, True
+                except Exception as e:
+                    print(f"Error answering question: {e}")
+                    return position, self._error_result(question), False
+        
+        tasks = [
+            asyncio.create_task(answer(position, questions[position], context_results))
+            for position, context_results in zip(pending, pending_context_results)
+        ]
+        try:
+            for next_done in asyncio.as_completed(tasks):
+                position, result, answered = await next_done
+                if answered:
+                    self.save_chat_message(result, user_id, db)
+                yield {"index": position, **result}
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+    def _error_result(self, question: str) -> Dict[str, Any]:
+        return {
+            "question": question,
+            "response": "I'm sorry, I encountered an error while processing your question. Please try again.",
+            "confidence_score": 0.0,
+            "sources_used": 0,
+            "context_results": [],
+            "answer_source": "error"
+        }
+
+
+    def answer_from_structured_data(self, question: str, user_id: int, db: Session) -> Optional[Dict[str, Any]]:
+        """
+        Answer personal-fact questions (address, doctor, medications, ...)
+        from the user's records without embedding, retrieval or an LLM call.
+        """
+        answer = answer_structured_question(self.preprocess_query(question), user_id, db)
+        if answer is None:
+            return None
+        
+        response, confidence_score = answer
+        return {
+            "question": question,
+            "response": response,
+            "confidence_score": confidence_score,
+            "sources_used": 0,
+            "context_results": [],
+            "answer_source": "structured"
+        }
+
+
+    def match_precomputed_answer(self, question: str, user_id: int, db: Session) -> Optional[Dict[str, Any]]:
+        """
+        Return the stored answer of the most similar canonical question, if
+        it is similar enough. Costs one (cached) query embedding and no LLM call.
+        """
+        if not settings.RAG_PRECOMPUTE_ANSWERS:
+            return None
+        
+        try:
+            answers = db.query(PrecomputedAnswer).filter(
+                PrecomputedAnswer.user_id == user_id
+            ).all()
+            if not answers:
+                return None
             
-            return {
-                "question": question,
-                "response": response,
-                "confidence_score": confidence_score,
-                "sources_used": len(context_results),
-                "context_results": context_results
-            }
+            query_vector = np.array(
+                self.query_batcher.get_query_embedding(self.preprocess_query(question)),
+                dtype=np.float32
+            )
+            norm = np.linalg.norm(query_vector)
+            if norm == 0:
+                return None
+            
+            stored_vectors = np.stack([
+                np.frombuffer(answer.question_embedding, dtype=np.float32) for answer in answers
+            ])
+            similarities = stored_vectors @ (query_vector / norm)
+            best = int(np.argmax(similarities))
+            if similarities[best] < settings.RAG_PRECOMPUTED_MATCH_THRESHOLD:
+                return None
             
-        except Exception as e:
-            print(f"Error answering question: {e}")
             return {
                 "question": question,
-                "response": "I'm sorry, I encountered an error while processing your question. Please try again.",
-                "confidence_score": 0.0,
+                "response": answers[best].response,
+                "confidence_score": answers[best].confidence_score or 0.0,
                 "sources_used": 0,
-                "context_results": []
+                "context_results": [],
+                "answer_source": "precomputed"
             }
+            
+        except Exception as e:
+            print(f"Error matching precomputed answers for user {user_id}: {e}")
+            return None
+
+
+    def precompute_answers(self, user_id: int, db: Session):
+        """
+        Answer the canonical questions through the full RAG pipeline and store
+        the results, replacing the user's previous precomputed answers.
+        Questions the LLM could not answer get no stored answer.
+        """
+        questions = settings.RAG_CANONICAL_QUESTIONS
+        if not questions:
+            return
+        
+        processed_questions = [self.preprocess_query(question) for question in questions]
+        corpus_context = self.get_small_corpus_context(user_id, db)
+        if corpus_context is None:
+            all_context_results = self.retrieve_relevant_context_batch(questions, user_id)
+            formatted_context = None
+        else:
+            context_results, formatted_context = corpus_context
+            all_context_results = [context_results for _ in questions]
+        question_vectors = np.array(
+            self.vector_service.get_query_embeddings(processed_questions), dtype=np.float32
+        )
+        
+        answers = []
+        for question, vector, context_results in zip(questions, question_vectors, all_context_results):
+            norm = np.linalg.norm(vector)
+            if not context_results or norm == 0:
+                continue
+            
+            try:
+                result = self.generate_answer(question, context_results, formatted_context, raise_errors=True)
+            except Exception as e:
+                # Never store an apology; the question is answered live instead
+                print(f"Skipping precomputed answer to {question!r} for user {user_id}: {e}")
+                continue
+            answers.append(PrecomputedAnswer(
+                user_id=user_id,
+                question=question,
+                question_embedding=(vector / norm).astype(np.float32).tobytes(),
+                response=result["response"],
+                confidence_score=result["confidence_score"]
+            ))
+        
+        try:
+            db.query(PrecomputedAnswer).filter(PrecomputedAnswer.user_id == user_id).delete()
+            db.add_all(answers)
+            db.commit()
+            print(f"Precomputed {len(answers)} answers for user {user_id}")
+        except Exception as e:
+            db.rollback()
+            print(f"Error storing precomputed answers for user {user_id}: {e}")
+
+
+    def schedule_precomputed_answers(self, user_id: int):
+        """
+        Refresh a user's precomputed answers in the background. Requests made
+        while a refresh is still queued are folded into it.
+        """
+        if not settings.RAG_PRECOMPUTE_ANSWERS:
+            return
+        
+        with self._precompute_lock:
+            if user_id in self._precompute_pending:
+                return
+            self._precompute_pending.add(user_id)
+        
+        self._precompute_executor.submit(self._run_precompute, user_id)
+
+
+    def _run_precompute(self, user_id: int):
+        with self._precompute_lock:
+            self._precompute_pending.discard(user_id)
+        
+        db = SessionLocal()
+        try:
+            self.precompute_answers(user_id, db)
+        except Exception as e:
+            print(f"Error precomputing answers for user {user_id}: {e}")
+        finally:
+            db.close()
+
+
+    def clear_precomputed_answers(self, user_id: int, db: Session):
+        """
+        Drop a user's precomputed answers, e.g. after their documents change.
+        """
+        db.query(PrecomputedAnswer).filter(PrecomputedAnswer.user_id == user_id).delete()
+        db.commit()
 
 
     def _calculate_confidence_score(self, context_results: List[Dict[str, Any]]) -> float:
@@ -305,15 +843,33 @@ Provide a clear, warm response in simple language. Use natural paragraph breaks.
             # Store document in database
             document = store_document_chunks(chunks, user_id, filename, db)
             
-            # Add chunks to vector index
-            self.vector_service.add_documents_to_index(user_id, chunks)
+            # Add chunks to vector index, recording where their vectors went
+            # before another writer (e.g. a rebuild swap) can change the index
+            embeddings = self.vector_service.get_gemini_embeddings([chunk.content for chunk in chunks])
+            with self.vector_service.user_write_lock(user_id):
+                try:
+                    index_ids = self.vector_service.add_documents_to_index(user_id, chunks, embeddings=embeddings)
+                except Exception:
+                    # The chunks are stored, so the retry queue can index them later
+                    record_embedding_results(chunks, [None] * len(chunks), db)
+                    raise
+                record_embedding_results(chunks, index_ids, db)
+            chunks_pending = sum(1 for index_id in index_ids if index_id is None)
+            
+            # Refresh answers to common questions off the request path
+            self.corpus_changed(user_id)
+            
+            message = f"Successfully processed {filename} with {len(chunks)} chunks"
+            if chunks_pending:
+                message += f" ({chunks_pending} will be indexed once embedding succeeds)"
             
             return {
                 "success": True,
                 "document_id": document.id,
                 "filename": filename,
                 "chunks_processed": len(chunks),
-                "message": f"Successfully processed {filename} with {len(chunks)} chunks"
+                "chunks_pending": chunks_pending,
+                "message": message
             }
             
         except Exception as e:
@@ -359,12 +915,15 @@ Provide a clear, warm response in simple language. Use natural paragraph breaks.
         """
         try:
             # Delete from database
+            db.query(DocumentChunkRecord).filter(DocumentChunkRecord.user_id == user_id).delete()
             db.query(Document).filter(Document.user_id == user_id).delete()
             db.query(ChatMessage).filter(ChatMessage.user_id == user_id).delete()
+            db.query(PrecomputedAnswer).filter(PrecomputedAnswer.user_id == user_id).delete()
             db.commit()
             
             # Delete vector data
             self.vector_service.delete_user_data(user_id)
+            self.invalidate_corpus_context(user_id)
             
             print(f"Deleted knowledge base for user {user_id}")
             
@@ -0,0 +1,106 @@
+import threading
+import time
+from typing import Dict, Hashable, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.face_encoding_pool import DetectedFace
+from app.services.image_service import PERCEPTUAL_HASH_SIZE
+
+
+# Faces of a query photo, and the (photo id, distance) matches of each face
+SearchResult = Tuple[List[DetectedFace], List[List[Tuple[int, float]]]]
+
+# Recent searches kept per user; older ones are dropped first
+MAX_ENTRIES_PER_USER = 16
+
+
+def _hash_distance(first: int, second: int) -> int:
+    return bin(first ^ second).count("1")
+
+
+def is_distinctive(image_hash: int) -> bool:
+    """
+    Whether a hash carries enough detail to identify a photo. Near-uniform
+    images, such as a covered lens or a dark room, hash to almost all zeros
+    or all ones whatever they show, so their results are not cached.
+    """
+    bits = PERCEPTUAL_HASH_SIZE * PERCEPTUAL_HASH_SIZE
+    set_bits = bin(image_hash).count("1")
+    return min(set_bits, bits - set_bits) >= PERCEPTUAL_HASH_SIZE
+
+
+class _CachedSearch:
+    __slots__ = ("image_hash", "options", "version", "expires_at", "result")
+
+    def __init__(self, image_hash: int, options: Hashable, version: Hashable, expires_at: float, result: SearchResult):
+        self.image_hash = image_hash
+        # Search parameters the result was computed with
+        self.options = options
+        # State of the user's library when the result was computed
+        self.version = version
+        self.expires_at = expires_at
+        self.result = result
+
+
+class SearchResultCache:
+    """
+    Recent photo search results per user, keyed by the perceptual hash of
+    the query photo. A query whose hash is within
+    SEARCH_CACHE_MAX_HASH_DISTANCE bits of a search made in the last
+    SEARCH_CACHE_TTL_SECONDS reuses its faces and matches, so pointing the
+    camera at the same photo or visitor again skips face detection and
+    encoding. A user's entries are dropped whenever their library changes
+    in this process, and entries recorded under another library version
+    (changes made by other processes) are ignored.
+    """
+
+    def __init__(self):
+        self._users: Dict[int, List[_CachedSearch]] = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, user_id: int, image_hash: int, options: Hashable, version: Hashable) -> Optional[SearchResult]:
+        """The result of the closest matching recent search, or None."""
+        if settings.SEARCH_CACHE_TTL_SECONDS <= 0 or not is_distinctive(image_hash):
+            return None
+
+        now = time.monotonic()
+        with self._lock:
+            entries = [entry for entry in self._users.get(user_id, []) if entry.expires_at > now]
+            if entries:
+                self._users[user_id] = entries
+            else:
+                self._users.pop(user_id, None)
+
+            best = None
+            best_distance = settings.SEARCH_CACHE_MAX_HASH_DISTANCE
+            for entry in entries:
+                if entry.options != options or entry.version != version:
+                    continue
+                distance = _hash_distance(entry.image_hash, image_hash)
+                if distance <= best_distance:
+                    best, best_distance = entry, distance
+            return best.result if best is not None else None
+
+
+    def put(self, user_id: int, image_hash: int, options: Hashable, version: Hashable, result: SearchResult):
+        if settings.SEARCH_CACHE_TTL_SECONDS <= 0 or not is_distinctive(image_hash):
+            return
+
+        entry = _CachedSearch(
+            image_hash, options, version, time.monotonic() + settings.SEARCH_CACHE_TTL_SECONDS, result
+        )
+        with self._lock:
+            entries = self._users.setdefault(user_id, [])
+            entries.append(entry)
+            del entries[:-MAX_ENTRIES_PER_USER]
+
+
+    def invalidate(self, user_id: int):
+        """Forget a user's searches after their photo library changed."""
+        with self._lock:
+            self._users.pop(user_id, None)
+
+
+# Shared by every request in this process
+search_result_cache = SearchResultCache()
@@ -0,0 +1,62 @@
+import hashlib
+import os
+from pathlib import Path
+from typing import BinaryIO, NamedTuple
+from uuid import uuid4
+
+from fastapi import HTTPException, UploadFile, status
+
+
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+
+class SavedUpload(NamedTuple):
+    path: Path
+    size: int
+    sha256: str
+
+
+def _format_size(size: int) -> str:
+    if size >= 1024 * 1024:
+        return f"{size / (1024 * 1024):g} MB"
+    return f"{size} bytes"
+
+
+def stream_to_file(source: BinaryIO, destination: Path, max_bytes: int, name: str = "File") -> SavedUpload:
+    """
+    Copy a stream to destination in UPLOAD_CHUNK_SIZE chunks, computing its
+    size and SHA-256 on the way, so at most one chunk is held in memory
+    whatever the file size. The file is written under a temporary name and
+    moved into place once complete. Raises HTTPException 413, leaving
+    nothing behind, as soon as more than max_bytes have been read.
+    """
+    tmp_path = destination.with_name(destination.name + ".part")
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with tmp_path.open("wb") as buffer:
+            while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > max_bytes:
+                    raise HTTPException(
+                        status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE,
+                        detail=f"{name} is larger than the {_format_size(max_bytes)} limit",
+                    )
+                digest.update(chunk)
+                buffer.write(chunk)
+        os.replace(tmp_path, destination)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    return SavedUpload(destination, size, digest.hexdigest())
+
+
+def save_upload(file: UploadFile, directory: Path, *, default_suffix: str, max_bytes: int) -> SavedUpload:
+    """
+    Stream an upload into directory under a random name that keeps its
+    extension. Blocking; call it from a thread in async code.
+    """
+    directory.mkdir(parents=True, exist_ok=True)
+    suffix = Path(file.filename or "").suffix or default_suffix
+    return stream_to_file(file.file, directory / f"{uuid4().hex}{suffix}", max_bytes, file.filename or "File")
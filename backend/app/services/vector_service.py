@@ -1,94 +1,333 @@
 import os
 import pickle
-from typing import List, Dict, Any, Optional
+import shutil
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, NamedTuple, Optional, Tuple
 import numpy as np
 import faiss
 import google.generativeai as genai
 from pathlib import Path
 from app.core.config import settings
+from app.services.gemini_key_pool import key_pool
 from app.services.document_service import DocumentChunk
 
 
+# Number of recent query embeddings kept in memory
+QUERY_EMBEDDING_CACHE_SIZE = 1024
+
+# Maximum number of texts per batched embedding request
+EMBEDDING_BATCH_SIZE = 100
+
+# Vectors needed to train the quantizers. SQ8 learns a value range per
+# dimension, which a handful of vectors gets badly wrong; PQ k-means wants
+# at least 39 points for each of its 256 centroids. Until a user has this
+# many vectors their index is stored as fp16 and retrained once it grows.
+SQ8_MIN_TRAINING_VECTORS = 1000
+PQ_MIN_TRAINING_VECTORS = 39 * 256
+
+# Write locks per (index directory, user id), shared by every VectorService
+# pointing at the same directory
+_user_write_locks: Dict[Tuple[str, int], threading.RLock] = {}
+_user_write_locks_guard = threading.Lock()
+
+# Each change to a user's data is written to a new version directory
+# under user_<id>/, which this file inside it names as current
+VERSION_POINTER_FILENAME = "CURRENT"
+
+
+class UserFiles(NamedTuple):
+    """Paths of one version of a user's index, metadata and side store."""
+    index: Path
+    metadata: Path
+    vectors: Path
+
+
+def _estimate_tokens(texts: List[str]) -> int:
+    # Embedding responses carry no usage data; roughly 4 characters per token
+    return sum(len(text) for text in texts) // 4
+
+
 class VectorService:
-    def __init__(self):
-        # Configure Google Gemini
-        if settings.GEMINI_API_KEY:
-            genai.configure(api_key=settings.GEMINI_API_KEY)
-            # Log which key is being used (first 10 chars for security)
-            key_preview = settings.GEMINI_API_KEY[:10] + "..." if len(settings.GEMINI_API_KEY) > 10 else "***"
-            print(f"VectorService: Gemini API configured with key: {key_preview}")
-        else:
-            print("Warning: GEMINI_API_KEY not set in configuration")
-        
+    def __init__(self, faiss_dir: Optional[Path] = None):
         # Ensure FAISS index directory exists
-        self.faiss_dir = Path(settings.FAISS_INDEX_PATH)
-        self.faiss_dir.mkdir(exist_ok=True)
+        self.faiss_dir = Path(faiss_dir or settings.FAISS_INDEX_PATH)
+        self.faiss_dir.mkdir(parents=True, exist_ok=True)
+        
+        # LRU cache of query embeddings, so the same question is only embedded
+        # once across precomputed-answer matching and retrieval
+        self._query_embedding_cache: OrderedDict[str, List[float]] = OrderedDict()
+        self._query_embedding_lock = threading.Lock()
 
 
-    def get_gemini_embeddings(self, texts: List[str]) -> List[List[float]]:
+    def get_gemini_embeddings(self, texts: List[str]) -> List[Optional[List[float]]]:
         """
-        Generate embeddings using Google Gemini text-embedding-004.
+        Generate embeddings using Google Gemini (settings.EMBEDDING_MODEL).
+        Non-empty texts are sent in batches of up to EMBEDDING_BATCH_SIZE.
+        Texts that are empty or whose batch failed get None instead of an
+        embedding, so callers can leave them out of the index and retry later.
         """
-        try:
-            embeddings = []
-            
-            for text in texts:
-                # Clean the text to avoid issues
-                clean_text = text.strip()
-                if not clean_text:
-                    # Create a zero vector for empty text
-                    embeddings.append([0.0] * 768)  # Default embedding dimension
-                    continue
-                
-                # Generate embedding using Gemini
-                result = genai.embed_content(
-                    model="models/text-embedding-004",
-                    content=clean_text,
-                    task_type="retrieval_document"
+        embeddings: List[Optional[List[float]]] = [None] * len(texts)
+        
+        # Clean the text to avoid issues
+        clean_texts = [(i, text.strip()) for i, text in enumerate(texts) if text.strip()]
+        
+        for start in range(0, len(clean_texts), EMBEDDING_BATCH_SIZE):
+            batch = clean_texts[start:start + EMBEDDING_BATCH_SIZE]
+            
+            try:
+                # Generate embeddings using Gemini on the least loaded key
+                batch_texts = [text for _, text in batch]
+                result = key_pool.run(
+                    lambda client: genai.embed_content(
+                        model=settings.EMBEDDING_MODEL,
+                        content=batch_texts,
+                        task_type="retrieval_document",
+                        client=client
+                    ),
+                    tokens=_estimate_tokens(batch_texts)
                 )
                 
-                embeddings.append(result['embedding'])
-            
-            return embeddings
-            
-        except Exception as e:
-            print(f"Error generating embeddings: {e}")
-            # Return zero vectors as fallback
-            return [[0.0] * 768 for _ in texts]
+                for (i, _), embedding in zip(batch, result['embedding']):
+                    embeddings[i] = embedding
+                    
+            except Exception as e:
+                print(f"Error generating embeddings for {len(batch)} texts: {e}")
+        
+        return embeddings
+
+
+    def _get_cached_query_embedding(self, query: str) -> Optional[List[float]]:
+        with self._query_embedding_lock:
+            embedding = self._query_embedding_cache.get(query)
+            if embedding is not None:
+                self._query_embedding_cache.move_to_end(query)
+            return embedding
+
+
+    def _cache_query_embedding(self, query: str, embedding: List[float]):
+        with self._query_embedding_lock:
+            self._query_embedding_cache[query] = embedding
+            self._query_embedding_cache.move_to_end(query)
+            while len(self._query_embedding_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+                self._query_embedding_cache.popitem(last=False)
 
 
     def get_query_embedding(self, query: str) -> List[float]:
         """
         Generate embedding for a search query.
         """
+        clean_query = query.strip()
+        cached = self._get_cached_query_embedding(clean_query)
+        if cached is not None:
+            return cached
+        
         try:
-            result = genai.embed_content(
-                model="models/text-embedding-004",
-                content=query.strip(),
-                task_type="retrieval_query"
+            result = key_pool.run(
+                lambda client: genai.embed_content(
+                    model=settings.EMBEDDING_MODEL,
+                    content=clean_query,
+                    task_type="retrieval_query",
+                    client=client
+                ),
+                tokens=_estimate_tokens([clean_query])
             )
+            self._cache_query_embedding(clean_query, result['embedding'])
             return result['embedding']
             
         except Exception as e:
             print(f"Error generating query embedding: {e}")
-            return [0.0] * 768  # Return zero vector as fallback
+            return [0.0] * settings.EMBEDDING_DIMENSION  # Return zero vector as fallback
+
+
+    def get_query_embeddings(self, queries: List[str]) -> List[List[float]]:
+        """
+        Generate embeddings for several search queries in a single request.
+        Only queries missing from the cache are sent.
+        """
+        clean_queries = [query.strip() for query in queries]
+        embeddings = [self._get_cached_query_embedding(query) for query in clean_queries]
+        missing = [query for query, embedding in zip(clean_queries, embeddings) if embedding is None]
+        
+        if not missing:
+            return embeddings
+        
+        try:
+            result = key_pool.run(
+                lambda client: genai.embed_content(
+                    model=settings.EMBEDDING_MODEL,
+                    content=missing,
+                    task_type="retrieval_query",
+                    client=client
+                ),
+                tokens=_estimate_tokens(missing)
+            )
+            fetched = dict(zip(missing, result['embedding']))
+            for query, embedding in fetched.items():
+                self._cache_query_embedding(query, embedding)
+            
+            return [
+                embedding if embedding is not None else fetched[query]
+                for query, embedding in zip(clean_queries, embeddings)
+            ]
+            
+        except Exception as e:
+            print(f"Error generating query embeddings: {e}")
+            return [
+                embedding if embedding is not None else [0.0] * settings.EMBEDDING_DIMENSION
+                for embedding in embeddings
+            ]
+
+
+    def user_write_lock(self, user_id: int) -> threading.RLock:
+        """
+        The lock serialising changes to a user's index, metadata and side
+        store in this process. Every read-modify-write of those files holds
+        it, whichever VectorService instance makes it. It is reentrant, so a
+        caller can hold it across several writes that must not interleave
+        with others.
+        """
+        key = (str(self.faiss_dir.resolve()), user_id)
+        with _user_write_locks_guard:
+            return _user_write_locks.setdefault(key, threading.RLock())
+
+
+    def _get_user_dir(self, user_id: int) -> Path:
+        """Get the directory holding the versions of a user's vector data."""
+        return self.faiss_dir / f"user_{user_id}"
+
+
+    def _get_pointer_path(self, user_id: int) -> Path:
+        """Get the file naming a user's current version directory."""
+        return self._get_user_dir(user_id) / VERSION_POINTER_FILENAME
+
+
+    def _get_version_files(self, version_dir: Path) -> UserFiles:
+        return UserFiles(
+            index=version_dir / "index.faiss",
+            metadata=version_dir / "metadata.pkl",
+            vectors=version_dir / "vectors.npy",
+        )
+
+
+    def _get_legacy_files(self, user_id: int) -> UserFiles:
+        """Files of indexes written before data was versioned."""
+        return UserFiles(
+            index=self.faiss_dir / f"user_{user_id}.index",
+            metadata=self.faiss_dir / f"user_{user_id}_metadata.pkl",
+            vectors=self.faiss_dir / f"user_{user_id}_vectors.npy",
+        )
+
+
+    def _get_user_files(self, user_id: int) -> UserFiles:
+        """
+        The files of a user's current version. Resolve them once and read
+        every file of a search from them, so a concurrent write cannot mix
+        an old index with new metadata.
+        """
+        try:
+            version = self._get_pointer_path(user_id).read_text().strip()
+        except FileNotFoundError:
+            return self._get_legacy_files(user_id)
+        return self._get_version_files(self._get_user_dir(user_id) / version)
+
+
+    def _create_version_dir(self, user_id: int) -> Path:
+        """Create an empty directory for the next version of a user's data."""
+        user_dir = self._get_user_dir(user_id)
+        user_dir.mkdir(parents=True, exist_ok=True)
+        numbers = [
+            int(path.name[1:]) for path in user_dir.glob("v*")
+            if path.is_dir() and path.name[1:].isdigit()
+        ]
+        version_dir = user_dir / f"v{max(numbers, default=0) + 1}"
+        version_dir.mkdir()
+        return version_dir
+
+
+    def _publish_version(self, user_id: int, version_dir: Path):
+        """
+        Make a complete version directory the user's current data by
+        replacing the pointer file, then remove versions older than the
+        previous one. The previous version is kept for searches that
+        resolved it just before the swap; files that are still open or
+        memory-mapped stay readable after removal.
+        """
+        pointer_path = self._get_pointer_path(user_id)
+        try:
+            previous = pointer_path.read_text().strip()
+        except FileNotFoundError:
+            previous = None
 
+        tmp_path = pointer_path.with_name(pointer_path.name + ".tmp")
+        tmp_path.write_text(version_dir.name)
+        os.replace(tmp_path, pointer_path)
 
-    def _get_index_path(self, user_id: int) -> Path:
-        """Get the file path for a user's FAISS index."""
-        return self.faiss_dir / f"user_{user_id}.index"
+        for path in self._get_user_dir(user_id).glob("v*"):
+            if path.is_dir() and path.name not in (version_dir.name, previous):
+                shutil.rmtree(path, ignore_errors=True)
+        for path in self._get_legacy_files(user_id):
+            if path.exists():
+                path.unlink()
 
 
-    def _get_metadata_path(self, user_id: int) -> Path:
-        """Get the file path for a user's metadata."""
-        return self.faiss_dir / f"user_{user_id}_metadata.pkl"
+    def _truncate_vectors(self, vectors: np.ndarray, dimension: int) -> np.ndarray:
+        """
+        Keep the leading dimensions of Matryoshka-style embeddings and
+        re-normalize them for inner product search.
+        """
+        if dimension <= 0 or dimension >= vectors.shape[1]:
+            return vectors
+        
+        truncated = np.array(vectors[:, :dimension], dtype=np.float32)
+        faiss.normalize_L2(truncated)
+        return truncated
 
 
-    def create_faiss_index(self, user_id: int, dimension: int = 768) -> faiss.IndexFlatIP:
+    def _uses_side_store(self) -> bool:
+        """Whether full vectors are kept in the float16 side store."""
+        search_dimension = settings.FAISS_SEARCH_DIMENSION
+        return settings.FAISS_RERANK_EXACT or 0 < search_dimension < settings.EMBEDDING_DIMENSION
+
+
+    def create_faiss_index(
+        self,
+        user_id: int,
+        dimension: int = 768,
+        training_vectors: Optional[np.ndarray] = None,
+    ) -> faiss.Index:
         """
         Create a new FAISS index for a user.
+        FAISS_QUANTIZATION selects the vector storage: float32 (IndexFlatIP),
+        fp16 / sq8 scalar quantization or product quantization. Quantizers that
+        need training are trained on training_vectors; with fewer than
+        SQ8_MIN_TRAINING_VECTORS / PQ_MIN_TRAINING_VECTORS of them, storage
+        falls back to fp16, which needs no training (see _retrain_fallback_index).
         """
         try:
+            quantization = settings.FAISS_QUANTIZATION.lower()
+            metric = faiss.METRIC_INNER_PRODUCT
+            num_training = 0 if training_vectors is None else len(training_vectors)
+            
+            if quantization == "pq":
+                subquantizers = settings.FAISS_PQ_SUBQUANTIZERS
+                # 8-bit PQ codebooks have 256 centroids per sub-quantizer
+                if dimension % subquantizers == 0 and num_training >= PQ_MIN_TRAINING_VECTORS:
+                    index = faiss.IndexPQ(dimension, subquantizers, 8, metric)
+                    index.train(training_vectors)
+                    return index
+                quantization = "fp16"
+            
+            if quantization == "sq8":
+                if num_training >= SQ8_MIN_TRAINING_VECTORS:
+                    index = faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_8bit, metric)
+                    index.train(training_vectors)
+                    return index
+                quantization = "fp16"
+            
+            if quantization == "fp16":
+                return faiss.IndexScalarQuantizer(dimension, faiss.ScalarQuantizer.QT_fp16, metric)
+            
             # Create inner product index (good for normalized embeddings)
             index = faiss.IndexFlatIP(dimension)
             return index
@@ -98,16 +337,56 @@ class VectorService:
             raise
 
 
-    def load_user_index(self, user_id: int) -> Optional[faiss.IndexFlatIP]:
+    def _retrain_fallback_index(self, user_id: int, index: faiss.Index) -> faiss.Index:
+        """
+        Once an fp16 index that stands in for a not yet trained sq8 or pq
+        index holds enough vectors, train the configured quantizer on them
+        and re-encode the index. Vector ids are kept, so metadata and the
+        side store stay aligned. Returns the index to save.
+        """
+        quantization = settings.FAISS_QUANTIZATION.lower()
+        minimum = {"sq8": SQ8_MIN_TRAINING_VECTORS, "pq": PQ_MIN_TRAINING_VECTORS}.get(quantization)
+        is_fallback = (
+            isinstance(index, faiss.IndexScalarQuantizer)
+            and index.sq.qtype == faiss.ScalarQuantizer.QT_fp16
+        )
+        if minimum is None or not is_fallback or index.ntotal < minimum:
+            return index
+        
+        vectors = index.reconstruct_n(0, index.ntotal)
+        retrained = self.create_faiss_index(user_id, index.d, training_vectors=vectors)
+        if isinstance(retrained, faiss.IndexScalarQuantizer) and retrained.sq.qtype == faiss.ScalarQuantizer.QT_fp16:
+            # e.g. a PQ sub-quantizer count that does not divide the dimension
+            return index
+        retrained.add(vectors)
+        print(f"Retrained {quantization} index on {index.ntotal} vectors for user {user_id}")
+        return retrained
+
+
+    def load_user_index(
+        self, user_id: int, writable: bool = False, files: Optional[UserFiles] = None
+    ) -> Optional[faiss.Index]:
         """
         Load a user's FAISS index from disk.
+        When FAISS_MMAP is enabled, read-only loads map the file instead of
+        copying it onto the heap, so every worker shares the same page cache.
+        Pass writable=True when the index is going to be modified, and the
+        files of one version to read it together with its metadata.
         """
         try:
-            index_path = self._get_index_path(user_id)
+            index_path = (files or self._get_user_files(user_id)).index
             
             if not index_path.exists():
                 return None
             
+            if settings.FAISS_MMAP and not writable:
+                io_flags = (
+                    faiss.IO_FLAG_MMAP
+                    | getattr(faiss, "IO_FLAG_MMAP_IFC", 0)
+                    | faiss.IO_FLAG_READ_ONLY
+                )
+                return faiss.read_index(str(index_path), io_flags)
+            
             index = faiss.read_index(str(index_path))
             return index
             
@@ -116,25 +395,30 @@ class VectorService:
             return None
 
 
-    def save_user_index(self, user_id: int, index: faiss.IndexFlatIP):
+    def load_user_vectors(self, user_id: int, files: Optional[UserFiles] = None) -> Optional[np.ndarray]:
         """
-        Save a user's FAISS index to disk.
+        Load a user's float16 side store, memory-mapped so that re-scoring
+        only pages in the rows it touches.
         """
         try:
-            index_path = self._get_index_path(user_id)
-            faiss.write_index(index, str(index_path))
+            vectors_path = (files or self._get_user_files(user_id)).vectors
+            
+            if not vectors_path.exists():
+                return None
+            
+            return np.load(vectors_path, mmap_mode="r")
             
         except Exception as e:
-            print(f"Error saving index for user {user_id}: {e}")
-            raise
+            print(f"Error loading vectors for user {user_id}: {e}")
+            return None
 
 
-    def load_user_metadata(self, user_id: int) -> List[Dict[str, Any]]:
+    def load_user_metadata(self, user_id: int, files: Optional[UserFiles] = None) -> List[Dict[str, Any]]:
         """
         Load metadata for a user's documents.
         """
         try:
-            metadata_path = self._get_metadata_path(user_id)
+            metadata_path = (files or self._get_user_files(user_id)).metadata
             
             if not metadata_path.exists():
                 return []
@@ -149,135 +433,363 @@ class VectorService:
             return []
 
 
-    def save_user_metadata(self, user_id: int, metadata: List[Dict[str, Any]]):
+    def _write_metadata(self, metadata_path: Path, metadata: List[Dict[str, Any]]):
+        with open(metadata_path, 'wb') as f:
+            pickle.dump(metadata, f)
+
+
+    def get_corpus_version(self, user_id: int) -> int:
         """
-        Save metadata for a user's documents.
+        A token that changes whenever a user's indexed documents change.
+        Every change publishes a new version by rewriting the version
+        pointer, so its modification time is used; 0 means the user has no
+        index.
         """
-        try:
-            metadata_path = self._get_metadata_path(user_id)
-            
-            with open(metadata_path, 'wb') as f:
-                pickle.dump(metadata, f)
-                
-        except Exception as e:
-            print(f"Error saving metadata for user {user_id}: {e}")
-            raise
+        for path in [self._get_pointer_path(user_id), self._get_legacy_files(user_id).metadata]:
+            try:
+                return path.stat().st_mtime_ns
+            except FileNotFoundError:
+                continue
+        return 0
 
 
-    def add_documents_to_index(self, user_id: int, chunks: List[DocumentChunk]):
+    def add_documents_to_index(
+        self,
+        user_id: int,
+        chunks: List[DocumentChunk],
+        embeddings: Optional[List[Optional[List[float]]]] = None,
+    ) -> List[Optional[int]]:
         """
         Add document chunks to a user's FAISS index.
+        Embeddings are generated unless already provided, one per chunk.
+        Chunks without a usable embedding (None or all zeros) are left out.
+        Returns the index row assigned to each chunk, or None for chunks
+        that were left out.
         """
         try:
-            # Extract text content for embedding
-            texts = [chunk.content for chunk in chunks]
-            
-            # Generate embeddings
-            embeddings = self.get_gemini_embeddings(texts)
+            if embeddings is None:
+                # Extract text content for embedding
+                texts = [chunk.content for chunk in chunks]
+                
+                # Generate embeddings
+                embeddings = self.get_gemini_embeddings(texts)
+            
+            # A zero vector has no direction, so it could never be retrieved
+            embedded = [
+                (chunk, embedding) for chunk, embedding in zip(chunks, embeddings)
+                if embedding is not None and np.any(embedding)
+            ]
+            skipped = len(chunks) - len(embedded)
+            if skipped:
+                print(f"Skipping {skipped} chunks without embeddings for user {user_id}")
+            if not embedded:
+                return [None] * len(chunks)
             
             # Convert to numpy array and normalize for inner product similarity
-            embeddings_array = np.array(embeddings, dtype=np.float32)
+            embeddings_array = np.array([embedding for _, embedding in embedded], dtype=np.float32)
             faiss.normalize_L2(embeddings_array)
             
-            # Load or create index
-            index = self.load_user_index(user_id)
-            if index is None:
-                index = self.create_faiss_index(user_id, embeddings_array.shape[1])
-            
-            # Load existing metadata
-            existing_metadata = self.load_user_metadata(user_id)
-            
-            # Add new vectors to index
-            index.add(embeddings_array)
-            
-            # Prepare metadata for the new chunks
-            new_metadata = []
-            for i, chunk in enumerate(chunks):
-                metadata = {
-                    'content': chunk.content,
-                    'metadata': chunk.metadata,
-                    'index_id': len(existing_metadata) + i
+            # Only the read-modify-write of the files is serialised; the
+            # embedding requests above run without holding the lock
+            with self.user_write_lock(user_id):
+                current = self._get_user_files(user_id)
+                existing_metadata = self.load_user_metadata(user_id, files=current)
+                
+                # Chunks that are already indexed, e.g. picked up from the
+                # database by a rebuild, keep their row instead of a duplicate
+                index_ids = {
+                    entry['chunk_id']: entry['index_id']
+                    for entry in existing_metadata
+                    if entry.get('chunk_id') is not None
                 }
-                new_metadata.append(metadata)
-            
-            # Combine with existing metadata
-            all_metadata = existing_metadata + new_metadata
-            
-            # Save index and metadata
-            self.save_user_index(user_id, index)
-            self.save_user_metadata(user_id, all_metadata)
+                new_rows = [
+                    row for row, (chunk, _) in enumerate(embedded)
+                    if chunk.chunk_id is None or chunk.chunk_id not in index_ids
+                ]
+                new_chunks = [embedded[row][0] for row in new_rows]
+                embeddings_array = embeddings_array[new_rows]
+                
+                if new_chunks:
+                    # Load or create index; the index may hold truncated vectors for
+                    # the coarse search stage while the side store keeps them in full
+                    index = self.load_user_index(user_id, writable=True, files=current)
+                    if index is None:
+                        index_vectors = self._truncate_vectors(embeddings_array, settings.FAISS_SEARCH_DIMENSION)
+                        index = self.create_faiss_index(
+                            user_id, index_vectors.shape[1], training_vectors=index_vectors
+                        )
+                    else:
+                        index_vectors = self._truncate_vectors(embeddings_array, index.d)
+                    
+                    # Add new vectors to index
+                    index.add(index_vectors)
+                    index = self._retrain_fallback_index(user_id, index)
+                    
+                    # Prepare metadata for the new chunks
+                    new_metadata = []
+                    for i, chunk in enumerate(new_chunks):
+                        metadata = {
+                            'content': chunk.content,
+                            'metadata': chunk.metadata,
+                            'index_id': len(existing_metadata) + i,
+                            'chunk_id': chunk.chunk_id
+                        }
+                        new_metadata.append(metadata)
+                    
+                    # Write the whole new version, then publish it at once
+                    version_dir = self._create_version_dir(user_id)
+                    files = self._get_version_files(version_dir)
+                    faiss.write_index(index, str(files.index))
+                    self._write_metadata(files.metadata, existing_metadata + new_metadata)
+                    if self._uses_side_store():
+                        vectors = embeddings_array.astype(np.float16)
+                        if current.vectors.exists():
+                            vectors = np.concatenate([np.load(current.vectors), vectors])
+                        np.save(files.vectors, vectors)
+                    self._publish_version(user_id, version_dir)
+                    
+                    print(f"Added {len(new_chunks)} chunks to index for user {user_id}")
             
-            print(f"Added {len(chunks)} chunks to index for user {user_id}")
+            new_ids = {id(chunk): len(existing_metadata) + i for i, chunk in enumerate(new_chunks)}
+            return [
+                new_ids.get(id(chunk), index_ids.get(chunk.chunk_id) if chunk.chunk_id is not None else None)
+                for chunk in chunks
+            ]
             
         except Exception as e:
             print(f"Error adding documents to index for user {user_id}: {e}")
             raise
 
 
+    def _search_index(self, user_id: int, files: UserFiles, index: faiss.Index, query_vectors: np.ndarray, k: int):
+        """
+        Search a user's index with one or more normalized full-size query vectors.
+        When the index holds truncated or quantized vectors and the side store
+        is available, the index only produces a shortlist which is then
+        re-scored exactly with the full vectors. Returns (scores, indices)
+        shaped like faiss search results.
+        """
+        k = min(k, index.ntotal)
+        coarse_queries = self._truncate_vectors(query_vectors, index.d)
+        
+        vectors = self.load_user_vectors(user_id, files=files) if self._uses_side_store() else None
+        if vectors is None or len(vectors) != index.ntotal or vectors.shape[1] != query_vectors.shape[1]:
+            return index.search(coarse_queries, k)
+        
+        # Over-fetch a shortlist from the compact index, then re-score exactly
+        num_candidates = min(k * settings.FAISS_RERANK_FACTOR, index.ntotal)
+        _, candidate_ids = index.search(coarse_queries, num_candidates)
+        
+        scores = np.full((len(query_vectors), k), -np.inf, dtype=np.float32)
+        indices = np.full((len(query_vectors), k), -1, dtype=np.int64)
+        for row, (query_vector, ids) in enumerate(zip(query_vectors, candidate_ids)):
+            ids = ids[ids >= 0]
+            exact_scores = vectors[ids].astype(np.float32) @ query_vector
+            order = np.argsort(-exact_scores)[:k]
+            scores[row, :len(order)] = exact_scores[order]
+            indices[row, :len(order)] = ids[order]
+        
+        return scores, indices
+
+
+    def _rank_results(self, scores: np.ndarray, indices: np.ndarray, metadata: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Turn one row of search results into context results, keeping those
+        above the similarity threshold or, failing that, the top candidates.
+        """
+        filtered_results = []
+        ranked_candidates = []
+        for i, (score, idx) in enumerate(zip(scores, indices)):
+            if idx >= 0 and idx < len(metadata):  # Valid index
+                result = {
+                    'content': metadata[idx]['content'],
+                    'metadata': metadata[idx]['metadata'],
+                    'similarity_score': float(score),
+                    'rank': i + 1
+                }
+                ranked_candidates.append(result)
+                
+                # Filter by similarity threshold
+                if score >= settings.SIMILARITY_THRESHOLD:
+                    filtered_results.append(result)
+        
+        if filtered_results:
+            return filtered_results
+        
+        # If nothing met the threshold, fall back to the top candidates
+        min_results = max(getattr(settings, 'MIN_CONTEXT_RESULTS', 1), 1)
+        return ranked_candidates[:min_results]
+
+
     def search_similar_documents(self, query: str, user_id: int, k: int = 3) -> List[Dict[str, Any]]:
         """
         Search for similar documents using FAISS.
         """
         try:
-            # Load user's index and metadata
-            index = self.load_user_index(user_id)
-            metadata = self.load_user_metadata(user_id)
+            # Load user's index and metadata, both from the current version
+            files = self._get_user_files(user_id)
+            index = self.load_user_index(user_id, files=files)
+            metadata = self.load_user_metadata(user_id, files=files)
             
             if index is None or not metadata:
                 return []
             
             # Generate query embedding
             query_embedding = self.get_query_embedding(query)
+            if not np.any(query_embedding):
+                return []
             query_vector = np.array([query_embedding], dtype=np.float32)
             faiss.normalize_L2(query_vector)
             
             # Search for similar vectors
-            scores, indices = index.search(query_vector, min(k, index.ntotal))
-            
-            # Prepare results
-            filtered_results = []
-            ranked_candidates = []
-            for i, (score, idx) in enumerate(zip(scores[0], indices[0])):
-                if idx >= 0 and idx < len(metadata):  # Valid index
-                    result = {
-                        'content': metadata[idx]['content'],
-                        'metadata': metadata[idx]['metadata'],
-                        'similarity_score': float(score),
-                        'rank': i + 1
-                    }
-                    ranked_candidates.append(result)
-                    
-                    # Filter by similarity threshold
-                    if score >= settings.SIMILARITY_THRESHOLD:
-                        filtered_results.append(result)
+            scores, indices = self._search_index(user_id, files, index, query_vector, k)
             
-            if filtered_results:
-                return filtered_results
-            
-            # If nothing met the threshold, fall back to the top candidates
-            min_results = max(getattr(settings, 'MIN_CONTEXT_RESULTS', 1), 1)
-            return ranked_candidates[:min_results]
+            return self._rank_results(scores[0], indices[0], metadata)
             
         except Exception as e:
             print(f"Error searching documents for user {user_id}: {e}")
             return []
 
 
-    def delete_user_data(self, user_id: int):
+    def search_similar_documents_batch(self, queries: List[str], user_id: int, k: int = 3) -> List[List[Dict[str, Any]]]:
         """
-        Delete all vector data for a user.
+        Search for several queries at once: one index load, one embedding
+        request and a single multi-row FAISS search.
         """
         try:
-            index_path = self._get_index_path(user_id)
-            metadata_path = self._get_metadata_path(user_id)
+            if not queries:
+                return []
             
-            if index_path.exists():
-                index_path.unlink()
+            query_embeddings = self.get_query_embeddings(queries)
+            return self.search_by_embeddings(query_embeddings, user_id, [k] * len(queries))
             
-            if metadata_path.exists():
-                metadata_path.unlink()
-                
+        except Exception as e:
+            print(f"Error batch searching documents for user {user_id}: {e}")
+            return [[] for _ in queries]
+
+
+    def search_by_embeddings(
+        self, query_embeddings: List[List[float]], user_id: int, ks: List[int]
+    ) -> List[List[Dict[str, Any]]]:
+        """
+        Search a user's index with already embedded queries in a single
+        multi-row FAISS search, returning the top ks[i] results for query i.
+        Queries with a zero embedding (failed embedding) get no results.
+        """
+        files = self._get_user_files(user_id)
+        index = self.load_user_index(user_id, files=files)
+        metadata = self.load_user_metadata(user_id, files=files)
+        
+        if index is None or not metadata or not query_embeddings:
+            return [[] for _ in query_embeddings]
+        
+        query_vectors = np.array(query_embeddings, dtype=np.float32)
+        valid_rows = np.flatnonzero(np.any(query_vectors, axis=1))
+        results: List[List[Dict[str, Any]]] = [[] for _ in query_embeddings]
+        if not len(valid_rows):
+            return results
+        
+        query_vectors = query_vectors[valid_rows]
+        faiss.normalize_L2(query_vectors)
+        
+        scores, indices = self._search_index(user_id, files, index, query_vectors, max(ks))
+        
+        for row, row_scores, row_indices in zip(valid_rows, scores, indices):
+            k = ks[row]
+            results[row] = self._rank_results(row_scores[:k], row_indices[:k], metadata)
+        
+        return results
+
+
+    def swap_in_user_data(self, user_id: int, staging: "VectorService"):
+        """
+        Replace a user's vector data with the data built by another
+        VectorService (e.g. a rebuild staging directory). The staged files
+        are moved into a new version directory, which is published by
+        swapping the user's version pointer, so readers see either the
+        complete old data or the complete new data. Hold user_write_lock
+        while deciding the staged data is final, so no write lands in the
+        old version after that.
+        """
+        try:
+            with self.user_write_lock(user_id):
+                staged_files = staging._get_user_files(user_id)
+                if not staged_files.index.exists():
+                    raise FileNotFoundError(f"No staged index for user {user_id} in {staging.faiss_dir}")
+
+                version_dir = self._create_version_dir(user_id)
+                files = self._get_version_files(version_dir)
+                for source, destination in zip(staged_files, files):
+                    if source.exists():
+                        os.replace(source, destination)
+                self._publish_version(user_id, version_dir)
+            staging.delete_user_data(user_id)
+
+            print(f"Swapped in rebuilt vector data for user {user_id}")
+
+        except Exception as e:
+            print(f"Error swapping vector data for user {user_id}: {e}")
+            raise
+
+
+    def link_user_data(
+        self,
+        user_id: int,
+        source: "VectorService",
+        source_user_id: int,
+        metadata: List[Dict[str, Any]],
+    ):
+        """
+        Give a user the index and side store of another VectorService (e.g.
+        the shared demo corpus) without copying them, together with the
+        user's own metadata for them. The files are hard-linked into a new
+        version, falling back to a copy across filesystems. Later writes
+        always create new files, so the user's uploads never modify the
+        shared copy.
+        """
+        try:
+            with self.user_write_lock(user_id):
+                source_files = source._get_user_files(source_user_id)
+                version_dir = self._create_version_dir(user_id)
+                files = self._get_version_files(version_dir)
+
+                for source_path, destination in [
+                    (source_files.index, files.index),
+                    (source_files.vectors, files.vectors),
+                ]:
+                    if not source_path.exists():
+                        continue
+                    try:
+                        os.link(source_path, destination)
+                    except OSError:
+                        shutil.copyfile(source_path, destination)
+                self._write_metadata(files.metadata, metadata)
+                self._publish_version(user_id, version_dir)
+
+            print(f"Linked vector data of {source.faiss_dir} into user {user_id}")
+
+        except Exception as e:
+            print(f"Error linking vector data for user {user_id}: {e}")
+            raise
+
+
+    def delete_user_data(self, user_id: int):
+        """
+        Delete all vector data for a user.
+        """
+        try:
+            with self.user_write_lock(user_id):
+                # Readers stop seeing the data as soon as the pointer is gone
+                pointer_path = self._get_pointer_path(user_id)
+                if pointer_path.exists():
+                    pointer_path.unlink()
+                shutil.rmtree(self._get_user_dir(user_id), ignore_errors=True)
+
+                for path in self._get_legacy_files(user_id):
+                    if path.exists():
+                        path.unlink()
+
             print(f"Deleted vector data for user {user_id}")
-            
+
         except Exception as e:
             print(f"Error deleting vector data for user {user_id}: {e}")
@@ -1,11 +1,13 @@
 from pathlib import Path
 from typing import List, Optional
-from uuid import uuid4
 
-from fastapi import UploadFile
+from fastapi import HTTPException, UploadFile, status
 from sqlalchemy.orm import Session
 
-from app.models.models import VoiceNote
+from app.core.config import settings
+from app.models.models import Person, VoiceNote
+from app.services.person_service import person_lock
+from app.services.upload_service import save_upload
 
 
 def _ensure_directory(upload_root: Path) -> Path:
@@ -15,19 +17,13 @@ def _ensure_directory(upload_root: Path) -> Path:
 
 
 def _save_audio_file(upload_dir: Path, file: UploadFile) -> str:
-    # Get file extension or default to .webm
-    suffix = Path(file.filename or "").suffix or ".webm"
-    filename = f"{uuid4().hex}{suffix}"
-    destination = upload_dir / filename
-    
-    with destination.open("wb") as buffer:
-        buffer.write(file.file.read())
-    
-    # Reset file pointer
-    file.file.seek(0)
-    
+    # Streamed to disk in chunks; recordings without an extension are saved as .webm
+    saved = save_upload(
+        file, upload_dir, default_suffix=".webm", max_bytes=settings.MAX_AUDIO_UPLOAD_BYTES
+    )
+
     # Return relative path
-    return f"voice_notes/{filename}"
+    return f"voice_notes/{saved.path.name}"
 
 
 def create_voice_note(
@@ -41,7 +37,19 @@ def create_voice_note(
     upload_root: Path,
     db: Session,
 ) -> VoiceNote:
-    """Create a new voice note"""
+    """
+    Create a new voice note. person_id is either the id of one of the
+    user's persons or, as the My People page sends, a person's name. A
+    numeric id must exist; it is checked under person_lock so the person
+    cannot be removed with its last face before the note is saved.
+    """
+    is_person_id = person_id is not None and person_id.strip().isdigit()
+    if is_person_id:
+        person = _find_person(person_id, user_id, db)
+        if person is None:
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Person not found")
+        person_id = str(person.id)
+
     upload_dir = _ensure_directory(upload_root)
     relative_path = _save_audio_file(upload_dir, audio_file)
 
@@ -54,12 +62,24 @@ def create_voice_note(
         reminder_id=reminder_id,
     )
     
-    db.add(voice_note)
-    db.commit()
+    with person_lock(user_id):
+        if is_person_id and not _find_person(person_id, user_id, db, for_update=True):
+            (upload_root / relative_path).unlink(missing_ok=True)
+            raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Person not found")
+        db.add(voice_note)
+        db.commit()
     db.refresh(voice_note)
     return voice_note
 
 
+def _find_person(person_id: str, user_id: int, db: Session, for_update: bool = False) -> Optional[Person]:
+    # Voice notes store the person id as text
+    query = db.query(Person).filter(Person.id == int(person_id), Person.user_id == user_id)
+    if for_update:
+        query = query.with_for_update()
+    return query.first()
+
+
 def get_voice_note(
     *,
     voice_note_id: int,
@@ -0,0 +1,71 @@
+"""
+Reduced-Dimension Search Benchmark
+
+Compares two-stage search (coarse search on truncated Matryoshka vectors,
+exact rerank with full vectors) against exact full-dimension search on the
+demo corpus. For each FAISS_SEARCH_DIMENSION it reports the coarse index
+size, the shortlist recall and the recall after reranking.
+
+Run from the backend directory:
+    python -m benchmarks.dimension_benchmark
+Shares the embedding cache with the quantization benchmark.
+"""
+
+import argparse
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+from app.services.vector_service import VectorService
+from benchmarks.quantization_benchmark import load_demo_embeddings, recall_at_k
+
+
+def run_benchmark(k: int, dimensions):
+    vector_service = VectorService()
+    documents, queries = load_demo_embeddings(vector_service)
+    k = min(k, len(documents))
+    full_dimension = documents.shape[1]
+    side_store = documents.astype(np.float16)
+
+    exact = faiss.IndexFlatIP(full_dimension)
+    exact.add(documents)
+    _, expected = exact.search(queries, k)
+
+    print(f"Demo corpus: {len(documents)} chunks, {full_dimension} dims, {len(queries)} queries\n")
+    print(f"{'dims':<6}{'index':>12}{'flops':>8}{f'recall@{k}':>12}{'reranked':>10}")
+
+    for dimension in dimensions:
+        if dimension > full_dimension:
+            continue
+
+        coarse_documents = vector_service._truncate_vectors(documents, dimension)
+        coarse_queries = vector_service._truncate_vectors(queries, dimension)
+        index = faiss.IndexFlatIP(dimension)
+        index.add(coarse_documents)
+
+        _, found = index.search(coarse_queries, k)
+        num_candidates = min(k * settings.FAISS_RERANK_FACTOR, index.ntotal)
+        _, candidate_ids = index.search(coarse_queries, num_candidates)
+        reranked = np.array([
+            ids[np.argsort(-(side_store[ids].astype(np.float32) @ query))[:k]]
+            for query, ids in zip(queries, candidate_ids)
+        ])
+
+        print(
+            f"{dimension:<6}{faiss.serialize_index(index).nbytes:>12,}"
+            f"{dimension / full_dimension:>7.0%} "
+            f"{recall_at_k(found, expected):>11.3f}"
+            f"{recall_at_k(reranked, expected):>10.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-k", type=int, default=3, help="number of neighbours to compare")
+    parser.add_argument(
+        "--dims", type=int, nargs="+", default=[64, 128, 256, 384, 768],
+        help="coarse search dimensions to try",
+    )
+    args = parser.parse_args()
+    run_benchmark(args.k, args.dims)
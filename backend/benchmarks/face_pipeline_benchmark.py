@@ -0,0 +1,89 @@
+"""
+Face Pipeline Benchmark
+
+Compares the resolution-aware face pipeline (detect on a downsampled copy,
+encode from a crop) against detecting and encoding on the full-resolution
+image, over a directory of sample photos. For each detection size it
+reports the time per photo, the speedup, the faces found and how far each
+face's encoding moved from its full-resolution encoding, next to the 0.6
+match tolerance.
+
+Run from the backend directory:
+    python -m benchmarks.face_pipeline_benchmark path/to/photos
+"""
+
+import argparse
+import time
+from pathlib import Path
+
+import face_recognition  # type: ignore[import-untyped]
+import numpy as np
+
+from app.core.config import settings
+from app.services import face_pipeline, image_service
+
+PHOTO_SUFFIXES = {".jpg", ".jpeg", ".png"}
+
+# Default tolerance of find_matching_memories
+MATCH_TOLERANCE = 0.6
+
+
+def full_resolution_faces(image_bytes: bytes):
+    """The previous pipeline: every stage runs on the full image."""
+    image = np.asarray(image_service.load_image(image_bytes))
+    locations = face_recognition.face_locations(image, model=settings.FACE_DETECTION_MODEL)
+    return face_recognition.face_encodings(image, known_face_locations=locations)
+
+
+def run_benchmark(photo_dir: Path, dimensions):
+    photos = [
+        path.read_bytes()
+        for path in sorted(photo_dir.iterdir())
+        if path.suffix.lower() in PHOTO_SUFFIXES
+    ]
+    if not photos:
+        raise SystemExit(f"No photos found in {photo_dir}")
+
+    started = time.perf_counter()
+    baseline = [full_resolution_faces(photo) for photo in photos]
+    baseline_seconds = (time.perf_counter() - started) / len(photos)
+    baseline_faces = sum(len(encodings) for encodings in baseline)
+    print(f"{len(photos)} photos, full resolution: {baseline_seconds * 1000:.0f} ms/photo, {baseline_faces} faces")
+    print()
+
+    print(f"{'max dim':>8} {'ms/photo':>9} {'speedup':>8} {'faces':>6} {'matched':>8} {'mean dist':>10} {'max dist':>9}")
+    for dimension in dimensions:
+        settings.FACE_DETECTION_MAX_DIMENSION = dimension
+
+        started = time.perf_counter()
+        results = [face_pipeline.process_image(photo) for photo in photos]
+        seconds = (time.perf_counter() - started) / len(photos)
+
+        # Pair every full-resolution face with the closest face found by the pipeline
+        distances = []
+        for expected, found in zip(baseline, results):
+            if not expected or not found:
+                continue
+            found_matrix = np.array([encoding for _, encoding in found])
+            for encoding in expected:
+                distances.append(float(np.linalg.norm(found_matrix - encoding, axis=1).min()))
+
+        faces = sum(len(found) for found in results)
+        matched = sum(1 for distance in distances if distance <= MATCH_TOLERANCE)
+        mean_distance = np.mean(distances) if distances else float("nan")
+        max_distance = max(distances) if distances else float("nan")
+        print(
+            f"{dimension:>8} {seconds * 1000:>9.0f} {baseline_seconds / seconds:>7.1f}x {faces:>6} "
+            f"{matched:>4}/{len(distances):<3} {mean_distance:>10.3f} {max_distance:>9.3f}"
+        )
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("photos", type=Path, help="directory of sample photos")
+    parser.add_argument(
+        "--dims", type=int, nargs="+", default=[640, 1024, 1600],
+        help="detection image sizes to try (longest side, in pixels)",
+    )
+    args = parser.parse_args()
+    run_benchmark(args.photos, args.dims)
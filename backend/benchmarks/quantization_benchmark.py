@@ -0,0 +1,153 @@
+"""
+Quantized Vector Storage Benchmark
+
+Builds the demo corpus from rag-docs/ once, then compares every
+FAISS_QUANTIZATION mode against exact float32 search. For each mode it
+reports the serialized index size and recall@k, with and without exact
+re-scoring from the float16 side store.
+
+The demo corpus is far smaller than the SQ8_MIN_TRAINING_VECTORS and
+PQ_MIN_TRAINING_VECTORS the quantizers need, so they are trained on the
+corpus padded with noisy copies of its vectors. Only the corpus is indexed.
+
+Run from the backend directory:
+    python -m benchmarks.quantization_benchmark
+Embeddings are cached next to this script so repeated runs make no API calls.
+"""
+
+import argparse
+from pathlib import Path
+
+import faiss
+import numpy as np
+
+from app.core.config import settings
+from app.services.document_service import process_pdf
+from app.services.vector_service import (
+    PQ_MIN_TRAINING_VECTORS,
+    SQ8_MIN_TRAINING_VECTORS,
+    VectorService,
+)
+
+BACKEND_ROOT = Path(__file__).resolve().parent.parent
+DEMO_DOCS_PATH = BACKEND_ROOT / "rag-docs"
+CACHE_PATH = Path(__file__).resolve().parent / "demo_embeddings.npz"
+
+# Spread of the noise added to padding vectors, relative to a unit vector
+TRAINING_NOISE = 0.05
+
+# Training vectors each mode needs before it stops falling back to fp16
+MIN_TRAINING_VECTORS = {"sq8": SQ8_MIN_TRAINING_VECTORS, "pq": PQ_MIN_TRAINING_VECTORS}
+
+DEMO_QUESTIONS = [
+    "What is my name?",
+    "Who are my children?",
+    "What medication do I take?",
+    "Where do I live?",
+    "Who is my doctor?",
+    "What did I do for work?",
+    "When is my birthday?",
+    "What is my wife's name?",
+    "What are my hobbies?",
+    "What happened at the hospital?",
+]
+
+
+def load_demo_embeddings(vector_service: VectorService):
+    """Embed the demo corpus and questions, reusing the on-disk cache when present."""
+    if CACHE_PATH.exists():
+        cached = np.load(CACHE_PATH)
+        return cached["documents"], cached["queries"]
+
+    texts = []
+    for pdf_file in sorted(DEMO_DOCS_PATH.glob("*.pdf")):
+        chunks = process_pdf(str(pdf_file), pdf_file.name, user_id=0)
+        texts.extend(chunk.content for chunk in chunks)
+
+    embeddings = vector_service.get_gemini_embeddings(texts)
+    if any(embedding is None for embedding in embeddings):
+        raise RuntimeError("Some demo chunks could not be embedded, please try again")
+    documents = np.array(embeddings, dtype=np.float32)
+    queries = np.array(
+        [vector_service.get_query_embedding(q) for q in DEMO_QUESTIONS], dtype=np.float32
+    )
+    faiss.normalize_L2(documents)
+    faiss.normalize_L2(queries)
+
+    np.savez(CACHE_PATH, documents=documents, queries=queries)
+    return documents, queries
+
+
+def pad_training_vectors(documents: np.ndarray, count: int, seed: int = 0) -> np.ndarray:
+    """Repeat the corpus with Gaussian noise until there are count normalized vectors."""
+    if len(documents) >= count:
+        return documents
+    rng = np.random.default_rng(seed)
+    copies = documents[rng.integers(0, len(documents), count - len(documents))]
+    noisy = copies + rng.normal(0, TRAINING_NOISE / np.sqrt(documents.shape[1]), copies.shape)
+    padded = np.vstack([documents, noisy]).astype(np.float32)
+    faiss.normalize_L2(padded)
+    return padded
+
+
+def is_fp16_fallback(index) -> bool:
+    return isinstance(index, faiss.IndexScalarQuantizer) and index.sq.qtype == faiss.ScalarQuantizer.QT_fp16
+
+
+def recall_at_k(found: np.ndarray, expected: np.ndarray) -> float:
+    """Average fraction of the exact top-k that the approximate search returned."""
+    hits = [len(set(f) & set(e)) / len(e) for f, e in zip(found, expected)]
+    return float(np.mean(hits))
+
+
+def rerank(index, vectors: np.ndarray, queries: np.ndarray, k: int) -> np.ndarray:
+    """Over-fetch from the quantized index and re-score exactly, as search does."""
+    num_candidates = min(k * settings.FAISS_RERANK_FACTOR, index.ntotal)
+    _, candidate_ids = index.search(queries, num_candidates)
+    results = []
+    for query, ids in zip(queries, candidate_ids):
+        scores = vectors[ids].astype(np.float32) @ query
+        results.append(ids[np.argsort(-scores)[:k]])
+    return np.array(results)
+
+
+def run_benchmark(k: int):
+    vector_service = VectorService()
+    documents, queries = load_demo_embeddings(vector_service)
+    k = min(k, len(documents))
+    side_store = documents.astype(np.float16)
+
+    exact = faiss.IndexFlatIP(documents.shape[1])
+    exact.add(documents)
+    _, expected = exact.search(queries, k)
+    baseline_bytes = faiss.serialize_index(exact).nbytes
+
+    print(f"Demo corpus: {len(documents)} chunks, {documents.shape[1]} dims, {len(queries)} queries\n")
+    print(f"{'mode':<8}{'index':>12}{'saved':>8}{f'recall@{k}':>12}{'reranked':>10}")
+
+    for mode in ["none", "fp16", "sq8", "pq"]:
+        settings.FAISS_QUANTIZATION = mode
+        training_vectors = pad_training_vectors(documents, MIN_TRAINING_VECTORS.get(mode, 0))
+        index = vector_service.create_faiss_index(0, documents.shape[1], training_vectors=training_vectors)
+        if mode in MIN_TRAINING_VECTORS and is_fp16_fallback(index):
+            # e.g. FAISS_PQ_SUBQUANTIZERS does not divide the dimension
+            print(f"{mode:<8}not built, the index fell back to fp16")
+            continue
+        index.add(documents)
+
+        _, found = index.search(queries, k)
+        index_bytes = faiss.serialize_index(index).nbytes
+        print(
+            f"{mode:<8}{index_bytes:>12,}{baseline_bytes / index_bytes:>7.1f}x"
+            f"{recall_at_k(found, expected):>12.3f}"
+            f"{recall_at_k(rerank(index, side_store, queries, k), expected):>10.3f}"
+        )
+
+    print(f"\nfloat16 side store: {side_store.nbytes:,} bytes on disk (memory-mapped, not cached)")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("-k", type=int, default=3, help="number of neighbours to compare")
+    args = parser.parse_args()
+    run_benchmark(args.k)
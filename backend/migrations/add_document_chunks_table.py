@@ -0,0 +1,104 @@
+"""
+Migration Script to Add the document_chunks Table
+
+This script:
+1. Adds the chunk_count column and a user_id index to the documents table
+2. Creates the document_chunks table
+3. Backfills chunk_count and chunk rows from the legacy content and
+   document_metadata columns of existing documents
+
+Works for both SQLite and PostgreSQL. Safe to run more than once.
+"""
+
+from sqlalchemy import text, inspect
+from sqlalchemy.orm import undefer
+
+from app.db.database import engine, SessionLocal
+from app.models.models import Document, DocumentChunkRecord
+
+
+def column_exists(table_name: str, column_name: str) -> bool:
+    """Check if a column exists in a table"""
+    inspector = inspect(engine)
+    columns = [col['name'] for col in inspector.get_columns(table_name)]
+    return column_name in columns
+
+
+def backfill_chunks():
+    """Split legacy documents into chunk rows and fill chunk_count"""
+    db = SessionLocal()
+    try:
+        documents = (
+            db.query(Document)
+            .options(undefer(Document.content), undefer(Document.document_metadata))
+            .filter(~Document.chunks.any())
+            .all()
+        )
+        for document in documents:
+            metadata = document.document_metadata if isinstance(document.document_metadata, dict) else {}
+            chunk_metadata = metadata.get("chunk_metadata") or []
+            total_chunks = metadata.get("total_chunks", len(chunk_metadata))
+
+            # Legacy content is the chunks joined with blank lines
+            contents = (document.content or "").split("\n\n")
+            document.chunk_count = total_chunks
+            if len(contents) != total_chunks:
+                print(f"[SKIP] Document {document.id} ({document.filename}): "
+                      f"cannot split content into {total_chunks} chunks, re-upload to restore them")
+                continue
+
+            for ordinal, content in enumerate(contents):
+                db.add(DocumentChunkRecord(
+                    document_id=document.id,
+                    user_id=document.user_id,
+                    ordinal=ordinal,
+                    content=content,
+                    chunk_metadata=chunk_metadata[ordinal] if ordinal < len(chunk_metadata) else {},
+                    embedding_status="indexed",
+                ))
+            print(f"[OK] Backfilled {total_chunks} chunks for document {document.id}")
+
+        db.commit()
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] Error backfilling chunks: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def run_migration():
+    """Run database migration for the document_chunks table"""
+    with engine.connect() as conn:
+        if column_exists('documents', 'chunk_count'):
+            print("[OK] chunk_count column already exists in documents table")
+        else:
+            try:
+                conn.execute(text("""
+                    ALTER TABLE documents
+                    ADD COLUMN chunk_count INTEGER;
+                """))
+                conn.commit()
+                print("[OK] Added chunk_count column to documents table")
+            except Exception as e:
+                print(f"[ERROR] Error adding chunk_count column: {e}")
+                conn.rollback()
+                raise
+
+        # Listing a user's documents should be an index scan
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_documents_user_id ON documents (user_id);
+        """))
+        conn.commit()
+        print("[OK] documents.user_id index is present")
+
+    DocumentChunkRecord.__table__.create(bind=engine, checkfirst=True)
+    print("[OK] document_chunks table is present")
+
+    backfill_chunks()
+
+    print("\n[SUCCESS] Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    run_migration()
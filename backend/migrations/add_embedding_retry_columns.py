@@ -0,0 +1,72 @@
+"""
+Migration Script to Add Embedding Retry Columns to document_chunks
+
+This script adds the embedding_attempts and next_embedding_attempt_at
+columns used by the embedding retry queue, and queues chunks that were
+stored but never indexed for a retry.
+"""
+
+from sqlalchemy import text, inspect
+from app.db.database import engine
+
+def column_exists(table_name: str, column_name: str) -> bool:
+    """Check if a column exists in a table"""
+    inspector = inspect(engine)
+    try:
+        columns = [col['name'] for col in inspector.get_columns(table_name)]
+        return column_name in columns
+    except Exception:
+        return False
+
+def run_migration():
+    """Run database migration to add embedding retry columns"""
+    with engine.connect() as conn:
+        # Add embedding_attempts column if it doesn't exist
+        if not column_exists('document_chunks', 'embedding_attempts'):
+            try:
+                conn.execute(text("""
+                    ALTER TABLE document_chunks
+                    ADD COLUMN embedding_attempts INTEGER DEFAULT 0 NOT NULL;
+                """))
+                conn.commit()
+                print("[OK] Added embedding_attempts column to document_chunks table")
+            except Exception as e:
+                print(f"[ERROR] Error adding embedding_attempts column: {e}")
+                conn.rollback()
+                raise
+        else:
+            print("[OK] embedding_attempts column already exists")
+
+        # Add next_embedding_attempt_at column if it doesn't exist
+        if not column_exists('document_chunks', 'next_embedding_attempt_at'):
+            try:
+                conn.execute(text("""
+                    ALTER TABLE document_chunks
+                    ADD COLUMN next_embedding_attempt_at TIMESTAMP WITH TIME ZONE;
+                """))
+                conn.execute(text("""
+                    CREATE INDEX IF NOT EXISTS ix_document_chunks_next_embedding_attempt_at
+                    ON document_chunks (next_embedding_attempt_at);
+                """))
+                conn.commit()
+                print("[OK] Added next_embedding_attempt_at column to document_chunks table")
+            except Exception as e:
+                print(f"[ERROR] Error adding next_embedding_attempt_at column: {e}")
+                conn.rollback()
+                raise
+        else:
+            print("[OK] next_embedding_attempt_at column already exists")
+
+        # Chunks left pending by earlier failures are retried right away
+        conn.execute(text("""
+            UPDATE document_chunks
+            SET next_embedding_attempt_at = CURRENT_TIMESTAMP
+            WHERE embedding_status = 'pending' AND next_embedding_attempt_at IS NULL;
+        """))
+        conn.commit()
+        print("[OK] Queued pending chunks for embedding retry")
+
+        print("\n[SUCCESS] Migration completed successfully!")
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,69 @@
+"""
+Migration Script to Add the face_encodings Table
+
+This script:
+1. Creates the face_encodings table (one row per detected face)
+2. Moves the legacy float64 memory_photos.face_encoding values into it as
+   float32 rows, then clears the legacy column
+3. Removes the face indexes built over photo ids, so they are rebuilt over
+   face ids on first use
+
+Faces moved from the legacy column have no bounding box; re-upload a photo
+to store every face in it. Works for both SQLite and PostgreSQL. Safe to
+run more than once.
+"""
+
+import shutil
+from pathlib import Path
+
+import numpy as np
+from sqlalchemy.orm import undefer
+
+from app.core.config import settings
+from app.db.database import engine, SessionLocal
+from app.models.models import FaceEncoding, MemoryPhoto
+from app.services.face_index_service import FACE_INDEX_SUBDIR
+
+
+def backfill_faces():
+    """Copy legacy first-face encodings into face_encodings rows"""
+    db = SessionLocal()
+    try:
+        photos = (
+            db.query(MemoryPhoto)
+            .options(undefer(MemoryPhoto.face_encoding))
+            .filter(MemoryPhoto.face_encoding.isnot(None), ~MemoryPhoto.faces.any())
+            .all()
+        )
+        for photo in photos:
+            encoding = np.frombuffer(photo.face_encoding, dtype=np.float64).astype(np.float32)
+            db.add(FaceEncoding(photo_id=photo.id, user_id=photo.user_id, encoding=encoding.tobytes()))
+            photo.face_encoding = None
+
+        db.commit()
+        print(f"[OK] Moved {len(photos)} legacy face encodings into face_encodings")
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] Error moving face encodings: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def run_migration():
+    """Run database migration for the face_encodings table"""
+    FaceEncoding.__table__.create(bind=engine, checkfirst=True)
+    print("[OK] face_encodings table is present")
+
+    backfill_faces()
+
+    face_index_dir = Path(settings.FAISS_INDEX_PATH) / FACE_INDEX_SUBDIR
+    if face_index_dir.exists():
+        shutil.rmtree(face_index_dir)
+        print("[OK] Removed face indexes keyed by photo id")
+
+    print("\n[SUCCESS] Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,82 @@
+"""
+Migration Script to Add Person Clusters
+
+This script:
+1. Creates the persons table
+2. Adds the person_id column to the face_encodings table
+3. Clusters every user's existing faces into persons, oldest first
+
+Works for both SQLite and PostgreSQL. Safe to run more than once; faces
+that already belong to a person are left where they are.
+"""
+
+from sqlalchemy import text, inspect
+
+from app.db.database import engine, SessionLocal
+from app.models.models import FaceEncoding, Person
+from app.services import person_service
+
+
+def column_exists(table_name: str, column_name: str) -> bool:
+    """Check if a column exists in a table"""
+    inspector = inspect(engine)
+    try:
+        columns = [col['name'] for col in inspector.get_columns(table_name)]
+        return column_name in columns
+    except Exception:
+        return False
+
+
+def cluster_existing_faces():
+    """Assign every face recorded before persons existed to a person"""
+    db = SessionLocal()
+    try:
+        user_ids = [
+            row.user_id
+            for row in db.query(FaceEncoding.user_id)
+            .filter(FaceEncoding.person_id.is_(None))
+            .distinct()
+        ]
+        for user_id in user_ids:
+            assigned = person_service.cluster_unassigned_faces(user_id, db)
+            persons = db.query(Person).filter(Person.user_id == user_id).count()
+            print(f"[OK] User {user_id}: clustered {assigned} faces into {persons} persons")
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] Error clustering faces: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def run_migration():
+    """Run database migration to add person clusters"""
+    Person.__table__.create(bind=engine, checkfirst=True)
+    print("[OK] persons table is present")
+
+    with engine.connect() as conn:
+        if column_exists('face_encodings', 'person_id'):
+            print("[OK] person_id column already exists in face_encodings table")
+        else:
+            try:
+                conn.execute(text("ALTER TABLE face_encodings ADD COLUMN person_id INTEGER REFERENCES persons(id);"))
+                conn.commit()
+                print("[OK] Added person_id column to face_encodings table")
+            except Exception as e:
+                print(f"[ERROR] Error adding person_id column: {e}")
+                conn.rollback()
+                raise
+
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_face_encodings_person_id ON face_encodings (person_id);
+        """))
+        conn.commit()
+        print("[OK] face_encodings.person_id index is present")
+
+    cluster_existing_faces()
+
+    print("\n[SUCCESS] Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    run_migration()
@@ -0,0 +1,99 @@
+"""
+Migration Script to Add Upload Hash Columns
+
+This script:
+1. Adds the content_hash and file_size columns to the memory_photos table
+2. Adds the duplicate_files column to the photo_import_jobs table
+3. Backfills content_hash and file_size from the stored photo files, so
+   bulk imports skip photos that are already in a library
+
+Works for both SQLite and PostgreSQL. Safe to run more than once.
+"""
+
+import hashlib
+from pathlib import Path
+
+from sqlalchemy import text, inspect
+
+from app.db.database import engine, SessionLocal
+from app.models.models import MemoryPhoto
+from app.services.upload_service import UPLOAD_CHUNK_SIZE
+
+UPLOAD_ROOT = Path(__file__).resolve().parent.parent / "uploads"
+
+
+def column_exists(table_name: str, column_name: str) -> bool:
+    """Check if a column exists in a table"""
+    inspector = inspect(engine)
+    try:
+        columns = [col['name'] for col in inspector.get_columns(table_name)]
+        return column_name in columns
+    except Exception:
+        return False
+
+
+def add_column(conn, table_name: str, column_name: str, definition: str):
+    if column_exists(table_name, column_name):
+        print(f"[OK] {column_name} column already exists in {table_name} table")
+        return
+    try:
+        conn.execute(text(f"ALTER TABLE {table_name} ADD COLUMN {column_name} {definition};"))
+        conn.commit()
+        print(f"[OK] Added {column_name} column to {table_name} table")
+    except Exception as e:
+        print(f"[ERROR] Error adding {column_name} column: {e}")
+        conn.rollback()
+        raise
+
+
+def backfill_hashes():
+    """Hash the stored files of photos uploaded before hashes were recorded"""
+    db = SessionLocal()
+    try:
+        photos = db.query(MemoryPhoto).filter(MemoryPhoto.content_hash.is_(None)).all()
+        hashed = 0
+        for photo in photos:
+            file_path = UPLOAD_ROOT / photo.image_path
+            if not file_path.exists():
+                print(f"[SKIP] Photo {photo.id}: {photo.image_path} is missing")
+                continue
+            digest = hashlib.sha256()
+            with file_path.open("rb") as f:
+                while chunk := f.read(UPLOAD_CHUNK_SIZE):
+                    digest.update(chunk)
+            photo.content_hash = digest.hexdigest()
+            photo.file_size = file_path.stat().st_size
+            hashed += 1
+
+        db.commit()
+        print(f"[OK] Backfilled hashes for {hashed} photos")
+    except Exception as e:
+        db.rollback()
+        print(f"[ERROR] Error backfilling photo hashes: {e}")
+        raise
+    finally:
+        db.close()
+
+
+def run_migration():
+    """Run database migration to add upload hash columns"""
+    with engine.connect() as conn:
+        add_column(conn, 'memory_photos', 'content_hash', 'VARCHAR(64)')
+        add_column(conn, 'memory_photos', 'file_size', 'INTEGER')
+        conn.execute(text("""
+            CREATE INDEX IF NOT EXISTS ix_memory_photos_content_hash ON memory_photos (content_hash);
+        """))
+        conn.commit()
+        print("[OK] memory_photos.content_hash index is present")
+
+        # Created by create_all when missing, with the column already in it
+        if inspect(engine).has_table('photo_import_jobs'):
+            add_column(conn, 'photo_import_jobs', 'duplicate_files', 'INTEGER DEFAULT 0 NOT NULL')
+
+    backfill_hashes()
+
+    print("\n[SUCCESS] Migration completed successfully!")
+
+
+if __name__ == "__main__":
+    run_migration()
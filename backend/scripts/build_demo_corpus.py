@@ -0,0 +1,27 @@
+"""
+Build the Shared Demo Knowledge Base
+
+Parses and embeds the rag-docs PDFs once into FAISS_INDEX_PATH/demo, which
+/rag/initialize-demo then clones for each user without any API calls. The
+server also builds it at startup when DEMO_CORPUS_PREBUILD is set; run this
+at deploy time to avoid the first-start delay.
+
+Run from the backend directory:
+    python -m scripts.build_demo_corpus
+    python -m scripts.build_demo_corpus --force
+"""
+
+import argparse
+
+from app.services.demo_service import build_demo_corpus
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--force", action="store_true", help="rebuild even if the corpus is current")
+    args = parser.parse_args()
+
+    corpus = build_demo_corpus(force=args.force)
+    documents = corpus["manifest"]["documents"]
+    print(f"[OK] Demo corpus has {len(documents)} documents and "
+          f"{sum(document['chunk_count'] for document in documents)} chunks")
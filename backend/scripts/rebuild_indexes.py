@@ -0,0 +1,59 @@
+"""
+Rebuild FAISS Indexes from Stored Chunks
+
+Rebuilds one or all users' indexes from the document_chunks table, e.g.
+after index files were lost or EMBEDDING_MODEL changed. Progress is
+checkpointed after every batch; rerun the same command to resume.
+
+Run from the backend directory:
+    python -m scripts.rebuild_indexes --user-id 3
+    python -m scripts.rebuild_indexes --all --workers 8
+"""
+
+import argparse
+
+from app.db.database import SessionLocal
+from app.services.index_rebuild_service import list_users_with_chunks, rebuild_user_index
+from app.services.vector_service import VectorService
+
+
+def run_rebuild(user_ids, batch_size, workers, restart):
+    vector_service = VectorService()
+    db = SessionLocal()
+    try:
+        for user_id in user_ids:
+            result = rebuild_user_index(
+                user_id,
+                db,
+                vector_service=vector_service,
+                batch_size=batch_size,
+                workers=workers,
+                restart=restart,
+            )
+            print(f"[OK] User {user_id}: {result['chunks_indexed']} chunks indexed, "
+                  f"{result['chunks_failed']} queued for retry "
+                  f"(resumed from {result['resumed_from']}, {result['skipped_documents']} documents skipped)")
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    target = parser.add_mutually_exclusive_group(required=True)
+    target.add_argument("--user-id", type=int, action="append", help="user to rebuild (repeatable)")
+    target.add_argument("--all", action="store_true", help="rebuild every user with stored chunks")
+    parser.add_argument("--batch-size", type=int, default=None, help="chunks per embedding request")
+    parser.add_argument("--workers", type=int, default=None, help="parallel embedding requests")
+    parser.add_argument("--restart", action="store_true", help="discard staged progress and start over")
+    args = parser.parse_args()
+
+    if args.all:
+        db = SessionLocal()
+        try:
+            user_ids = list_users_with_chunks(db)
+        finally:
+            db.close()
+    else:
+        user_ids = args.user_id
+
+    run_rebuild(user_ids, args.batch_size, args.workers, args.restart)